@@ -0,0 +1,260 @@
+"""
+Benchmark of the main steps of a fracability analysis. For each case the script measures the elapsed time and the peak
+memory of:
+
+    + ingest: Fractures(shp=...) of each set
+    + clean_network
+    + calculate_topology (without cleaning)
+    + calculate_backbone
+    + vtk_object of the fractures
+    + NetworkData of the fractures
+    + NetworkFitter.fit('lognorm')
+
+The cases are the example datasets (pontrelli, salza) and synthetic networks of a given number of traces (see
+fracability.operations.Synthetic). Each case runs in a new process so that the peak memory (the resident set size
+high-water mark, not available on Windows) of a case does not depend on the previous ones.
+
+A small summary of the results of each step (number of fractures, node counts, backbone length, fitted parameters...)
+is stored together with the measures. When a baseline file is given the results are compared with it and the script
+exits with 1 if a result changed or a step is slower (or uses more memory) than the baseline by more than the
+tolerance.
+
+Usage (from the repository root):
+
+    python development/benchmarks/benchmark.py --sizes 1000 10000 --save-baseline development/benchmarks/baselines.json
+    python development/benchmarks/benchmark.py --sizes 1000 10000 --baseline development/benchmarks/baselines.json
+
+The big synthetic networks (--sizes 100000 1000000) should be run with --tile-size to classify the nodes in parallel
+(the cleaning always runs in a single process).
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.stats as ss
+from geopandas import GeoDataFrame
+from shapely.geometry import Polygon
+
+from fracability import Entities, Statistics
+from fracability.examples import data
+from fracability.operations import Synthetic
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DATASETS = {'pontrelli': (data.Pontrelli, ['Set_a.shp', 'Set_b.shp', 'Set_c.shp']),
+            'salza': (data.Salza, ['Set_1.shp', 'Set_2.shp'])}
+
+SYNTHETIC_P20 = 1  # Number of traces per unit area of the synthetic networks
+SYNTHETIC_SEED = 42
+
+
+def peak_memory() -> float:
+    """Peak resident set size of the process in MB (None if not available)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024**2 if sys.platform == 'darwin' else peak/1024
+
+
+def synthetic_sets(n_traces: int) -> list:
+    """Two sets of traces, the second one is clustered"""
+    return [{'n': n_traces//2, 'length': ss.lognorm(s=0.6, scale=1.5), 'azimuth': 30, 'kappa': 20},
+            {'n': n_traces - n_traces//2, 'length': ss.lognorm(s=0.4, scale=1), 'azimuth': 120, 'kappa': 10,
+             'n_clusters': max(n_traces//100, 1), 'cluster_radius': 3}]
+
+
+def write_synthetic(n_traces: int, out_dir: str) -> tuple:
+    """
+    Write the shapefiles of a synthetic network of n_traces in a square boundary (the area grows with the number of
+    traces so that the density is always SYNTHETIC_P20).
+
+    :return: Tuple with the list of paths of the sets and the path of the boundary
+    """
+    side = np.sqrt(n_traces/SYNTHETIC_P20)
+    boundary_df = GeoDataFrame({'b_group': [1]}, geometry=[Polygon([(0, 0), (side, 0), (side, side), (0, side)])])
+    boundary_path = os.path.join(out_dir, 'boundary.shp')
+    boundary_df.to_file(boundary_path)
+
+    rng = np.random.default_rng(SYNTHETIC_SEED)
+    polygon = Synthetic.boundary_polygon(Entities.Boundary(shp=boundary_path, group_n=1))
+    fractures_df = Synthetic.synthetic_fractures(polygon, synthetic_sets(n_traces), rng)
+
+    set_paths = []
+    for set_n, set_df in fractures_df.groupby('f_set'):
+        set_path = os.path.join(out_dir, f'set_{set_n}.shp')
+        set_df.drop(columns='f_set').to_file(set_path)
+        set_paths.append(set_path)
+
+    return set_paths, boundary_path
+
+
+def run_case(case: str, tile_size: float = None, n_jobs: int = None) -> dict:
+    """
+    Run all the steps of a case.
+
+    :param case: Name of a dataset or synthetic_<n_traces>
+    :param tile_size: Tile size passed to calculate_topology
+    :param n_jobs: Number of worker processes passed to calculate_topology
+    :return: Dict of step: {time, peak_memory, result}
+    """
+    steps = {}
+
+    def measure(step, function, summary):
+        start = time.perf_counter()
+        output = function()
+        elapsed = time.perf_counter() - start
+        steps[step] = {'time': elapsed, 'peak_memory': peak_memory(), 'result': summary(output)}
+        return output
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        if case in DATASETS:
+            dataset, set_names = DATASETS[case]
+            data_dict = dataset().data_dict
+            set_paths = [data_dict[name] for name in set_names]
+            boundary_path = data_dict['Interpretation_boundary.shp']
+        else:
+            set_paths, boundary_path = write_synthetic(int(case.split('_')[1]), out_dir)
+
+        fracture_sets = measure('ingest',
+                                lambda: [Entities.Fractures(shp=path, set_n=set_n)
+                                         for set_n, path in enumerate(set_paths, start=1)],
+                                lambda sets: {'n_fractures': int(sum(len(s.entity_df) for s in sets)),
+                                              'length': float(sum(s.entity_df['length'].sum() for s in sets))})
+        boundary = Entities.Boundary(shp=boundary_path, group_n=1)
+
+    fracture_net = Entities.FractureNetwork()
+    for fractures in fracture_sets:
+        fracture_net.add_fractures(fractures)
+    fracture_net.add_boundaries(boundary)
+
+    measure('clean_network',
+            lambda: fracture_net.clean_network(),
+            lambda _: {'n_fractures': int(len(fracture_net.fractures.entity_df)),
+                       'length': float(fracture_net.fractures.entity_df.geometry.length.sum())})
+
+    measure('calculate_topology',
+            lambda: fracture_net.calculate_topology(clean_network=False, tile_size=tile_size, n_jobs=n_jobs),
+            lambda _: {str(n_type): int(count) for n_type, count in
+                       fracture_net.nodes.entity_df['n_type'].value_counts().sort_index().items()})
+
+    measure('calculate_backbone',
+            lambda: fracture_net.calculate_backbone(),
+            lambda _: {'n_fractures': int(len(fracture_net.backbone[-1].entity_df)),
+                       'length': float(fracture_net.backbone[-1].entity_df.geometry.length.sum())})
+
+    fractures = fracture_net.fractures
+    fractures.invalidate_vtk_cache()
+    measure('vtk_object',
+            lambda: fractures.vtk_object,
+            lambda vtk_object: {'n_points': int(vtk_object.n_points), 'n_cells': int(vtk_object.n_cells)})
+
+    measure('network_data',
+            lambda: Statistics.NetworkData(fractures),
+            lambda network_data: {'n_fractures': int(len(network_data.lengths)),
+                                  'n_censored': int(len(network_data.censored_lengths)),
+                                  'mean': float(network_data.mean)})
+
+    fitter = Statistics.NetworkFitter(fractures)
+    measure('fit',
+            lambda: fitter.fit('lognorm'),
+            lambda _: {'parameters': [float(p) for p in fitter.get_fitted_parameters('lognorm')]})
+
+    return steps
+
+
+def compare(results: dict, baselines: dict, tolerance: float, min_time: float = 0.1) -> list:
+    """
+    Compare the results with the baselines.
+
+    :param results: Dict of case: step: {time, peak_memory, result}
+    :param baselines: Dict with the same structure of the results
+    :param tolerance: Relative increase of time and peak memory accepted
+    :param min_time: Increase of time in seconds always accepted (to ignore the noise of the fast steps)
+    :return: List of strings describing the regressions
+    """
+    regressions = []
+    for case, steps in results.items():
+        if case not in baselines:
+            continue
+        for step, measures in steps.items():
+            baseline = baselines[case].get(step)
+            if baseline is None:
+                continue
+            if not _same_result(measures['result'], baseline['result']):
+                regressions.append(f'{case}/{step}: result {measures["result"]} != {baseline["result"]}')
+            if measures['time'] - baseline['time'] > max(baseline['time']*tolerance, min_time):
+                regressions.append(f'{case}/{step}: time {measures["time"]:.3f} s > {baseline["time"]:.3f} s')
+            if (measures['peak_memory'] is not None and baseline['peak_memory'] is not None and
+                    measures['peak_memory'] > baseline['peak_memory']*(1+tolerance)):
+                regressions.append(f'{case}/{step}: peak memory {measures["peak_memory"]:.1f} MB > '
+                                   f'{baseline["peak_memory"]:.1f} MB')
+    return regressions
+
+
+def _same_result(result, baseline) -> bool:
+    if isinstance(result, dict):
+        return result.keys() == baseline.keys() and all(_same_result(result[k], baseline[k]) for k in result)
+    if isinstance(result, list):
+        return len(result) == len(baseline) and all(_same_result(r, b) for r, b in zip(result, baseline))
+    if isinstance(result, float):
+        return bool(np.isclose(result, baseline, rtol=1e-4))
+    return result == baseline
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark of the main steps of a fracability analysis')
+    parser.add_argument('--datasets', nargs='*', default=list(DATASETS), choices=list(DATASETS),
+                        help='Example datasets to benchmark. Default is all')
+    parser.add_argument('--sizes', nargs='*', type=int, default=[1000, 10000],
+                        help='Number of traces of the synthetic networks (e.g. 1000 10000 100000 1000000). '
+                             'Default is 1000 10000')
+    parser.add_argument('--tile-size', type=float, default=None,
+                        help='Tile size used to classify the nodes in parallel')
+    parser.add_argument('--n-jobs', type=int, default=None, help='Number of worker processes used with tiles')
+    parser.add_argument('--baseline', default=None, help='JSON file of the baselines to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Relative increase of time and peak memory accepted. Default is 0.5')
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='Increase of time in seconds always accepted. Default is 0.1')
+    parser.add_argument('--save-baseline', default=None, help='Save the results in this JSON file')
+    args = parser.parse_args(argv)
+
+    cases = args.datasets + [f'synthetic_{size}' for size in args.sizes]
+
+    results = {}
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results[case] = executor.submit(run_case, case, args.tile_size, args.n_jobs).result()
+        for step, measures in results[case].items():
+            peak = measures['peak_memory']
+            peak = f'{peak:10.1f} MB' if peak is not None else ''
+            print(f'{case:20s}{step:20s}{measures["time"]:10.3f} s{peak}')
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+        regressions = compare(results, baselines, args.tolerance, args.min_time)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            return 1
+        print('No regressions found')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
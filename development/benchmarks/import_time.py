@@ -0,0 +1,65 @@
+"""
+Import time check of fracability. The core modules are imported in new processes and the script exits with 1 if the
+best import time is over the budget or if one of the plotting/reporting dependencies (imported only when a plot or a
+report is requested) is loaded by the import. The same check, with the default budget, runs in the test suite
+(fracability/tests/test_import_time.py).
+
+Usage (from the repository root):
+
+    python development/benchmarks/import_time.py --budget 3
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+IMPORT = 'import fracability.Entities, fracability.Statistics'
+LAZY_MODULES = ['fracability.Plotters', 'seaborn', 'ternary', 'pyperclip']
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+{IMPORT}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def import_time(repeat: int = 5) -> tuple:
+    """
+    Measure the import time of the core modules in new processes.
+
+    :param repeat: Number of measures
+    :return: Tuple with the best import time in seconds and the list of lazy modules loaded by the import
+    """
+    measures = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, check=True).stdout
+        measures.append(json.loads(output.strip().splitlines()[-1]))
+
+    return min(m['time'] for m in measures), sorted(set(sum((m['loaded'] for m in measures), [])))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Import time check of fracability')
+    parser.add_argument('--budget', type=float, default=3.0, help='Import time budget in seconds. Default is 3')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of measures. Default is 5')
+    args = parser.parse_args(argv)
+
+    elapsed, loaded = import_time(args.repeat)
+    print(f'{IMPORT}: {elapsed:.3f} s (budget {args.budget:.3f} s)')
+
+    failed = False
+    if elapsed > args.budget:
+        print('Import time over budget')
+        failed = True
+    if loaded:
+        print(f'Modules that should be imported lazily: {loaded}')
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,7 @@ from abc import ABC, abstractmethod, abstractproperty
 from fracability.examples.data import QgisStyle
 
 
-from geopandas import GeoDataFrame
+from geopandas import GeoDataFrame, GeoSeries
 from geopandas import read_file
 from pyvista import PolyData
 from networkx import Graph
@@ -24,6 +24,11 @@ class BaseEntity(ABC):
     4. Fracture Networks
     """
 
+    _tolerance: float = 1e-5
+    _vtk_cache: PolyData = None
+    _vtk_cache_hits: int = 0
+    _vtk_cache_misses: int = 0
+
     def __init__(self, gdf: GeoDataFrame = None, csv: str = None, shp: str = None):
         """
         Init the entity. If a geopandas dataframe is specified then it is
@@ -83,6 +88,7 @@ class BaseEntity(ABC):
     @entity_df.setter
     def entity_df(self, gpd: GeoDataFrame = None):
         self._df = gpd
+        self.invalidate_vtk_cache()
 
     @property
     @abstractmethod
@@ -97,17 +103,52 @@ class BaseEntity(ABC):
 
         Notes
         -------
-        When the get method is applied the PolyData is build **on the fly** using the entity_df as a source.
+        When the get method is applied the PolyData is build using the entity_df as a source. The PolyData is
+        cached and rebuilt only when the geometry changes (entity_df setter, crs setter, center_object).
 
         When set the DataSet is **cast to a PolyData**.
         """
         pass
 
+    def _cached_vtk_object(self, vtk_rep) -> PolyData:
+        """
+        Return the cached vtk representation of the entity, building it with the given adapter function if it is
+        missing. A shallow copy is returned so that arrays added by the caller do not end up in the cache.
+
+        :param vtk_rep: Adapter function used to build the PolyData from the entity_df
+        :return: Pyvista PolyData object
+        """
+        if self._vtk_cache is None:
+            self._vtk_cache_misses += 1
+            self._vtk_cache = vtk_rep(self.entity_df, tolerance=self.tolerance)
+        else:
+            self._vtk_cache_hits += 1
+
+        return self._vtk_cache.copy(deep=False)
+
+    def invalidate_vtk_cache(self):
+        """
+        Discard the cached vtk representation of the entity. This must be called when the geometries of the
+        entity_df are modified in place.
+        """
+        self._vtk_cache = None
+
+    @property
+    def vtk_cache_info(self) -> dict:
+        """
+        Property used to return the statistics of the vtk object cache
+
+        :return: Dictionary with the number of hits and misses and if the vtk object is currently cached
+        """
+        return {'hits': self._vtk_cache_hits, 'misses': self._vtk_cache_misses,
+                'cached': self._vtk_cache is not None}
+
     @property
     @abstractmethod
-    def network_object(self) -> Graph:
+    def network_object(self, as_csgraph: bool = False) -> Graph:
         """
-        Each entity can be represented with a networkx graph.
+        Each entity can be represented with a networkx graph or, with as_csgraph=True, with a scipy sparse graph
+        (CSR adjacency matrix and edge attributes, see Adapters.csgraph_rep).
         This returns the network object using the vtk object (and so the df).
 
         :getter: Returns a networkx Graph object
@@ -150,6 +191,22 @@ class BaseEntity(ABC):
         :return: Name of the coordinate system as a string
         """
         self.entity_df.crs = crs
+        self.invalidate_vtk_cache()
+
+    @property
+    def tolerance(self) -> float:
+        """
+        Property used to return or set the tolerance (in map units) used to weld close points in the vtk
+        representation and in the topology of the entity. Default is 1e-5
+
+        :return: Tolerance value
+        """
+        return self._tolerance
+
+    @tolerance.setter
+    def tolerance(self, tolerance: float):
+        self._tolerance = tolerance
+        self.invalidate_vtk_cache()
 
     @property
     def centroid(self) -> np.ndarray:
@@ -209,6 +266,7 @@ class BaseEntity(ABC):
         if inplace:
 
             self.entity_df = df
+            self.invalidate_vtk_cache()
 
             if return_center:
                 return trans_center
@@ -293,7 +351,7 @@ class BaseEntity(ABC):
             if not os.path.isdir(style_out):
                 os.makedirs(style_out)
 
-            if self.name == 'Fractures' or self.name == 'Backbone':
+            if self.name == 'Fractures' or self.name == 'Backbone' or self.name == 'Branches':
                 set_n = list(set(self.entity_df['f_set']))
                 for f_set in set_n:
                     final_path = os.path.join(output_path, f'{self.name}_{f_set}.shp')
@@ -322,11 +380,10 @@ class BaseEntity(ABC):
         """
         Utility used to clean geometries with double points
         """
-        tot_geom = len(self.entity_df.geometry)
-        print('\n\n')
-        for line, geom in enumerate(self.entity_df.geometry):
-            print(f'Removing possible double points on geometries: {line}/{tot_geom}',end='\r')
-            self.entity_df.loc[line, 'geometry'] = remove_repeated_points(geom, tolerance=0.000001)
+        self.entity_df['geometry'] = GeoSeries(remove_repeated_points(self.entity_df.geometry.values,
+                                                                      tolerance=0.000001),
+                                               index=self.entity_df.index, crs=self.entity_df.crs)
+        self.invalidate_vtk_cache()
 
 
 class BaseOperator(ABC):
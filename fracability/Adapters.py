@@ -1,7 +1,7 @@
 """
 
 Collection of methods used to pass from a geopandas dataframe to a polydata or from
-polydata to networkx. Each method is fit so that it plots nodes, fractures, boundary or the fracture network
+polydata to networkx (or to a scipy sparse graph). Each method is fit so that it plots nodes, fractures, boundary or the fracture network
 
 TODO:
     + Add a adapter abstract class in the AbstractClasses.
@@ -14,6 +14,7 @@ import geopandas
 import networkx
 import numpy as np
 from pyvista import PolyData, lines_from_points, MultiBlock
+from scipy.sparse import csr_matrix
 from shapely.geometry import MultiLineString
 
 from vtkmodules.vtkFiltersCore import vtkAppendPolyData
@@ -22,13 +23,16 @@ import networkx as nx
 from vtkmodules.vtkFiltersGeometry import vtkGeometryFilter
 
 from fracability.operations.Geometry import connect_dots
-from fracability.utils.general_use import shp2vtk
+from fracability.utils import profiling
+from fracability.utils.general_use import shp2vtk, lines_connectivity
 
 
 #  =============== VTK representations ===============
 
-def node_vtk_rep(input_df: geopandas.GeoDataFrame) -> PolyData:
-    points_vtk = shp2vtk(input_df)
+@profiling.profiled('Adapters.node_vtk_rep')
+def node_vtk_rep(input_df: geopandas.GeoDataFrame, tolerance: float = 1e-5) -> PolyData:
+    profiling.add_items(len(input_df))
+    points_vtk = shp2vtk(input_df, tolerance=tolerance)
     # points = np.array([point.coords for point in input_df.geometry]).reshape(-1, 3)
     # types = input_df['type'].values
     # node_types = input_df['n_type'].values
@@ -40,9 +44,11 @@ def node_vtk_rep(input_df: geopandas.GeoDataFrame) -> PolyData:
     return points_vtk
 
 
-def frac_vtk_rep(input_df: geopandas.GeoDataFrame) -> PolyData:
+@profiling.profiled('Adapters.frac_vtk_rep')
+def frac_vtk_rep(input_df: geopandas.GeoDataFrame, tolerance: float = 1e-5) -> PolyData:
 
-    conn_obj = shp2vtk(input_df)
+    profiling.add_items(len(input_df))
+    conn_obj = shp2vtk(input_df, tolerance=tolerance)
     # appender = vtkAppendPolyData()
     #
     # for index, geom, set_n in zip(input_df.index, input_df['geometry'],
@@ -79,9 +85,11 @@ def frac_vtk_rep(input_df: geopandas.GeoDataFrame) -> PolyData:
     return conn_obj
 
 
-def bound_vtk_rep(input_df: geopandas.GeoDataFrame) -> PolyData:
+@profiling.profiled('Adapters.bound_vtk_rep')
+def bound_vtk_rep(input_df: geopandas.GeoDataFrame, tolerance: float = 1e-5) -> PolyData:
 
-    conn_obj = shp2vtk(input_df)
+    profiling.add_items(len(input_df))
+    conn_obj = shp2vtk(input_df, tolerance=tolerance)
     # appender = vtkAppendPolyData()
     #
     # for index, geom, b_group in zip(input_df.index,
@@ -118,8 +126,11 @@ def bound_vtk_rep(input_df: geopandas.GeoDataFrame) -> PolyData:
     return conn_obj
 
 
-def fracture_network_vtk_rep(input_df: geopandas.GeoDataFrame, include_nodes=True) -> PolyData:
+@profiling.profiled('Adapters.fracture_network_vtk_rep')
+def fracture_network_vtk_rep(input_df: geopandas.GeoDataFrame, include_nodes=True,
+                             tolerance: float = 1e-5) -> PolyData:
 
+    profiling.add_items(len(input_df))
     fractures_df = input_df.loc[input_df['type'] == 'fracture']
     boundaries_df = input_df.loc[input_df['type'] == 'boundary']
 
@@ -128,14 +139,14 @@ def fracture_network_vtk_rep(input_df: geopandas.GeoDataFrame, include_nodes=Tru
     if include_nodes:
         nodes_df = input_df.loc[input_df['type'] == 'node']
         if not nodes_df.empty:
-            nodes_vtk = node_vtk_rep(nodes_df)
+            nodes_vtk = node_vtk_rep(nodes_df, tolerance=tolerance)
             appender.AddInputData(nodes_vtk)
 
     if not fractures_df.empty:
-        fractures_vtk = frac_vtk_rep(fractures_df)
+        fractures_vtk = frac_vtk_rep(fractures_df, tolerance=tolerance)
         appender.AddInputData(fractures_vtk)
     if not boundaries_df.empty:
-        boundaries_vtk = bound_vtk_rep(boundaries_df)
+        boundaries_vtk = bound_vtk_rep(boundaries_df, tolerance=tolerance)
         appender.AddInputData(boundaries_vtk)
 
     appender.Update()
@@ -145,7 +156,7 @@ def fracture_network_vtk_rep(input_df: geopandas.GeoDataFrame, include_nodes=Tru
     geometry_filter.Update()
 
     output_obj = PolyData(geometry_filter.GetOutput())
-    conn_obj = connect_dots(output_obj)
+    conn_obj = connect_dots(output_obj, tolerance=tolerance)
 
     return conn_obj
 
@@ -153,18 +164,78 @@ def fracture_network_vtk_rep(input_df: geopandas.GeoDataFrame, include_nodes=Tru
 #  =============== Networkx representations ===============
 
 
-def networkx_rep(input_object: PolyData) -> networkx.Graph():
+def line_segments(input_object: PolyData) -> tuple:
+    """
+    Get the segments of the lines of a PolyData. Lines with more than two points (polylines) are split in their
+    consecutive segments.
+
+    :param input_object: input PolyData
+    :return: Tuple of numpy arrays with the start point ids, the end point ids and the cell id of each segment
+    """
+    offsets, connectivity = lines_connectivity(input_object)
+
+    if len(connectivity) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, empty
+
+    cell_index = np.repeat(np.arange(len(offsets)-1), np.diff(offsets))
+    same_cell = cell_index[1:] == cell_index[:-1]
+
+    start = connectivity[:-1][same_cell]
+    end = connectivity[1:][same_cell]
+    cell_ids = cell_index[:-1][same_cell] + input_object.n_verts  # Lines come after the vertices in the cell order
 
-    network = input_object
-    lines = network.lines  # Get the connectivity list of the object
+    return start, end, cell_ids
 
-    lines = np.delete(lines,
-                      np.arange(0, lines.size, 3)).reshape(-1, 2)  # remove padding eg. [2 id1 id2 2 id3 id4 ...] -> remove the 2
+
+@profiling.profiled('Adapters.networkx_rep')
+def networkx_rep(input_object: PolyData) -> networkx.Graph():
+
+    start, end, _ = line_segments(input_object)  # Get the segments of the lines of the object
+    profiling.add_items(len(start))
 
     network = nx.Graph()  # Create a networkx graph instance
 
-    network.add_edges_from(lines)  # Add the edges
+    network.add_edges_from(np.column_stack((start, end)))  # Add the edges
 
     output_obj = network
     return output_obj
 
+
+#  =============== Sparse graph representations ===============
+
+
+@profiling.profiled('Adapters.csgraph_rep')
+def csgraph_rep(input_object: PolyData) -> tuple:
+    """
+    Build the sparse (scipy.sparse.csgraph compatible) graph of the lines of a PolyData. The nodes of the graph are
+    the points of the PolyData and each segment of the lines is an undirected edge, stored in both directions.
+
+    :param input_object: input PolyData
+    :return: Tuple with the CSR adjacency matrix (the data is the length of the segments) and a dictionary of edge
+             attributes. The attribute arrays are parallel to the data array of the matrix: length of the segment,
+             cell_id of the line and, if present in the cell data, og_line_id, f_set and b_group of the line.
+    """
+    n_points = input_object.n_points
+    start, end, cell_ids = line_segments(input_object)
+    profiling.add_items(len(start))
+
+    points = input_object.points
+    lengths = np.linalg.norm(points[end] - points[start], axis=1)
+
+    rows = np.concatenate((start, end))
+    columns = np.concatenate((end, start))
+    edges = np.tile(np.arange(len(start)), 2)
+
+    order = np.lexsort((columns, rows))
+    rows, columns, edges = rows[order], columns[order], edges[order]
+    indptr = np.searchsorted(rows, np.arange(n_points+1))
+
+    adjacency = csr_matrix((lengths[edges], columns, indptr), shape=(n_points, n_points))
+
+    attributes = {'length': lengths[edges], 'cell_id': cell_ids[edges]}
+    for array in ['og_line_id', 'f_set', 'b_group']:
+        if array in input_object.cell_data.keys():
+            attributes[array] = np.asarray(input_object.cell_data[array])[cell_ids[edges]]
+
+    return adjacency, attributes
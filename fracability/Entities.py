@@ -5,22 +5,27 @@ entity.
 
 todo make somehow nodes and fractures connected so that for example when only a set is displayed only the nodes of the corresponding set are considered
 """
+import os
 import os.path
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from geopandas import GeoDataFrame, GeoSeries, read_file
 import pandas as pd
 from pandas import DataFrame
+import shapely
+from shapely import points, STRtree
+from scipy.spatial import cKDTree
 from shapely.geometry import MultiLineString, Polygon, LineString, Point, MultiPoint
 from pyvista import PolyData, DataSet, wrap
 from networkx import Graph
-from vtkmodules.vtkFiltersCore import vtkConnectivityFilter
-
-import fracability.Plotters as plts
 
+# fracability.Plotters (matplotlib, seaborn, ternary) is imported only in the plot methods
 import fracability.Adapters as Rep
 from fracability.AbstractClasses import BaseEntity
-from fracability.operations import Geometry, Topology
+from fracability.Statistics import NetworkData
+from fracability.operations import Geometry, Topology, Clusters
+from fracability.utils import profiling
 
 
 class Nodes(BaseEntity):
@@ -74,19 +79,21 @@ class Nodes(BaseEntity):
         if 'n_type' not in columns:
             self._df['n_type'] = self.node_type
 
+        self.invalidate_vtk_cache()
+
     @property
     def vtk_object(self) -> PolyData:
-
-        df = self.entity_df
-        vtk_obj = Rep.node_vtk_rep(df)
-        return vtk_obj
+        return self._cached_vtk_object(Rep.node_vtk_rep)
 
     @vtk_object.setter
     def vtk_object(self, obj: DataSet):
         for index, point in enumerate(obj.points):
             self.entity_df.loc[self.entity_df['id'] == index, 'geometry'] = Point(point)
+        self.invalidate_vtk_cache()
 
-    def network_object(self) -> Graph:
+    def network_object(self, as_csgraph: bool = False) -> Graph:
+        if as_csgraph:
+            return Rep.csgraph_rep(self.vtk_object)
         network_obj = Rep.networkx_rep(self.vtk_object)
         return network_obj
 
@@ -192,6 +199,16 @@ class Nodes(BaseEntity):
         """
         return self.entity_df.loc[self.entity_df['n_type'] == node_type, 'n_origin']
 
+    def node_origin_sets(self, node_type: int) -> np.ndarray:
+        """
+        Return the node origin for the given node type as an integer array with shape (n, 2). The columns are the
+        first and second set of the node origin (-9999 if missing), e.g. [abutting set, abutted set] for Y nodes.
+        :param node_type:
+        :return:
+        """
+        nodes_df = self.entity_df.loc[self.entity_df['n_type'] == node_type]
+        return np.column_stack((nodes_df['n_origin1'].values, nodes_df['n_origin2'].values)).astype(int)
+
     def mat_plot(self, markersize=7, return_plot=False, show_plot=True):
         """
         Plot Nodes object with matplot
@@ -200,6 +217,7 @@ class Nodes(BaseEntity):
         :param show_plot:
         :return:
         """
+        import fracability.Plotters as plts
         plts.matplot_nodes(self, markersize, return_plot, show_plot)
 
     def vtk_plot(self, markersize=7, return_plot=False, show_plot=True, notebook=True):
@@ -211,9 +229,11 @@ class Nodes(BaseEntity):
         :return:
         """
 
+        import fracability.Plotters as plts
         plts.vtkplot_nodes(self, markersize, return_plot, show_plot, notebook=notebook)
 
     def ternary_plot(self):
+        import fracability.Plotters as plts
         plts.matplot_ternary(self)
 
 
@@ -277,12 +297,7 @@ class Fractures(BaseEntity):
             + If no length column is present, it will be created (with length rounded to the 4th decimal point)
             + If no censoring column is present, it will be created setting all values to 0
         """
-        multiline_list = []
-        for index, geom in zip(gdf.index, gdf['geometry']):  # For each geometry in the df
-
-            if isinstance(geom, MultiLineString):
-                multiline_list.append(index)
-                continue
+        multiline_list = gdf.index[(gdf.geom_type == 'MultiLineString').values].tolist()
         if len(multiline_list) > 0:
             print(f'Multilines found, removing from database. If necessary correct them: {np.array(multiline_list)+1}')
 
@@ -306,11 +321,11 @@ class Fractures(BaseEntity):
             self.remove_double_points()
             self.check_geometries()
 
+        self.invalidate_vtk_cache()
+
     @property
     def vtk_object(self) -> PolyData:
-        df = self.entity_df
-        vtk_obj = Rep.frac_vtk_rep(df)
-        return vtk_obj
+        return self._cached_vtk_object(Rep.frac_vtk_rep)
 
     @vtk_object.setter
     def vtk_object(self, obj: DataSet):
@@ -322,6 +337,7 @@ class Fractures(BaseEntity):
             for region_id in set(obj['RegionId']):
                 region = obj.extract_points(obj['RegionId'] == region_id)
                 self.entity_df.loc[self.entity_df['id'] == region, 'geometry'] = LineString(region.points)
+            self.invalidate_vtk_cache()
         else:
             idx = list(set(obj['RegionId']))
             geometry = []
@@ -334,38 +350,44 @@ class Fractures(BaseEntity):
             gdf = GeoDataFrame(d)
             self.entity_df = gdf
 
-    def network_object(self) -> Graph:
+    def network_object(self, as_csgraph: bool = False) -> Graph:
+        if as_csgraph:
+            return Rep.csgraph_rep(self.vtk_object)
         network_obj = Rep.networkx_rep(self.vtk_object)
         return network_obj
 
-    def check_geometries(self, remove_dup=True, save_shp=False):
+    def check_geometries(self, remove_dup=True, save_shp=None) -> GeoDataFrame:
         """
         Method used to check if the geometries are correct i.e.:
+        + No empty geometries
+        + No multilines
         + No repeating points
         + No overlaps
 
-        By default, the method will return a list of geometries that need to be fixed. Additionally, a shp file can be
-        saved with only the geometries that need to be corrected.
+        By default, the method will return a report of the geometries that need to be fixed. Additionally, a shp file
+        can be saved with only the geometries that need to be corrected.
 
         :param remove_dup: Automatically remove duplicate points. By default, True
-        :param save_shp: Save in the same folder of the input shp with only the geometries that need to be corrected.
-                         This is a useful support file to be imported in gis to quickly find the problematic geometries.
-                         False by default. todo to be implemented
-        """
-
-        overlaps_list = []
-        tot_geom = len(self.entity_df.geometry)
-        print('\n\n')
-        for line, geom in enumerate(self.entity_df.geometry):
-            print(f'Checking geometries: {line}/{tot_geom}',end='\r')
-            if geom is None:
-                print(f"\n\nWarning, empty geometry at line {line+1}, fix in GIS\n\n")
-            overlaps = self.entity_df.overlaps(geom)
-            if overlaps.any():
-                overlaps_list.append(self.entity_df.loc[line, 'og_line_id'])
+        :param save_shp: Path of the folder where the frac_corr.shp file with only the geometries that need to be
+                         corrected is saved. This is a useful support file to be imported in gis to quickly find the
+                         problematic geometries. None by default.
+        :return: Report GeoDataFrame (see Geometry.validate_geometries)
+        """
+
+        report = Geometry.validate_geometries(self.entity_df)
+
+        for line in report.loc[report['problem'] == 'empty', 'og_line_id']:
+            print(f"\n\nWarning, empty geometry at line {line}, fix in GIS\n\n")
+
+        overlaps_list = list(pd.unique(report.loc[report['problem'] == 'overlap', 'og_line_id']))
         if len(overlaps_list) > 0:
             print(f'\n\nDetected overlaps for set {self._set_n}: {overlaps_list}. Check geometries in gis and fix.\n\n')
 
+        if save_shp and not report.empty:
+            report.to_file(os.path.join(save_shp, 'frac_corr.shp'))
+
+        return report
+
     def mat_plot(self,
                  linewidth=1,
                  color='black',
@@ -383,6 +405,7 @@ class Fractures(BaseEntity):
         :return:
         """
 
+        import fracability.Plotters as plts
         plts.matplot_fractures(self,
                                linewidth,
                                color,
@@ -408,6 +431,7 @@ class Fractures(BaseEntity):
         :param display_property:
         :return:
         """
+        import fracability.Plotters as plts
         plts.vtkplot_fractures(self,
                                linewidth=linewidth,
                                color=color,
@@ -521,12 +545,11 @@ class Boundary(BaseEntity):
         if self.check_geometries_flag:
             self.remove_double_points()
 
+        self.invalidate_vtk_cache()
+
     @property
     def vtk_object(self) -> PolyData:
-
-        df = self.entity_df
-        vtk_obj = Rep.bound_vtk_rep(df)
-        return vtk_obj
+        return self._cached_vtk_object(Rep.bound_vtk_rep)
 
     @vtk_object.setter
     def vtk_object(self, obj: DataSet):
@@ -543,6 +566,7 @@ class Boundary(BaseEntity):
                     points = np.append(points, [points[0]], axis=0)
 
                 self.entity_df.loc[self.entity_df['id'] == region, 'geometry'] = LineString(points)
+            self.invalidate_vtk_cache()
         else:
             idx = list(set(obj['RegionId']))
             geometry = []
@@ -557,7 +581,9 @@ class Boundary(BaseEntity):
             gdf = GeoDataFrame(d)
             self.entity_df = gdf
 
-    def network_object(self) -> Graph:
+    def network_object(self, as_csgraph: bool = False) -> Graph:
+        if as_csgraph:
+            return Rep.csgraph_rep(self.vtk_object)
         network_obj = Rep.networkx_rep(self.vtk_object)
         return network_obj
 
@@ -575,6 +601,7 @@ class Boundary(BaseEntity):
         :return:
         """
 
+        import fracability.Plotters as plts
         plts.matplot_boundaries(self,
                                 linewidth,
                                 color,
@@ -597,6 +624,7 @@ class Boundary(BaseEntity):
         :param show_plot:
         :return:
         """
+        import fracability.Plotters as plts
         plts.vtkplot_boundaries(self,
                                 linewidth=linewidth,
                                 color=color,
@@ -615,6 +643,26 @@ class Backbone(Fractures):
         super().__init__(gdf, csv, shp, set_n, check_geometry)
 
 
+class Branches(Fractures):
+    """
+    Base entity for the branches of a fracture network (see FractureNetwork.calculate_branches). It inherits the same
+    properties of Fractures so that branch lengths can be used in the same way of fracture lengths (e.g. in the
+    NetworkFitter). The b_type column stores the type of each branch (I-I, I-C, C-C, I-U, C-U or U-U)
+    """
+    def __init__(self, gdf: GeoDataFrame = None, csv: str = None,
+                 shp: str = None, set_n: int = None,
+                 check_geometry: bool = False):
+        super().__init__(gdf, csv, shp, set_n, check_geometry)
+
+    @property
+    def branch_count(self) -> dict:
+        """
+        Property used to return the number of branches for each branch type
+        :return: Dictionary of branch type: count
+        """
+        return self.entity_df['b_type'].value_counts().to_dict()
+
+
 class FractureNetwork(BaseEntity):
     """
     Fracture network base entity. Fracture networks are defined by one or
@@ -626,8 +674,9 @@ class FractureNetwork(BaseEntity):
 
         + Nodes base entities
 
-    All the data is represented in the entity_df and the different objects
-    are defined by the 'type' column.
+    All the geometries are stored in a single network dataframe and the different objects
+    are defined by the 'type' column. Each fracture set, node type and boundary group is a component of the
+    network. The entity_df of the network is the registry of the components and their active state.
 
     FractureNetwork objects can be created in two ways depending on how
     the dataset is structured.
@@ -642,18 +691,34 @@ class FractureNetwork(BaseEntity):
 
     """
 
-    def __init__(self, gdf: GeoDataFrame = None, csv: str = None):
+    # Registry type, key column and entity class of each geometry type
+    _component_types: dict = {'node': ('nodes', 'n_type', Nodes),
+                              'fracture': ('fractures', 'f_set', Fractures),
+                              'boundary': ('boundary', 'b_group', Boundary)}
+
+    def __init__(self, gdf: GeoDataFrame = None, csv: str = None, tolerance: float = 1e-5):
         """
         Init for fracture network entity. Different inputs can be used. Geopandas dataframe, csv or shapefile.
         The csv needs to be structured in such a way to be compatible with the Nodes entity.
 
         :param gdf: Geopandas dataframe
         :param csv: Path of a csv
+        :param tolerance: Distance (in map units) under which points are considered coincident in the vtk
+                          representations and in the topology. Default is 1e-5
         """
 
-        self.column_names = ['type', 'object', 'n_type', 'f_set', 'b_group', 'active']
+        self._tolerance = tolerance
+        self.column_names = ['type', 'n_type', 'f_set', 'b_group', 'active']
         self._df: DataFrame = DataFrame(columns=self.column_names)
 
+        self._network_df: GeoDataFrame = None
+        self._type_columns: dict = {geometry_type: {} for geometry_type in self._component_types}
+        self._backbones: list = []
+
+        self._active_mask_cache: np.ndarray = None
+        self._views: dict = {}
+        self._spatial_index_cache: STRtree = None
+
         if csv is not None:
             gdf = read_file(csv, GEOM_POSSIBLE_NAMES="geometry", KEEP_GEOM_COLUMNS="NO")
 
@@ -673,100 +738,292 @@ class FractureNetwork(BaseEntity):
     @entity_df.setter
     def entity_df(self, gpd: GeoDataFrame):
 
-        nodes = gpd.loc[gpd['type'] == 'nodes']
+        # Columns that belong only to the other geometry types are not carried over
+        # (e.g. the n_type column for fractures)
+        type_columns = {geometry_type: set(columns) for geometry_type, columns in self._type_columns.items()}
 
-        if not nodes.empty:
+        for geometry_type, (registry_type, key_column, entity_class) in self._component_types.items():
+            is_type = gpd['type'] == geometry_type
 
-            types = set(nodes['node_type'])
+            if not is_type.any():
+                continue
 
-            for node_type in types:
-                nodes = Nodes(gdf=nodes.loc[nodes['n_type'] == node_type], node_type=node_type)
-                if self.is_type_active(node_type):
-                    self.add_nodes(nodes)
+            other_columns = set().union(*[columns for other_type, columns in type_columns.items()
+                                          if other_type != geometry_type])
+            columns = [column for column in gpd.columns
+                       if column in type_columns[geometry_type] or column not in other_columns]
 
-        fractures = gpd.loc[gpd['type'] == 'fracture']
+            entity_df = gpd.loc[is_type, columns]
 
-        if not fractures.empty:
-            sets = set(fractures['f_set'])
+            for key in set(entity_df[key_column]):
+                if self._component_index(registry_type, key_column, key) is None or \
+                        self._is_component_active(registry_type, key_column, key):
+                    component_df = entity_df.loc[entity_df[key_column] == key]
+                    if geometry_type == 'node':
+                        self.add_nodes(Nodes(gdf=component_df, node_type=key))
+                    elif geometry_type == 'fracture':
+                        self.add_fractures(Fractures(gdf=component_df, set_n=key))
+                    else:
+                        self.add_boundaries(Boundary(gdf=component_df, group_n=key))
 
-            for set_n in sets:
-                fracture = Fractures(gdf=fractures.loc[fractures['f_set'] == set_n], set_n=set_n)
-                if self.is_set_active(set_n):
-                    self.add_fractures(fracture)
+    @property
+    def crs(self):
+        if self._network_df is None:
+            return None
+        return self._network_df.crs
 
-        boundaries = gpd.loc[gpd['type'] == 'boundary']
+    @crs.setter
+    def crs(self, crs):
+        if self._network_df is not None:
+            self._network_df = self._network_df.set_crs(crs, allow_override=True)
+        self._invalidate_views()
 
-        if not boundaries.empty:
+    @property
+    def tolerance(self) -> float:
+        """
+        Property used to return or set the tolerance (in map units) used to weld close points in the vtk
+        representation and in the topology of the network. When set, the tolerance is propagated to all the
+        components of the network.
 
-            groups = set(boundaries['b_group'])
+        :return: Tolerance value
+        """
+        return self._tolerance
 
-            for group_n in groups:
-                boundary = Boundary(gdf=boundaries.loc[boundaries['b_group'] == group_n], group_n=group_n)
-                if self.is_group_active(group_n):
-                    self.add_boundaries(boundary)
+    @tolerance.setter
+    def tolerance(self, tolerance: float):
+        self._tolerance = tolerance
+        for backbone in self._backbones:
+            backbone.tolerance = tolerance
+        self._invalidate_views()
 
-    @property
-    def crs(self):
-        return self.fracture_network_to_components_df().crs
+    #  ==================== Network dataframe ====================
 
-    #  ==================== Nodes property ====================
+    def _invalidate_views(self):
+        """
+        Internal method used to discard the active mask and the memoized dataframes of the nodes, fractures and
+        boundaries views. This must be called every time the network dataframe or the active state of the components
+        change.
+        """
+        self._active_mask_cache = None
+        self._views = {}
 
-    @property
-    def nodes(self) -> Nodes:
+    def _component_index(self, registry_type: str, key_column: str, key):
         """
-        Property that returns a Node entity object of all the active nodes.
-        :return: Nodes entity object
+        Internal method that returns the registry index of a component (None if the component is not present)
+        :param registry_type: Type of the component in the registry (nodes, fractures, boundary or backbone)
+        :param key_column: Column of the key of the component (n_type, f_set or b_group)
+        :param key: Key of the component
         """
-        if self._active_nodes_df is not None:
-            return Nodes(self._active_nodes_df)
+        registry = self._df
+        index = registry.index[(registry['type'] == registry_type) & (registry[key_column] == key)]
+
+        if len(index) > 0:
+            return index[0]
         else:
             return None
 
-    @property
-    def _nodes_components(self) -> DataFrame:
+    def _is_component_active(self, registry_type: str, key_column: str, key) -> bool:
+        """
+        Internal method used to return if a component of the network is active
+        """
+        registry = self._df
+        value = registry.loc[(registry['type'] == registry_type) & (registry[key_column] == key), 'active'].values[0]
+
+        return value
+
+    def _activate_components(self, registry_type: str, key_column: str, keys: list = None):
         """
-        Property that returns the nodes components of the Fracture network df.
-        :return: Pandas dataframe slice of the nodes components
+        Internal method used to activate the given components of a type (all if keys is None) and deactivate the
+        others
         """
-        nodes = self.entity_df.loc[self.entity_df['type'] == 'nodes']
-        if not nodes.empty:
-            return nodes
+        is_type = self._df['type'] == registry_type
+
+        if keys is None:
+            self._df.loc[is_type, 'active'] = 1
         else:
-            return None
+            self._df.loc[is_type, 'active'] = 0
+            self._df.loc[is_type & self._df[key_column].isin(list(keys)), 'active'] = 1
 
-    @property
-    def _active_nodes_components(self) -> DataFrame:
+        self._invalidate_views()
+
+    def _add_component(self, geometry_type: str, key, entity_df: GeoDataFrame):
         """
-        Internal property that returns the active nodes components in the of the Fracture network df
-        :return: Pandas dataframe slice of active nodes components
+        Internal method used to add or replace the geometries of a component in the network dataframe.
+
+        :param geometry_type: Type of the geometries (node, fracture or boundary)
+        :param key: Key of the component (n_type, f_set or b_group value)
+        :param entity_df: Dataframe of the component (as processed by the corresponding entity)
         """
-        nodes = self.entity_df.loc[self.entity_df['type'] == 'nodes']
+        registry_type, key_column, _ = self._component_types[geometry_type]
+
+        component = self._component_index(registry_type, key_column, key)
 
-        active_nodes = nodes.loc[nodes['active'] == 1]
+        if component is None:
+            new_df = DataFrame([[registry_type, key, 1]], columns=['type', key_column, 'active'])
+            self._df = pd.concat([self._df, new_df], ignore_index=True)
+            component = self._df.index[-1]
 
-        if not active_nodes.empty:
-            return active_nodes
+        # Keep track of the columns (and dtypes) of each geometry type to rebuild the views
+        for column, dtype in entity_df.dtypes.items():
+            self._type_columns[geometry_type][column] = dtype
+
+        rows = entity_df.copy()
+        rows['_component'] = component
+        rows['_noded'] = False  # set by clean_network and update_topology once the intersections are tidied
+
+        network_df = self._network_df
+        if network_df is None:
+            pieces = [rows]
         else:
-            return None
+            # The replaced geometries that did not change (e.g. written back with the entity_df setter) stay noded
+            is_component = network_df['_component'].values == component
+            previous = network_df.loc[is_component]
+            if len(previous) == len(rows):
+                rows['_noded'] = previous['_noded'].values & shapely.equals_exact(np.asarray(previous.geometry.values),
+                                                                                 np.asarray(rows.geometry.values))
+
+            network_df = network_df.loc[~is_component]
+            for column in ['n_type', 'f_set', 'b_group']:
+                network_df[column] = network_df[column].astype('int64')
+            pieces = [network_df, rows]
+
+        network_df = pd.concat(pieces, ignore_index=True)
+
+        # Categorical columns used to group the geometries
+        network_df['type'] = pd.Categorical(network_df['type'], categories=list(self._component_types))
+        for column in ['n_type', 'f_set', 'b_group']:
+            if column not in network_df.columns:
+                network_df[column] = -9999
+            network_df[column] = network_df[column].fillna(-9999).astype('int64').astype('category')
+
+        self._network_df = network_df
+        self._spatial_index_cache = None
+        self._invalidate_views()
 
     @property
-    def _active_nodes_df(self) -> GeoDataFrame:
+    def _spatial_index(self) -> STRtree:
         """
-        Internal property that returns the dataframe of the active nodes
-        :return:
+        Internal property that returns the persistent STRtree of the geometries of the network dataframe (all the
+        rows, active or not). The tree is rebuilt only when a component is added or replaced: the noding only adds
+        vertices to the lines, so the envelopes of the tree remain valid.
         """
+        if self._spatial_index_cache is None:
+            self._spatial_index_cache = STRtree(self._network_df.geometry.values)
 
-        gdf = GeoDataFrame()
+        return self._spatial_index_cache
 
-        nodes = self._active_nodes_components
+    @property
+    def _active_mask(self) -> np.ndarray:
+        """
+        Internal property that returns the boolean mask of the rows of the network dataframe that belong to active
+        components
+        """
+        if self._active_mask_cache is None:
+            active_components = self._df.index[self._df['active'] == 1]
+            self._active_mask_cache = np.isin(self._network_df['_component'].values, active_components)
 
-        if nodes is not None:
-            for row, fracture in nodes.iterrows():
-                gdf = pd.concat([gdf, fracture['object'].entity_df], ignore_index=True)
-            return gdf
-        else:
+        return self._active_mask_cache
+
+    def _mask_rows(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Internal method that returns the positions of the given rows of the network dataframe sorted following the
+        order of the components in the registry (i.e. the order of the rows in the entity views)
+        """
+        rows = np.where(mask)[0]
+
+        return rows[np.argsort(self._network_df['_component'].values[rows], kind='stable')]
+
+    def _network_rows_df(self, geometry_type: str, mask: np.ndarray) -> GeoDataFrame:
+        """
+        Internal method that returns the dataframe of the given rows of the network dataframe with the columns and
+        dtypes of the given geometry type. The rows are sorted following the order of the components in the registry.
+
+        :param geometry_type: Type of the geometries (node, fracture or boundary)
+        :param mask: Boolean mask of the rows of the network dataframe
+        :return: Geopandas dataframe or None if there are no rows
+        """
+        if self._network_df is None or not mask.any():
+            return None
+
+        rows = self._mask_rows(mask)
+
+        dtypes = self._type_columns[geometry_type]
+        gdf = self._network_df.iloc[rows][list(dtypes)]
+
+        for column, dtype in dtypes.items():
+            if gdf[column].dtype != dtype and gdf[column].notna().all():
+                gdf[column] = gdf[column].astype(dtype)
+
+        gdf.reset_index(drop=True, inplace=True)
+
+        return gdf
+
+    def _active_type_df(self, geometry_type: str) -> GeoDataFrame:
+        """
+        Internal method that returns the dataframe of the active components of a geometry type
+        :param geometry_type: Type of the geometries (node, fracture or boundary)
+        :return: Geopandas dataframe or None if no component is active
+        """
+        if self._network_df is None:
+            return None
+
+        mask = self._active_mask & (self._network_df['type'] == geometry_type).values
+
+        return self._network_rows_df(geometry_type, mask)
+
+    def _entity_view(self, geometry_type: str, gdf: GeoDataFrame):
+        """
+        Internal method used to create an entity object from a dataframe of the network without processing it again
+        with the entity_df setter.
+
+        :param geometry_type: Type of the geometries (node, fracture or boundary)
+        :param gdf: Dataframe of the entity
+        :return: Nodes, Fractures or Boundary object (None if gdf is None)
+        """
+        if gdf is None:
             return None
 
+        entity = self._component_types[geometry_type][2]()
+        entity._df = gdf
+        entity.tolerance = self.tolerance
+
+        return entity
+
+    def _active_view(self, geometry_type: str):
+        """
+        Internal method that returns an entity object of the active components of a geometry type. The dataframe is
+        memoized and each entity gets a copy of it, so that in place changes of the entity dataframe do not alter the
+        network (or the memoized dataframe)
+        """
+        if geometry_type not in self._views:
+            self._views[geometry_type] = self._active_type_df(geometry_type)
+
+        gdf = self._views[geometry_type]
+
+        return self._entity_view(geometry_type, None if gdf is None else gdf.copy())
+
+    def _component_object(self, geometry_type: str, key):
+        """
+        Internal method that returns the entity object of a single component (active or not)
+        """
+        registry_type, key_column, _ = self._component_types[geometry_type]
+        component = self._component_index(registry_type, key_column, key)
+
+        mask = self._network_df['_component'].values == component
+
+        return self._entity_view(geometry_type, self._network_rows_df(geometry_type, mask))
+
+    #  ==================== Nodes property ====================
+
+    @property
+    def nodes(self) -> Nodes:
+        """
+        Property that returns a Node entity object of all the active nodes. The object holds a copy of the nodes:
+        changes made to it are not applied to the network (use add_nodes).
+        :return: Nodes entity object
+        """
+        return self._active_view('node')
+
     def add_nodes(self, nodes: Nodes = None):
         """
         Method used to add nodes components to the fracture network Dataframe
@@ -787,13 +1044,9 @@ class FractureNetwork(BaseEntity):
 
             nodes_group = Nodes(gdf=nodes_df, node_type=node_type)
 
-            if node_type not in self._df['n_type'].values:
-                new_df = DataFrame([['nodes', nodes_group, node_type, 1]], columns=['type', 'object',
-                                                                                    'n_type', 'active'])
-                self._df = pd.concat([self._df, new_df], ignore_index=True)
-            else:
-                self._df.loc[self._df['n_type'] == node_type, 'object'] = nodes_group
+            self._add_component('node', node_type, nodes_group.entity_df)
 
+    @profiling.profiled('FractureNetwork.add_nodes_from_dict')
     def add_nodes_from_dict(self, node_dict, classes=None, origin_dict: dict = None):
         """Add nodes a dict of shapely geometry (key), classes and optionally node origin (value).
 
@@ -802,6 +1055,7 @@ class FractureNetwork(BaseEntity):
         :param origin_dict: Dict of shapely node geometries as keys and a list of node origin.
         """
 
+        profiling.add_items(len(node_dict))
         node_geometry = np.array(list(node_dict.keys()))
         class_list = np.array(list(node_dict.values()))
         origin_list = list(origin_dict.values())
@@ -813,13 +1067,39 @@ class FractureNetwork(BaseEntity):
 
         self.add_nodes(nodes)
 
+    @profiling.profiled('FractureNetwork.add_nodes_from_arrays')
+    def add_nodes_from_arrays(self, node_points: np.ndarray, node_classes: np.ndarray, node_indexes: np.ndarray,
+                              node_origins: np.ndarray):
+        """Add nodes from arrays of node coordinates, classes, indexes and node origin (as returned by
+        Topology.nodes_conn).
+
+        :param node_points: Array of node coordinates with shape (n, 3)
+        :param node_classes: Array of node classes
+        :param node_indexes: Array of node indexes (point ids in the fractures vtk object)
+        :param node_origins: Integer matrix of node origins (one row for each node, missing sets are -9999). The
+         first two sets are stored in the n_origin1 and n_origin2 columns and the n_origin column stores the string
+         representation (see Topology.origin_strings)
+        """
+
+        profiling.add_items(len(node_classes))
+        node_origins = np.asarray(node_origins).reshape(len(node_classes), -1)
+
+        entity_df = GeoDataFrame({'type': 'node', 'n_type': node_classes, 'n_index': node_indexes,
+                                  'n_origin': Topology.origin_strings(node_origins, node_classes),
+                                  'n_origin1': node_origins[:, 0], 'n_origin2': node_origins[:, 1],
+                                  'geometry': points(node_points)}, crs=self.crs)
+
+        nodes = Nodes(gdf=entity_df)
+
+        self.add_nodes(nodes)
+
     def nodes_object(self, node_type: int) -> Nodes:
         """
         Method that returns the Node object of a given node_type
         :param node_type: Type of the node
         :return: Nodes object
         """
-        return self._fractures_components.loc[self._fractures_components['n_type'] == node_type, 'object'].values[0]
+        return self._component_object('node', node_type)
 
     def activate_nodes(self, node_type: list = None):
         """
@@ -827,12 +1107,7 @@ class FractureNetwork(BaseEntity):
         :param node_type: List of node types to be activated
         """
 
-        if node_type is None:
-            self.entity_df.loc[self.entity_df['type'] == 'nodes', 'active'] = 1
-        else:
-            self.entity_df.loc[self.entity_df['type'] == 'nodes', 'active'] = 0
-            for t in node_type:
-                self.entity_df.loc[self.entity_df['n_type'] == t, 'active'] = 1
+        self._activate_components('nodes', 'n_type', node_type)
 
     def is_type_active(self, node_type: int) -> bool:
         """
@@ -840,23 +1115,19 @@ class FractureNetwork(BaseEntity):
         :param node_type: node type to check
         :return: Bool value of the test
         """
-        nodes = self._nodes_components
 
-        value = nodes.loc[nodes['n_type'] == node_type, 'active'].values[0]
-
-        return value
+        return self._is_component_active('nodes', 'n_type', node_type)
 
     #  ==================== Fractures  ====================
 
     @property
     def fractures(self) -> Fractures:
         """
-        Property that returns a Fracture entity object of all the active fracture sets.
+        Property that returns a Fracture entity object of all the active fracture sets. The object holds a copy of the
+        fractures: changes made to it are not applied to the network (use add_fractures).
         :return: Fracture entity object
         """
-        if self._active_fractures_df is not None:
-            return Fractures(self._active_fractures_df)
-        return None
+        return self._active_view('fracture')
 
     @property
     def sets(self) -> list:
@@ -865,57 +1136,13 @@ class FractureNetwork(BaseEntity):
         sets = list(set(self.fractures.entity_df['f_set'].values))
         return sets
 
-    @property
-    def _fractures_components(self) -> DataFrame:
-        """
-        Internal property that returns the fracture components of the Fracture network df.
-        :return: Pandas dataframe slice of the fracture set components
-        """
-        fractures = self.entity_df.loc[self.entity_df['type'] == 'fractures']
-
-        if not fractures.empty:
-            return fractures
-        else:
-            return None
-
-    @property
-    def _active_fractures_components(self) -> DataFrame:
-        """
-        Internal property that returns the active fracture components in the of the Fracture network df
-        :return: Pandas dataframe slice of active fracture components
-        """
-
-        fractures = self.entity_df.loc[self.entity_df['type'] == 'fractures']
-
-        active_fractures = fractures.loc[fractures['active'] == 1]
-        if not active_fractures.empty:
-            return active_fractures
-        else:
-            return None
-
-    @property
-    def _active_fractures_df(self) -> GeoDataFrame:
-        """
-        Internal property that returns the dataframe of the active fractures sets components
-        :return: Geopandas dataframe of the active fracture sets components
-        """
-
-        gdf = GeoDataFrame()
-
-        fractures = self._active_fractures_components
-
-        if fractures is not None:
-            for row, fracture in fractures.iterrows():
-                gdf = pd.concat([gdf, fracture['object'].entity_df], ignore_index=True)
-
-            return gdf
-        else:
-            return None
-
-    def add_fractures(self, fractures: Fractures = None):
+    @profiling.profiled('FractureNetwork.add_fractures')
+    def add_fractures(self, fractures: Fractures = None, update_topology: bool = False):
         """
         Method used to add fracture components to the fracture network Dataframe
         :param fractures: Fracture object to be added
+        :param update_topology: If true and the topology was already calculated, update it only around the added
+         fractures (see update_topology). Default is False
 
         Notes
         -------
@@ -925,17 +1152,21 @@ class FractureNetwork(BaseEntity):
         """
         fracture_sets = set(fractures.entity_df['f_set'])
 
+        previous_geometries = []
+        if update_topology and self._network_df is not None:
+            is_replaced = ((self._network_df['type'] == 'fracture').values &
+                           self._network_df['f_set'].astype('int64').isin(fracture_sets).values)
+            previous_geometries = list(self._network_df.geometry.values[is_replaced])
+
         for set_n in fracture_sets:
 
             fractures_df = fractures.entity_df.loc[fractures.entity_df['f_set'] == set_n]
             fractures_group = Fractures(gdf=fractures_df, set_n=set_n)
 
-            if set_n not in self._df['f_set'].values:
-                new_df = DataFrame([['fractures', fractures_group, set_n, 1]],
-                                   columns=['type', 'object', 'f_set', 'active'])
-                self._df = pd.concat([self._df, new_df], ignore_index=True)
-            else:
-                self._df.loc[self._df['f_set'] == set_n, 'object'] = fractures_group
+            self._add_component('fracture', set_n, fractures_group.entity_df)
+
+        if update_topology:
+            self.update_topology(list(fracture_sets), previous_geometries=previous_geometries)
 
     def fracture_object(self, set_n: int) -> Fractures:
         """
@@ -943,21 +1174,24 @@ class FractureNetwork(BaseEntity):
         :param set_n: Number of the set
         :return: Fracture object
         """
-        return self._fractures_components.loc[self._fractures_components['f_set'] == set_n, 'object'].values[0]
+        return self._component_object('fracture', set_n)
 
-    def activate_fractures(self, set_n: list = None):
+    def activate_fractures(self, set_n: list = None, update_topology: bool = False):
         """
         Method that activates the fractures provided in the set_n list.
         :param set_n: List of sets to be activated
+        :param update_topology: If true and the topology was already calculated, update it only around the
+         fractures of the sets that changed state (see update_topology). Default is False
         """
 
-        if set_n is None:
-            self.entity_df.loc[self.entity_df['type'] == 'fractures', 'active'] = 1
-        else:
-            self.entity_df.loc[self.entity_df['type'] == 'fractures', 'active'] = 0
-            if len(set_n) > 0:
-                for n in set_n:
-                    self.entity_df.loc[self.entity_df['f_set'] == n, 'active'] = 1
+        is_set = self._df['type'] == 'fractures'
+        previous_active = set(self._df.loc[is_set & (self._df['active'] == 1), 'f_set'])
+
+        self._activate_components('fractures', 'f_set', set_n)
+
+        if update_topology:
+            active = set(self._df.loc[is_set & (self._df['active'] == 1), 'f_set'])
+            self.update_topology(list(previous_active ^ active))
 
     def is_set_active(self, set_n: int) -> bool:
         """
@@ -966,74 +1200,18 @@ class FractureNetwork(BaseEntity):
         :return: Bool value of the test
         """
 
-        fractures = self._fractures_components
-
-        value = fractures.loc[fractures['f_set'] == set_n, 'active'].values[0]
-
-        return value
+        return self._is_component_active('fractures', 'f_set', set_n)
 
     #  ==================== Boundaries property ====================
 
     @property
     def boundaries(self) -> Boundary:
         """
-        Property that returns a Boundary entity object of all the active boundary groups.
+        Property that returns a Boundary entity object of all the active boundary groups. The object holds a copy of
+        the boundaries: changes made to it are not applied to the network (use add_boundaries).
         :return: Boundary entity object
         """
-        if self._active_boundaries_df is not None:
-            return Boundary(self._active_boundaries_df)
-        else:
-            return None
-
-    @property
-    def _boundaries_components(self) -> DataFrame:
-        """
-        Internal property that returns the boundary components of the Fracture network df.
-        :return: Pandas dataframe slice of the boundary groups components
-        """
-
-        boundaries = self.entity_df.loc[self.entity_df['type'] == 'boundary']
-        if not boundaries.empty:
-            return boundaries
-        else:
-            return None
-
-    @property
-    def _active_boundaries_components(self) -> DataFrame:
-        """
-        Internal property that returns the active boundary group components in the of the Fracture network df
-        :return: Pandas dataframe slice of active boundary group components
-        """
-
-        boundaries = self.entity_df.loc[self.entity_df['type'] == 'boundary']
-
-        active_boundaries = boundaries.loc[boundaries['active'] == 1]
-
-        if not active_boundaries.empty:
-
-            return active_boundaries
-        else:
-            return None
-
-    @property
-    def _active_boundaries_df(self) -> GeoDataFrame:
-        """
-        Internal property that returns the dataframe of the active boundary
-        :return: GeoPandas DataFrame of the active boundaries of the fracture network
-        """
-
-        df = GeoDataFrame()
-
-        boundaries = self._active_boundaries_components
-
-        if boundaries is not None:
-
-            for row, fracture in boundaries.iterrows():
-                df = pd.concat([df, fracture['object'].entity_df], ignore_index=True)
-
-            return df
-        else:
-            return None
+        return self._active_view('boundary')
 
     def add_boundaries(self, boundary: Boundary = None):
         """
@@ -1054,13 +1232,7 @@ class FractureNetwork(BaseEntity):
             boundary_df = boundary.entity_df.loc[boundary.entity_df['b_group'] == group_n]
             boundary_group = Boundary(gdf=boundary_df, group_n=group_n)
 
-            if group_n not in self._df['b_group'].values:
-
-                new_df = DataFrame([['boundary', boundary_group, group_n, 1]],
-                                   columns=['type', 'object', 'b_group', 'active'])
-                self._df = pd.concat([self._df, new_df], ignore_index=True)
-            else:
-                self._df.loc[self._df['b_group'] == group_n, 'object'] = boundary_group
+            self._add_component('boundary', group_n, boundary_group.entity_df)
 
     def boundary_object(self, group_n: int) -> Boundary:
         """
@@ -1069,7 +1241,7 @@ class FractureNetwork(BaseEntity):
         :return: Boundary object
         """
 
-        return self._boundaries_components.loc[self._boundaries_components['b_group'] == group_n, 'object'].values[0]
+        return self._component_object('boundary', group_n)
 
     def activate_boundaries(self, group_n: list = None):
 
@@ -1078,12 +1250,7 @@ class FractureNetwork(BaseEntity):
         :param group_n: List of groups to be activated
         """
 
-        if group_n is None:
-            self.entity_df.loc[self.entity_df['type'] == 'boundary', 'active'] = 1
-        else:
-            self.entity_df.loc[self.entity_df['type'] == 'boundary', 'active'] = 0
-            for n in group_n:
-                self.entity_df.loc[self.entity_df['b_group'] == n, 'active'] = 1
+        self._activate_components('boundary', 'b_group', group_n)
 
     def is_group_active(self, group_n: int) -> bool:
         """
@@ -1092,41 +1259,63 @@ class FractureNetwork(BaseEntity):
         :return: Bool value of the test
         """
 
-        boundaries = self._boundaries_components
-        value = boundaries.loc[boundaries['b_group'] == group_n, 'active'].values[0]
-
-        return value
+        return self._is_component_active('boundary', 'b_group', group_n)
 
     #  ==================== Backbone methods ====================
 
-    def calculate_backbone(self, biggest_region=True):
+    def cluster_labels(self) -> np.ndarray:
         """
-        Calculate the backbone(s) of the network and add the calculated nodes to the network.
+        Label the clusters of connected active fractures (see Clusters.cluster_labels). Cluster 0 is the biggest
+        region.
 
-        :param biggest_region: Output only most connected region. Default is True
+        :return: Array with the cluster of each fracture, in the same order of the fractures entity_df
+        """
+
+        return Clusters.cluster_labels(self.fractures.entity_df, tolerance=self.tolerance)
+
+    def cluster_report(self) -> DataFrame:
+        """
+        Summarize the clusters of connected active fractures with the number of fractures, total length and spatial
+        extent of each cluster.
+
+        :return: DataFrame indexed by cluster (see Clusters.cluster_report)
         """
 
-        fractures = self.fractures
+        return Clusters.cluster_report(self.fractures.entity_df, self.cluster_labels())
+
+    @profiling.profiled('FractureNetwork.calculate_backbone')
+    def calculate_backbone(self, biggest_region=True, clusters: list = None):
+        """
+        Calculate the backbone(s) of the network and add them to the network. Each backbone is a cluster of connected
+        fractures (see cluster_labels) and is made of the corresponding rows of the fractures entity_df.
+
+        :param biggest_region: Output only most connected region. Default is True
+        :param clusters: List of clusters to add as backbones. If None the biggest region is used if biggest_region
+         is True, else all the clusters are used
+        """
 
-        connectivity = vtkConnectivityFilter()
+        fractures_df = self.fractures.entity_df
+        labels = self.cluster_labels()
 
-        connectivity.AddInputData(fractures.vtk_object)
-        # if biggest_region: # For now only biggest region
-        connectivity.SetExtractionModeToLargestRegion()
+        if clusters is None:
+            clusters = [0] if biggest_region else np.unique(labels[labels >= 0])
 
-        connectivity.Update()
+        # use the last available set (or backbone) and add +1 for each backbone
+        backbone_set_n = max(self.sets + [backbone.set_n for backbone in self._backbones]) + 1
 
-        vtkbackbone = PolyData(connectivity.GetOutput())
+        for cluster in clusters:
+            backbone_df = fractures_df.loc[labels == cluster].copy()
+            backbone_df['f_set'] = backbone_set_n
 
-        backbone_set_n = self.sets[-1] + 1 # use the last available set and add +1. This could be expanded for multiple backbones
+            backbone = Backbone(gdf=backbone_df, set_n=backbone_set_n)
+            backbone.tolerance = self.tolerance
+            backbone.crs = self.crs
 
-        backbone = Backbone(set_n=backbone_set_n)
-        backbone.vtk_object = vtkbackbone
-        backbone.crs = self.crs
+            new_df = DataFrame([['backbone', backbone_set_n, 0]], columns=['type', 'f_set', 'active'])
+            self._df = pd.concat([self._df, new_df], ignore_index=True)
+            self._backbones.append(backbone)
 
-        new_df = DataFrame([['backbone', backbone, backbone_set_n, 0]],
-                           columns=['type', 'object', 'f_set', 'active'])
-        self._df = pd.concat([self._df, new_df], ignore_index=True)
+            backbone_set_n += 1
 
     @property
     def backbone(self):
@@ -1134,7 +1323,43 @@ class FractureNetwork(BaseEntity):
         Property that returns a Fractures entity object of the backbone.
         :return: Fracture entity object
         """
-        return self._df.loc[self._df['type'] == 'backbone', 'object'].values
+        backbones = np.empty(len(self._backbones), dtype=object)
+        backbones[:] = self._backbones
+        return backbones
+
+    @profiling.profiled('FractureNetwork.set_interaction_matrix')
+    def set_interaction_matrix(self) -> tuple:
+        """
+        Count the Y and X nodes between each pair of active fracture sets and calculate the node counts and
+        connectivity (connections per line CL, connections per branch CB and precise_n, equal to CL) of each set,
+        using the integer node origins (see Topology.set_interactions). If the topology was not calculated it is
+        calculated first.
+
+        :return: Tuple of DataFrames with the Y matrix (rows are the abutting sets, columns the abutted sets), the
+                 symmetric X matrix and the set statistics
+        """
+        if self.nodes is None:
+            self.calculate_topology()
+
+        return Topology.set_interactions(self.nodes.entity_df, self.sets)
+
+    #  ==================== Branch methods ====================
+
+    @profiling.profiled('FractureNetwork.calculate_branches')
+    def calculate_branches(self) -> Branches:
+        """
+        Split the active fractures of the network in branches between nodes (see Topology.branches). If the topology
+        was not calculated it is calculated first.
+
+        :return: Branches entity object
+        """
+        if self.nodes is None:
+            self.calculate_topology()
+
+        branches = Branches(gdf=Topology.branches(self))
+        branches.tolerance = self.tolerance
+
+        return branches
 
     #  ==================== Generic methods ====================
 
@@ -1145,26 +1370,28 @@ class FractureNetwork(BaseEntity):
         :return: Geopandas DataFrame of the whole fracture network
         """
 
-        gdf = DataFrame()
-
-        nodes = self._active_nodes_df
+        if self._network_df is None or not self._active_mask.any():
+            return DataFrame()
 
-        gdf = pd.concat([gdf, nodes], ignore_index=True)
+        network_df = self._network_df
 
-        fractures = self._active_fractures_df
+        # Active rows sorted by type (nodes, fractures and boundaries) and by component
+        rows = np.where(self._active_mask)[0]
+        type_codes = network_df['type'].cat.codes.values[rows]
+        rows = rows[np.lexsort((network_df['_component'].values[rows], type_codes))]
 
-        gdf = pd.concat([gdf, fractures], ignore_index=True)
+        columns = []
+        for geometry_type in np.array(list(self._component_types))[np.unique(type_codes)]:
+            columns += [column for column in self._type_columns[geometry_type] if column not in columns]
 
-        boundaries = self._active_boundaries_df
+        gdf = network_df.iloc[rows][columns]
+        gdf.reset_index(drop=True, inplace=True)
 
-        gdf = pd.concat([gdf, boundaries], ignore_index=True)
-
-        if 'n_type' in gdf.columns:
-            gdf['n_type'] = gdf['n_type'].fillna(-9999).astype('int64')
-        gdf['f_set'] = gdf['f_set'].fillna(-9999).astype('int64')
+        gdf['type'] = gdf['type'].astype(str)
+        for column in ['n_type', 'f_set', 'b_group']:
+            if column in gdf.columns:
+                gdf[column] = gdf[column].astype('int64')
         gdf['censored'] = gdf['censored'].fillna(-9999).astype('int64')
-        if 'b_group' in gdf.columns:
-            gdf['b_group'] = gdf['b_group'].fillna(-9999).astype('int64')
         return gdf
 
     def vtk_object(self, include_nodes: bool = True) -> PolyData:
@@ -1175,81 +1402,68 @@ class FractureNetwork(BaseEntity):
         :return: vtkPolyData of the fracture network
         """
 
-        vtk_obj = Rep.fracture_network_vtk_rep(self.fracture_network_to_components_df(), include_nodes=include_nodes)
+        vtk_obj = Rep.fracture_network_vtk_rep(self.fracture_network_to_components_df(), include_nodes=include_nodes,
+                                               tolerance=self.tolerance)
         return vtk_obj
 
-    def network_object(self) -> Graph:
+    def network_object(self, as_csgraph: bool = False) -> Graph:
         """
         Method used to return a networkx Graph representation of the fracture network
+        :param as_csgraph: If true return the scipy sparse graph (CSR adjacency matrix and edge attributes, see
+         Adapters.csgraph_rep) instead of the networkx Graph. Default is False
         :return: Graph of the fracture network
         """
 
+        if as_csgraph:
+            return Rep.csgraph_rep(self.vtk_object(include_nodes=False))
+
         network_object = Rep.networkx_rep(self.vtk_object(include_nodes=False))
         return network_object
 
-    def check_network(self, check_single=True, save_shp=None):
+    def check_network(self, check_single=True, save_shp=None) -> GeoDataFrame:
         """
         Method used to check if network-wide the geometries are correct i.e.:
+        + No empty geometries
+        + No multilines
         + No repeating points
         + No overlaps
+        + No fractures crossing the boundary
 
-        By default, the method will return a list of geometries that need to be fixed. Additionally, a shp file can be
-        saved with only the geometries that need to be corrected.
+        By default, the method will return a report of the geometries that need to be fixed. Additionally, a shp file
+        can be saved with only the geometries that need to be corrected.
 
-        :param remove_dup: Automatically remove duplicate points. By default, True. When false, a point shapefile where double points are present will be saved
         :param check_single: Perform check also for the single components
-        :param save_shp: Path to save the shp of the check. If check_single is true then also the results of the single component check will be saved.
+        :param save_shp: Path of the folder where the frac_corr.shp file of the check is saved. If None the overlaps
+                         and boundary intersections of each set are printed.
+        :return: Report GeoDataFrame (see Geometry.validate_geometries)
         """
 
         df = self.fracture_network_to_components_df()
         df = df.loc[df['type'] != 'node']
 
-        set_n = np.array(list(set(df['f_set'])))
-
-        overlaps_list = []
-        overlaps_list_dict = {s: [] for s in set_n[set_n>0]}
-        overlaps_geometry_list = []
-        intersections_list = []
-        intersections_geometry_list = []
-
-        for line, geom in enumerate(df.geometry):
-
-            if df.loc[line, 'type'] == 'boundary':
-                mask = np.ones(df.geometry.size, dtype=bool)
-                mask[line] = False
-                sub_df = df[mask]
-                intersections = sub_df.intersects(geom)
-                touching = sub_df.touches(geom)
-                xor = intersections != touching
-                if xor.any():
-                    filtered_df = sub_df[xor]
-                    for n in set(filtered_df['f_set']):
-                        int_dict = dict()
-                        int_dict['boundary_int'] = list(filtered_df.loc[filtered_df['f_set'] == n, 'og_line_id'].values)
-                        overlaps_list_dict[n].append(int_dict)
-                    intersections_list = filtered_df['og_line_id'].values
-                    intersections_geometry_list = filtered_df['geometry'].values
-
-            else:
-                overlaps = df.overlaps(geom)
-                if overlaps.any():
-                    overlaps_list.append(df.loc[line, 'og_line_id'])
-                    overlaps_geometry_list.append(df.loc[line, 'geometry'])
-                    set_n = df.loc[line, 'f_set']
-                    overlaps_list_dict[set_n].append(df.loc[line, 'og_line_id'])
+        report = Geometry.validate_geometries(df)
 
         if save_shp:
             path_frac = os.path.join(save_shp, 'frac_corr.shp')
+            report.to_file(path_frac)
 
-            f_out_dict = {'og_id': [*overlaps_list, *intersections_list],
-                          'geometry': [*overlaps_geometry_list, *intersections_geometry_list]}
+        else:
+            set_n = np.unique(df['f_set'])
+            overlaps_list_dict = {s: [] for s in set_n[set_n > 0]}
 
-            out_df = GeoDataFrame(f_out_dict, crs=self.crs)
-            out_df.to_file(path_frac)
+            overlaps = report.loc[report['problem'] == 'overlap'].drop_duplicates(['f_set', 'og_line_id'])
+            for set_n, og_line_id in zip(overlaps['f_set'], overlaps['og_line_id']):
+                overlaps_list_dict[set_n].append(og_line_id)
+
+            intersections = report.loc[(report['problem'] == 'boundary_int') & (report['f_set'] > 0)]
+            for (_, set_n), group in intersections.groupby(['other_id', 'f_set'], sort=False):
+                overlaps_list_dict[set_n].append({'boundary_int': list(group['og_line_id'].values)})
 
-        else:
             print(overlaps_list_dict)
 
+        return report
+
+    @profiling.profiled('FractureNetwork.clean_network')
     def clean_network(self, buffer = 0.05, inplace=True, only_boundary=False):
         """Tidy the intersection of the active entities in the fracture network. A buffer is applied to all the
         geometries to ensure intersection in a given radius.
@@ -1262,32 +1476,255 @@ class FractureNetwork(BaseEntity):
 
         if inplace:
             if only_boundary:
-                Geometry.tidy_intersections_boundary_only(self)
+                Geometry.tidy_intersections_boundary_only(self, buffer=buffer)
             else:
-                Geometry.tidy_intersections(self)
+                Geometry.tidy_intersections(self, buffer=buffer)
+                if self._network_df is not None:
+                    noded = self._active_mask & (self._network_df['type'] != 'node').values
+                    self._network_df.loc[noded, '_noded'] = True
         else:
             if only_boundary:
-                Geometry.tidy_intersections_boundary_only(self, inplace=False)
+                Geometry.tidy_intersections_boundary_only(self, buffer=buffer, inplace=False)
             else:
-                Geometry.tidy_intersections(self, inplace=False)
+                Geometry.tidy_intersections(self, buffer=buffer, inplace=False)
 
-    def calculate_topology(self, clean_network=True, only_boundary=False):
+    @profiling.profiled('FractureNetwork.calculate_topology')
+    def calculate_topology(self, clean_network=True, only_boundary=False, tile_size=None, halo=None, n_jobs=None):
         """
         Calculate the topology of the network and add the calculated nodes to the network.
 
         :param clean_network: If true, before calculating the topology the network is cleaned with the clean_network. Default is True
         :param only_boundary: Apply cleaning only on the fractures intersecting the boundary
+        :param tile_size: Size in map units of the tiles used to classify the nodes in parallel. The nodes of each
+         tile are classified in a separate worker process and the results are joined in a single Nodes entity, equal
+         to the one of the single process calculation. The cleaning always runs in a single process, since the noding
+         of the intersections is order dependent. If None the topology is calculated in a single process.
+         Default is None
+        :param halo: Size in map units of the margin added to each tile when classifying the nodes. It must be larger
+         than the tolerance of the network. If None ten times the tolerance is used
+        :param n_jobs: Number of worker processes used with tiles. If None all the available cpus are used
+
+        Notes
+        -------
+        On Windows and macOS the worker processes are spawned, so scripts calculating the topology with tiles must be
+        protected with an if __name__ == '__main__' block.
         """
         if clean_network is True:
             self.clean_network(only_boundary=only_boundary)
 
-        nodes_dict, origin_dict = Topology.nodes_conn(self)
-        self.add_nodes_from_dict(nodes_dict,origin_dict=origin_dict, classes=None)
+        if tile_size is None:
+            node_points, node_classes, node_indexes, node_origins = Topology.nodes_conn(self)
+        else:
+            node_points, node_classes, node_indexes, node_origins = Topology.tiled_nodes_conn(self, tile_size,
+                                                                                             halo=halo,
+                                                                                             n_jobs=n_jobs)
+        self.add_nodes_from_arrays(node_points, node_classes, node_indexes, node_origins)
+
+    @profiling.profiled('FractureNetwork.calculate_censoring')
+    def calculate_censoring(self, boundary: Boundary = None) -> Nodes:
+        """
+        Censor the active fractures against the boundary without calculating the topology (see
+        Topology.censoring): the fractures with an end point on the boundary lines are censored. The censored column
+        of the active fractures is replaced.
+
+        :param boundary: Boundary object used to censor the network. If given it is added to the network (replacing
+         the boundary with the same group), if None the active boundaries of the network are used
+        :return: Nodes object with the U nodes on the end points of the censored fractures
+        """
+
+        if boundary is not None:
+            self.add_boundaries(boundary)
+
+        fractures_df = self.fractures.entity_df
+        boundary_geometries = None if self.boundaries is None else self.boundaries.entity_df.geometry.values
 
+        censored, node_points, node_lines = Topology.censoring(fractures_df, boundary_geometries, self.tolerance)
 
+        fracture_rows = self._mask_rows(self._active_mask & (self._network_df['type'] == 'fracture').values)
+        self._network_df.iloc[fracture_rows, self._network_df.columns.get_loc('censored')] = censored
+        self._invalidate_views()
 
+        origins = np.full((len(node_lines), 2), -9999, dtype=np.int64)
+        origins[:, 0] = fractures_df['f_set'].values[node_lines]
+        node_classes = np.full(len(node_lines), 5)
 
+        entity_df = GeoDataFrame({'type': 'node', 'n_type': node_classes,
+                                  'n_origin': Topology.origin_strings(origins, node_classes),
+                                  'n_origin1': origins[:, 0], 'n_origin2': origins[:, 1],
+                                  'geometry': points(node_points)}, crs=self.crs)
 
+        return Nodes(gdf=entity_df, node_type=5)
+
+    def sample_windows(self, windows, use_survival: bool = True, complete_only: bool = True, n_jobs: int = 1):
+        """
+        Sample the active fractures of the network with many sampling windows. The traces intersecting each window are
+        found for all the windows with a single bulk query on a STRtree of the fractures, then each window is clipped
+        (see Geometry.window_lengths): traces truncated by the window edge are censored.
+
+        The windows are processed lazily, one NetworkData object (with the lengths and censoring of the clipped traces)
+        is yielded for each window, in the same order of the windows. None is yielded for windows without fractures.
+
+        :param windows: List (or GeoSeries/GeoDataFrame) of polygons
+        :param use_survival: Passed to NetworkData. Default is True
+        :param complete_only: Passed to NetworkData. Default is True
+        :param n_jobs: Number of worker processes used to clip the windows. If None all the available cpus are used.
+         Default is 1 (windows processed in the current process)
+        :return: Generator of NetworkData objects
+        """
+
+        if isinstance(windows, (GeoDataFrame, GeoSeries)):
+            windows = windows.geometry.values
+        windows = np.asarray(windows, dtype=object)
+
+        fractures_df = self.fractures.entity_df
+        geometries = np.asarray(fractures_df.geometry.values, dtype=object)
+        censored = fractures_df['censored'].values
+
+        window_index, line_index = STRtree(geometries).query(windows, predicate='intersects')
+        window_start = np.searchsorted(window_index, np.arange(len(windows) + 1))
+
+        window_lines = [line_index[window_start[window]:window_start[window + 1]] for window in range(len(windows))]
+        tasks = ((geometries[lines], censored[lines], window) for lines, window in zip(window_lines, windows))
+
+        if n_jobs == 1:
+            results = (Geometry.window_lengths(*task) for task in tasks)
+            yield from self._windows_data(results, use_survival, complete_only)
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+                results = executor.map(Geometry.window_lengths, *zip(*tasks))
+                yield from self._windows_data(results, use_survival, complete_only)
+
+    @staticmethod
+    def _windows_data(results, use_survival: bool, complete_only: bool):
+        """
+        Internal generator that converts the lengths and censoring of each window in a NetworkData object
+        """
+        for lengths, censored in results:
+            if len(lengths) == 0:
+                yield None
+            else:
+                yield NetworkData(DataFrame({'length': lengths, 'censored': censored}), use_survival, complete_only)
+
+    @profiling.profiled('FractureNetwork.update_topology')
+    def update_topology(self, sets: list, clean_network: bool = True, buffer: float = 0.05,
+                        previous_geometries: list = None):
+        """
+        Incrementally update the topology of the network after the given fracture sets were added, removed (i.e.
+        deactivated) or replaced. If the topology was never calculated the full calculate_topology is used.
+
+        The lines around the fractures of the sets are found with the persistent spatial index of the network. Then:
+
+            1. If clean_network is true, only the intersections of the active fractures of the sets that were never
+               tidied (i.e. added or replaced after the last clean_network) are tidied. Noding again lines that
+               were already noded would add the same nodes twice, so sets that are only activated again are not
+               tidied.
+            2. The nodes on the points of the fractures of the sets are classified again using only the lines touching
+               them, and the nodes of the network are patched.
+            3. The censored flags are updated only for the active fractures of the sets.
+
+        :param sets: List of the changed fracture sets
+        :param clean_network: If true, tidy the intersections of the fractures of the sets that were not already
+         tidied. Default is True
+        :param buffer: Applied buffer used to tidy the intersections. Default is 0.05
+        :param previous_geometries: Geometries of the fractures that were replaced (e.g. by add_fractures). The
+         nodes on these geometries are also classified again
+        """
+
+        if self.nodes is None:
+            self.calculate_topology(clean_network=clean_network)
+            return
+
+        network_df = self._network_df
+        types = network_df['type'].values
+        active = self._active_mask
+        is_fracture = (types == 'fracture') & active
+        is_boundary = (types == 'boundary') & active
+
+        changed = (types == 'fracture') & network_df['f_set'].astype('int64').isin(sets).values
+        changed_rows = np.where(changed)[0]
+        active_changed = changed_rows[active[changed_rows]]
+
+        tree = self._spatial_index
+
+        not_noded = active_changed[~network_df['_noded'].values[active_changed]]
+
+        if clean_network and len(not_noded) > 0:
+            _, near_rows = tree.query(network_df.geometry.values[not_noded], predicate='dwithin', distance=buffer)
+            near = np.zeros(len(network_df), dtype=bool)
+            near[near_rows] = True
+            near[not_noded] = True
+            to_node = np.zeros(len(network_df), dtype=bool)
+            to_node[not_noded] = True
+
+            # The lines are sorted as in the components dataframe used by clean_network
+            rows = np.concatenate((self._mask_rows(near & is_fracture), self._mask_rows(near & is_boundary)))
+            lines_df = network_df.iloc[rows].copy()
+            lines_df['type'] = lines_df['type'].astype(str)
+
+            noded_df = Geometry._node_network(lines_df, buffer=buffer, lines=np.where(to_node[rows])[0])
+
+            network_df.iloc[rows, network_df.columns.get_loc('geometry')] = noded_df.geometry.values
+            network_df.iloc[not_noded, network_df.columns.get_loc('_noded')] = True
+            self._invalidate_views()
+
+        # Region of the changed fractures (active or not, before and after a replacement)
+        region = np.concatenate((network_df.geometry.values[changed_rows],
+                                 np.asarray(previous_geometries or [], dtype=object)))
+        region_points = shapely.get_coordinates(region)
+
+        nodes_df = self.nodes.entity_df
+        node_points = shapely.get_coordinates(nodes_df.geometry.values)
+        if len(region_points) > 0:
+            region_distance, _ = cKDTree(region_points).query(node_points, distance_upper_bound=self.tolerance)
+            keep = ~np.isfinite(region_distance)
+        else:
+            keep = np.ones(len(nodes_df), dtype=bool)
+
+        new_points = np.empty((0, 3))
+        new_classes = np.empty(0, dtype=int)
+        new_origins = np.empty((0, 2), dtype=np.int64)
+
+        _, near_rows = tree.query(region, predicate='dwithin', distance=self.tolerance)
+        near = np.zeros(len(network_df), dtype=bool)
+        near[near_rows] = True
+
+        fracture_rows = self._mask_rows(near & is_fracture)
+        if len(fracture_rows) > 0:
+            fractures_df = self._network_rows_df('fracture', near & is_fracture)
+            boundary_df = self._network_rows_df('boundary', near & is_boundary)
+            new_points, new_classes, new_origins, new_censored = Topology.region_nodes(fractures_df, boundary_df,
+                                                                                       region_points, self.tolerance)
+
+            # Censoring of the changed fractures
+            censored_column = network_df.columns.get_loc('censored')
+            network_df.iloc[active_changed, censored_column] = 0
+            censored_rows = fracture_rows[np.unique(new_censored[new_censored >= 0])]
+            network_df.iloc[censored_rows[changed[censored_rows]], censored_column] = 1
+            self._invalidate_views()
+
+        # Patch the nodes and sort them by point id in the fractures vtk object, as in nodes_conn
+        kept_origins = np.column_stack((nodes_df['n_origin1'].values, nodes_df['n_origin2'].values))[keep]
+        n_columns = max(new_origins.shape[1], 2)
+        new_origins = np.pad(new_origins, ((0, 0), (0, n_columns - new_origins.shape[1])), constant_values=-9999)
+        kept_origins = np.pad(kept_origins, ((0, 0), (0, n_columns - 2)), constant_values=-9999)
+
+        points_3d = np.zeros((int(keep.sum()), 3))
+        points_3d[:, :node_points.shape[1]] = node_points[keep]
+        node_points = np.concatenate((points_3d, new_points))
+        node_classes = np.concatenate((nodes_df['n_type'].values[keep], new_classes))
+        node_origins = np.concatenate((kept_origins, new_origins))
+
+        fractures_vtk = self.fractures.vtk_object
+        _, node_indexes = cKDTree(fractures_vtk.points).query(node_points)
+        order = np.argsort(node_indexes, kind='stable')
+
+        old_types = set(nodes_df['n_type'])
+        self.add_nodes_from_arrays(fractures_vtk.points[node_indexes[order]], node_classes[order],
+                                   node_indexes[order], node_origins[order])
+
+        # Empty the node types that are not present anymore
+        for node_type in old_types - set(node_classes):
+            self._add_component('node', node_type, nodes_df.iloc[:0])
 
     @property
     def fraction_censored(self) -> float:
@@ -1324,6 +1761,7 @@ class FractureNetwork(BaseEntity):
         :return:
         """
 
+        import fracability.Plotters as plts
         plts.vtkplot_frac_net(self,
                               markersize=markersize,
                               fracture_linewidth=fracture_linewidth,
@@ -1349,6 +1787,7 @@ class FractureNetwork(BaseEntity):
         :return:
         """
         if method == 'vtk':
+            import fracability.Plotters as plts
             plts.vtkplot_backbone(self,
                                   fracture_linewidth=fracture_linewidth,
                                   boundary_linewidth=boundary_linewidth,
@@ -1358,6 +1797,7 @@ class FractureNetwork(BaseEntity):
                                   show_plot=show_plot,
                                   notebook=notebook)
         elif method == 'matplot':
+            import fracability.Plotters as plts
             plts.matplot_backbone(self,
                                   fracture_linewidth,
                                   boundary_linewidth,
@@ -1387,6 +1827,7 @@ class FractureNetwork(BaseEntity):
         :param return_plot:
         :return:
         """
+        import fracability.Plotters as plts
         plts.matplot_frac_net(self,
                               markersize,
                               fracture_linewidth,
@@ -1402,6 +1843,7 @@ class FractureNetwork(BaseEntity):
         Method used to plot the ternary diagram of the fracture network
         :return:
         """
+        import fracability.Plotters as plts
         plts.matplot_ternary(self)
 
     #  ==================== Output methods ====================
@@ -1,3 +1,7 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 import numpy as np
 
 from numpy import exp
@@ -8,7 +12,28 @@ import scipy.stats as ss
 from scipy.optimize import minimize
 
 from fracability.utils.general_use import KM
-import fracability.Plotters as plotter
+from fracability.utils.fit_cache import FitCache
+from fracability.utils import profiling
+# fracability.Plotters (matplotlib, seaborn, ternary) is imported only in the plot methods
+
+
+def _fit_parameters(distribution_name: str, data) -> tuple:
+    """
+    Fit a scipy distribution on the data. Except for normal and logistic the location is fixed to 0.
+    This function is defined at module level so that it can be sent to worker processes.
+
+    :param distribution_name: Name of the scipy distribution
+    :param data: Data to fit (CensoredData or array of lengths)
+    :return: Tuple of fitted parameters
+    """
+    scipy_distribution = getattr(ss, distribution_name)
+
+    if distribution_name == 'norm' or distribution_name == 'logistic':
+        params = scipy_distribution.fit(data)
+    else:
+        params = scipy_distribution.fit(data, floc=0)
+
+    return params
 
 
 class NetworkData:
@@ -426,44 +451,64 @@ class NetworkDistribution:
         BIC = np.log(n)*k + LL2
         return BIC
 
-    @property
-    def KS_distance(self) -> float:
+    def gof_distances(self) -> tuple:
         """
-        Calcuate the Kolmogorov-Smirnov distance between the empirical and the fitted model
-        :return: Float. The KS distance
+        Calculate the Kolmogorov-Smirnov, Koziol and Green and Anderson-Darling distances between the empirical and the
+        fitted model. The three distances share a single evaluation of the fitted CDF on the data.
+        :return: Tuple of floats. The KS, KG and AD distances
 
         Notes
         ------
         Kim 2019, Tests based on EDF statistics for randomly censored normal
         distributions when parameters are unknown
         """
+        smallest_number = 10**-10
         Z = self.distribution.cdf(self.fit_data.lengths)
         G_n = self.fit_data.ecdf
         tot_n = self.fit_data.total_n_fractures
         delta = self.fit_data.delta
 
-        complete_list_index = np.where(delta == 1)[0]
-        diff_plus_list = []
-        diff_minus_list = []
+        Z_j1 = np.append(Z[1:], 1)  # Z at index j+1. After the last value (tot_n) Z_j1 is 1
 
-        for j in complete_list_index:
-            diff_plus = G_n[j] - Z[j]  # Calculate the positive difference at index j (DC+)
+        # Kolmogorov-Smirnov, calculated only on the complete values
+        complete = delta == 1
+        DCn_pos = np.max(G_n[complete] - Z[complete])  # positive differences (DC+)
+        DCn_neg = np.max(Z_j1[complete] - G_n[complete])  # negative differences (DC-)
 
-            if j + 1 > tot_n - 1:  # Check if j+1 (0 indexed) is bigger than the total number tot_n (1 indexed)
-                Z_j1 = 1
-            else:
-                Z_j1 = Z[j + 1]
+        DCn = max(DCn_pos, DCn_neg)
 
-            diff_minus = Z_j1 - G_n[j]  # Calculate the negative difference at index j (DC-)
-            diff_plus_list.append(diff_plus)
-            diff_minus_list.append(diff_minus)
+        # Koziol and Green
+        kg_sum = np.sum(G_n * (Z_j1 - Z) * (G_n - (Z_j1 + Z)))
 
-        DCn_pos = max(diff_plus_list)
-        DCn_neg = max(diff_minus_list)
+        psi_sq = (tot_n * kg_sum) + tot_n / 3
 
-        DCn = max(DCn_pos, DCn_neg)
+        # Anderson-Darling. Values of Z equal to 0 or 1 are moved by the smallest number to avoid 0 in ln(Z) and
+        # ln(1 - Z). Values in between are not clipped so that the distance is the same of the per sample definition.
+        Z = np.where(Z == 0, smallest_number, Z)
+        Z = np.where(Z == 1, 1 - smallest_number, Z)
+        ln_Z = ln(Z)
+        ln_1_Z = ln(1 - Z)
+
+        sum1 = np.sum((G_n[:-1] ** 2) * (-ln_1_Z[1:] + ln_Z[1:] + ln_1_Z[:-1] - ln_Z[:-1]))  # First sum
+        sum2 = np.sum(G_n[:-1] * (-ln_1_Z[1:] + ln_1_Z[:-1]))  # Second sum
 
-        return DCn
+        AC_sq = (tot_n * sum1) - (2 * tot_n * sum2) - (tot_n * ln_1_Z[-1]) - (tot_n * ln_Z[-1]) - tot_n
+
+        return DCn, psi_sq, AC_sq
+
+    @property
+    def KS_distance(self) -> float:
+        """
+        Calcuate the Kolmogorov-Smirnov distance between the empirical and the fitted model
+        :return: Float. The KS distance
+
+        Notes
+        ------
+        Kim 2019, Tests based on EDF statistics for randomly censored normal
+        distributions when parameters are unknown
+        """
+
+        return self.gof_distances()[0]
 
     @property
     def KS_rank(self):
@@ -483,22 +528,7 @@ class NetworkDistribution:
         distributions when parameters are unknown
         """
 
-        Z = self.distribution.cdf(self.fit_data.lengths)
-        G_n = self.fit_data.ecdf
-        tot_n = self.fit_data.total_n_fractures
-        kg_sum = 0
-
-        for j in range(tot_n):
-
-            if j + 1 > tot_n - 1:  # Check if j+1 (0 indexed) is bigger than the total number tot_n (1 indexed)
-                Z_j1 = 1
-            else:
-                Z_j1 = Z[j + 1]
-            kg_sum += G_n[j] * (Z_j1 - Z[j]) * (G_n[j] - (Z_j1 + Z[j]))
-
-        psi_sq = (tot_n * kg_sum) + tot_n / 3
-
-        return psi_sq
+        return self.gof_distances()[1]
 
     @property
     def KG_rank(self):
@@ -509,43 +539,16 @@ class NetworkDistribution:
     @property
     def AD_distance(self) -> float:
         """
-        Calcuate the Koziol and Green distance between the empirical and the fitted model
-        :return: Float. The KG distance
+        Calcuate the Anderson-Darling distance between the empirical and the fitted model
+        :return: Float. The AD distance
 
         Notes
         ------
         Kim 2019, Tests based on EDF statistics for randomly censored normal
         distributions when parameters are unknown
         """
-        smallest_number = 10**-10
-        Z = self.distribution.cdf(self.fit_data.lengths)
-        G_n = self.fit_data.ecdf
-        tot_n = self.fit_data.total_n_fractures
-
-        sum1 = 0  # First sum
-        sum2 = 0  # Second sum
-        if Z[-1] == 1:
-            Z[-1] -= smallest_number  # this is to avoid 0 in ln(1 - Z[-1])
-        elif Z[-1] == 0:
-            Z[-1] += smallest_number  # this is to avoid 0 in ln(Z[-1])
-        for j in range(tot_n - 1):
-
-            if Z[j + 1] == 0:
-                Z[j + 1] += smallest_number  # this is to avoid 0 in ln(Z[j + 1])
-            elif Z[j + 1] == 1:
-                Z[j + 1] -= smallest_number  # this is to avoid 0 in ln(1 - Z[j + 1])
-
-            if Z[j] == 0:
-                Z[j] += smallest_number  # this is to avoid 0 in ln(Z[j])
-            elif Z[j] == 1:
-                Z[j] -= smallest_number  # this is to avoid 0 in ln(1 - Z[j])
-
-            sum1 += (G_n[j] ** 2) * (-ln(1 - Z[j + 1]) + ln(Z[j + 1]) + ln(1 - Z[j]) - ln(Z[j]))
-            sum2 += G_n[j] * (-ln(1 - Z[j + 1]) + ln(1 - Z[j]))
 
-        AC_sq = (tot_n * sum1) - (2 * tot_n * sum2) - (tot_n * ln(1 - Z[-1])) - (tot_n * ln(Z[-1])) - tot_n
-
-        return AC_sq
+        return self.gof_distances()[2]
 
     @property
     def AD_rank(self):
@@ -570,13 +573,15 @@ class NetworkFitter:
     :param complete_only: Boolean flag to use only complete measurements (True) or all the dataset (False). This flag is used only when use_survival is False. Default is False.
     :param use_AIC: Boolean flag to use AIC (True) or AICc (False) for model selection. Default is True. The
     column name in the dataframe will remain the same (Akaike).
+    :param fit_cache: Optional FitCache object (or path of the cache directory) used to store and reuse the fitted
+    parameters and metrics. Default is None (no cache).
 
     Add bool to:
         + Consider censored lengths as non-censored
         + Do not consider censored lengths at all
 
     """
-    def __init__(self, obj=None, use_survival=True, complete_only=False, use_AIC=True):
+    def __init__(self, obj=None, use_survival=True, complete_only=False, use_AIC=True, fit_cache=None):
 
         self._net_data: NetworkData
         self._accepted_fit: list = []
@@ -590,6 +595,10 @@ class NetworkFitter:
                                                             'KG_rank', 'AD_rank',
                                                             'Mean_rank', 'distribution'])
 
+        if isinstance(fit_cache, str):
+            fit_cache = FitCache(fit_cache)
+        self._fit_cache: FitCache = fit_cache
+
         self.network_data = NetworkData(obj, use_survival, complete_only)
 
     @property
@@ -604,6 +613,7 @@ class NetworkFitter:
     def network_data(self, data: NetworkData):
         self._net_data = data
 
+    @profiling.profiled('NetworkFitter.fit')
     def fit(self, distribution_name: str):
 
         """
@@ -611,44 +621,136 @@ class NetworkFitter:
         :param distribution_name: Name of the distribution to fit
         :return:
         """
-        print(f'Fitting {distribution_name} on data')
-        last_pos = len(self._fit_dataframe)  # The position of a new entry in the dataframe will be the last (i.e. the length of the dataframe)
+        cached = self._get_cached_fit(distribution_name)
+        profiling.add_items(len(self.network_data.data))
 
-        self._fit_dataframe.loc[last_pos, 'name'] = distribution_name
+        if cached is None:
+            print(f'Fitting {distribution_name} on data')
+            params = _fit_parameters(distribution_name, self.network_data.data)
+            self._add_fits([distribution_name], [params])
+        else:
+            print(f'Loading {distribution_name} fit from cache')
+            params, metrics = cached
+            self._add_fits([distribution_name], [params], [metrics])
 
-        scipy_distribution = getattr(ss, distribution_name)
+    @profiling.profiled('NetworkFitter.fit_many')
+    def fit_many(self, distribution_names: list, n_jobs: int = None):
 
-        if distribution_name == 'norm' or distribution_name == 'logistic':
-            params = scipy_distribution.fit(self.network_data.data)
-        else:
-            params = scipy_distribution.fit(self.network_data.data, floc=0)
+        """
+        Fit the data of the entity_df using many scipy available distributions. The scipy fits are dispatched to a pool
+        of processes and the fit records are updated once at the end.
+        :param distribution_names: List of names of the distributions to fit
+        :param n_jobs: Number of worker processes. If None all the available cpus are used, if 1 the distributions
+         are fitted serially in the current process. Default is None
+        :return:
+
+        Notes
+        -------
+        On Windows and macOS the worker processes are spawned, so scripts calling this method must be protected with
+        an if __name__ == '__main__' block. Distributions found in the fit cache are not fitted again.
+        """
+        distribution_names = list(distribution_names)
+        data = self.network_data.data
+        profiling.add_items(len(data)*len(distribution_names))
+
+        params_list = [None] * len(distribution_names)
+        metrics_list = [None] * len(distribution_names)
 
-        distribution = NetworkDistribution(parent=self, obj=scipy_distribution,
-                                           parameters=params, fit_data=self.network_data)
+        for i, distribution_name in enumerate(distribution_names):
+            cached = self._get_cached_fit(distribution_name)
+            if cached is None:
+                print(f'Fitting {distribution_name} on data')
+            else:
+                print(f'Loading {distribution_name} fit from cache')
+                params_list[i], metrics_list[i] = cached
 
-        if self._AIC_flag:
-            akaike = distribution.AIC
+        to_fit = [i for i, params in enumerate(params_list) if params is None]
+        names_to_fit = [distribution_names[i] for i in to_fit]
+
+        if n_jobs == 1 or len(names_to_fit) <= 1:
+            fitted_list = [_fit_parameters(distribution_name, data) for distribution_name in names_to_fit]
         else:
-            akaike = distribution.AICc
+            n_workers = min(n_jobs or os.cpu_count(), len(names_to_fit))
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                fitted_list = list(executor.map(_fit_parameters, names_to_fit, repeat(data)))
+
+        for i, params in zip(to_fit, fitted_list):
+            params_list[i] = params
+
+        self._add_fits(distribution_names, params_list, metrics_list)
+
+    def _get_cached_fit(self, distribution_name: str):
+        """
+        Get the fitted parameters and metrics of a distribution from the fit cache.
+        :param distribution_name: Name of the distribution
+        :return: Tuple of (parameters, dictionary of metrics) or None if there is no cache or the fit is not cached
+        """
+        if self._fit_cache is None:
+            return None
+
+        return self._fit_cache.get(self._fit_cache.key(self.network_data, distribution_name))
+
+    def _add_fits(self, distribution_names: list, params_list: list, metrics_list: list = None):
+        """
+        Add the fitted distributions to the fit records dataframe and update the Akaike weights and the ranks.
+        :param distribution_names: List of names of the fitted distributions
+        :param params_list: List of fitted parameters, in the same order of distribution_names
+        :param metrics_list: Optional list of dictionaries of cached metrics (see FitCache.metric_names), in the same
+        order of distribution_names. If an item is None the metrics are calculated and saved in the fit cache.
+        """
+
+        if metrics_list is None:
+            metrics_list = [None] * len(distribution_names)
+
+        records = []
+
+        for distribution_name, params, metrics in zip(distribution_names, params_list, metrics_list):
+            scipy_distribution = getattr(ss, distribution_name)
+
+            distribution = NetworkDistribution(parent=self, obj=scipy_distribution,
+                                               parameters=params, fit_data=self.network_data)
+
+            if metrics is None:
+                KS_distance, KG_distance, AD_distance = distribution.gof_distances()
 
-        self._fit_dataframe.loc[last_pos, 'Akaike'] = akaike
+                metrics = {'max_log_likelihood': distribution.max_log_likelihood,
+                           'AIC': distribution.AIC, 'AICc': distribution.AICc,
+                           'KS_distance': KS_distance, 'KG_distance': KG_distance, 'AD_distance': AD_distance}
 
-        log_likelihood = distribution.max_log_likelihood
+                if self._fit_cache is not None:
+                    self._fit_cache.put(self._fit_cache.key(self.network_data, distribution_name), params, metrics)
 
-        self._fit_dataframe.loc[last_pos, 'max_log_likelihood'] = log_likelihood
-        for i, AIC_val in enumerate(self._fit_dataframe['Akaike']):
-            d_i = AIC_val - min(self._fit_dataframe['Akaike'])
-            self._fit_dataframe.loc[i, 'delta_i'] = d_i
-        delta_values = (-self._fit_dataframe['delta_i'].values/2).astype(float)
-        total = exp(delta_values).sum()
+            if self._AIC_flag:
+                akaike = metrics['AIC']
+            else:
+                akaike = metrics['AICc']
+
+            records.append({'name': distribution_name, 'Akaike': akaike,
+                            'max_log_likelihood': metrics['max_log_likelihood'],
+                            'KS_distance': metrics['KS_distance'], 'KG_distance': metrics['KG_distance'],
+                            'AD_distance': metrics['AD_distance'],
+                            'distribution': distribution})
+
+        new_df = DataFrame(records, columns=self._fit_dataframe.columns)
 
-        for d, delta_i in enumerate(self._fit_dataframe['delta_i']):
-            w_i = np.round(exp(-delta_i/2)/total, 5)
-            self._fit_dataframe.loc[d, 'w_i'] = w_i
+        if self._fit_dataframe.empty:
+            self._fit_dataframe = new_df
+        else:
+            self._fit_dataframe = pd.concat([self._fit_dataframe, new_df], ignore_index=True)
 
-        self._fit_dataframe.loc[last_pos, 'KS_distance'] = distribution.KS_distance
-        self._fit_dataframe.loc[last_pos, 'KG_distance'] = distribution.KG_distance
-        self._fit_dataframe.loc[last_pos, 'AD_distance'] = distribution.AD_distance
+        self._rank_fits()
+
+    def _rank_fits(self):
+        """
+        Calculate the Akaike differences (delta_i) and weights (w_i) and the ranks of all the fit records.
+        """
+        akaike = self._fit_dataframe['Akaike'].values.astype(float)
+
+        delta_i = akaike - akaike.min()
+        total = exp(-delta_i/2).sum()
+
+        self._fit_dataframe['delta_i'] = delta_i
+        self._fit_dataframe['w_i'] = np.round(exp(-delta_i/2)/total, 5)
 
         self._fit_dataframe['Akaike_rank'] = ss.rankdata(self._fit_dataframe['Akaike']).astype(int)
         self._fit_dataframe['KS_rank'] = ss.rankdata(self._fit_dataframe['KS_distance']).astype(int)
@@ -656,10 +758,6 @@ class NetworkFitter:
         self._fit_dataframe['AD_rank'] = ss.rankdata(self._fit_dataframe['AD_distance']).astype(int)
         self._fit_dataframe['Mean_rank'] = self._fit_dataframe.iloc[:, 8:12].mean(axis=1)
 
-        self._fit_dataframe.loc[last_pos, 'distribution'] = distribution
-
-        # self._fit_dataframe.loc[last_pos, 'params'] = params  # this gives out an error for setting the df, I do not know why
-
     def fit_records(self, sort_by='Akaike') -> DataFrame:
 
         """ Return the sorted fit dataframe"""
@@ -768,6 +866,7 @@ class NetworkFitter:
         :return:
         """
 
+        import fracability.Plotters as plotter
         plotter.matplot_stats_uniform(self, show_plot, position, sort_by, bw, second_axis, n_ticks)
 
     def tick_plot(self, show_plot: bool = True,
@@ -782,6 +881,7 @@ class NetworkFitter:
         :return:
         """
 
+        import fracability.Plotters as plotter
         plotter.matplot_tick_plot(self, show_plot=show_plot, position=position, n_ticks=n_ticks, sort_by=sort_by)
 
     def plot_summary(self, show_plot:bool = True, position: list = None, sort_by: str = 'Akaike'):
@@ -793,6 +893,7 @@ class NetworkFitter:
         :return:
         """
 
+        import fracability.Plotters as plotter
         plotter.matplot_stats_summary(self, show_plot=show_plot, position=position, sort_by=sort_by)
 
     # ====================== Export ==========================
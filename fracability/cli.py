@@ -0,0 +1,261 @@
+"""
+Command line interface used to analyse many interpretation datasets without writing a script for each one.
+
+A dataset is a directory with one shapefile for each fracture set (Set_*.shp, numbered following the sorted file
+names) and an Interpretation_boundary.shp file, as in the example datasets. The datasets are found by walking the
+given directories or are listed in a JSON manifest:
+
+    [{"name": "salza", "sets": ["salza/Set_1.shp", "salza/Set_2.shp"], "boundary": "salza/Interpretation_boundary.shp"}]
+
+(relative paths are relative to the manifest). Each dataset is analysed in a worker process: the network is cleaned,
+the topology is calculated and the chosen distributions are fitted on each set. The results are written in
+<output>/<name>:
+
+    + nodes.csv: nodes of the network
+    + fractures.csv: fractures with the censoring flag
+    + fit_records.csv: fit records of each set
+    + summary.csv: node counts, connectivity, length statistics and best fit of each set
+
+The inputs and the options of each analysis are fingerprinted and the datasets whose fingerprint did not change are
+skipped (use --force to analyse them again).
+
+Usage:
+
+    fracability path/to/interpretations --output results --fits lognorm expon gamma --n-jobs 4
+    python -m fracability --manifest datasets.json --output results
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import fracability
+from fracability.utils import progress
+
+BOUNDARY_NAME = 'Interpretation_boundary.shp'
+SET_PATTERN = 'Set_*.shp'
+SHP_SIDECARS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+FINGERPRINT_NAME = 'fingerprint.json'
+
+
+def find_datasets(root: str) -> list:
+    """
+    Find the datasets in a directory tree.
+
+    :param root: Root directory
+    :return: List of dicts with name (path relative to the root, or the root name if the root is a dataset), sets
+             (sorted list of set shapefiles) and boundary (boundary shapefile)
+    """
+    datasets = []
+    root = os.path.abspath(root)
+    for directory, sub_directories, _ in os.walk(root):
+        sub_directories.sort()
+        boundary = os.path.join(directory, BOUNDARY_NAME)
+        sets = sorted(glob.glob(os.path.join(directory, SET_PATTERN)))
+        if os.path.isfile(boundary) and sets:
+            name = os.path.relpath(directory, root)
+            name = os.path.basename(root) if name == '.' else name
+            datasets.append({'name': name, 'sets': sets, 'boundary': boundary})
+
+    return datasets
+
+
+def read_manifest(path: str) -> list:
+    """
+    Read the datasets listed in a JSON manifest.
+
+    :param path: Path of the manifest
+    :return: List of dicts with name, sets and boundary (absolute paths)
+    """
+    with open(path) as f:
+        entries = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    datasets = []
+    for entry in entries:
+        datasets.append({'name': entry['name'],
+                         'sets': [os.path.join(base, set_path) for set_path in entry['sets']],
+                         'boundary': os.path.join(base, entry['boundary'])})
+
+    return datasets
+
+
+def fingerprint(dataset: dict, options: dict) -> str:
+    """
+    Fingerprint of the inputs of a dataset (content of the shapefiles and of their sidecar files) and of the analysis
+    options.
+
+    :param dataset: Dict with the sets and boundary paths
+    :param options: Dict of the analysis options
+    :return: Hexadecimal string of the fingerprint
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(fracability.__version__.encode())
+
+    for shp_path in dataset['sets'] + [dataset['boundary']]:
+        digest.update(os.path.basename(shp_path).encode())
+        stem = os.path.splitext(shp_path)[0]
+        for extension in SHP_SIDECARS:
+            if os.path.isfile(stem + extension):
+                with open(stem + extension, 'rb') as f:
+                    for chunk in iter(lambda: f.read(2**20), b''):
+                        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def analyse_dataset(dataset: dict, output_dir: str, options: dict) -> dict:
+    """
+    Analyse a dataset and write the results in the output directory.
+
+    :param dataset: Dict with the sets and boundary paths
+    :param output_dir: Output directory of the dataset
+    :param options: Dict with the fits list, the buffer of the cleaning and the tile_size of the topology
+    :return: Dict with the number of fractures and nodes of the dataset
+    """
+    from fracability import Entities, Statistics
+
+    progress.set_callback(None)  # the main process reports the completed datasets
+
+    fracture_net = Entities.FractureNetwork()
+    set_files = {}
+    for set_n, set_path in enumerate(dataset['sets'], start=1):
+        fracture_net.add_fractures(Entities.Fractures(shp=set_path, set_n=set_n))
+        set_files[set_n] = os.path.basename(set_path)
+    fracture_net.add_boundaries(Entities.Boundary(shp=dataset['boundary'], group_n=1))
+
+    fracture_net.clean_network(buffer=options['buffer'])
+    fracture_net.calculate_topology(clean_network=False, tile_size=options['tile_size'], n_jobs=1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    fracture_net.nodes.entity_df.to_csv(os.path.join(output_dir, 'nodes.csv'), index=False)
+    fracture_net.fractures.entity_df.to_csv(os.path.join(output_dir, 'fractures.csv'), index=False)
+
+    _, _, summary = fracture_net.set_interaction_matrix()
+    summary.insert(0, 'set_file', [set_files.get(set_n) for set_n in summary.index])
+
+    fractures_df = fracture_net.fractures.entity_df
+    length_stats = fractures_df.assign(censored=fractures_df['censored'] == 1).groupby('f_set').agg(
+        n_fractures=('length', 'size'), n_censored=('censored', 'sum'), total_length=('length', 'sum'),
+        mean_length=('length', 'mean'))
+    summary = summary.join(length_stats)
+    summary.index.name = 'f_set'
+
+    fit_records = []
+    for set_n in summary.index:
+        set_df = fractures_df.loc[fractures_df['f_set'] == set_n]
+        if options['fits']:
+            fitter = Statistics.NetworkFitter(Entities.Fractures(gdf=set_df.copy(), set_n=set_n))
+            fitter.fit_many(options['fits'], n_jobs=1)
+            records = fitter.fit_records().drop(columns='distribution')
+            records.insert(0, 'f_set', set_n)
+            fit_records.append(records)
+            summary.loc[set_n, 'best_fit'] = records['name'].iloc[0]
+
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'))
+    if fit_records:
+        pd.concat(fit_records, ignore_index=True).to_csv(os.path.join(output_dir, 'fit_records.csv'), index=False)
+
+    return {'n_fractures': len(fractures_df), 'n_nodes': len(fracture_net.nodes.entity_df)}
+
+
+def run_batch(datasets: list, output: str, options: dict, n_jobs: int = None, force: bool = False) -> dict:
+    """
+    Analyse many datasets in a pool of worker processes (one dataset for each task). The datasets whose fingerprint
+    matches the one stored in the output directory are skipped.
+
+    :param datasets: List of dicts with name, sets and boundary
+    :param output: Output root directory
+    :param options: Dict of the analysis options (see analyse_dataset)
+    :param n_jobs: Number of worker processes. If None all the available cpus are used
+    :param force: Analyse all the datasets, also the unchanged ones
+    :return: Dict of name: status (skipped, done or the error message)
+    """
+    status = {}
+    to_run = []
+    for dataset in datasets:
+        output_dir = os.path.join(output, dataset['name'])
+        dataset_fingerprint = fingerprint(dataset, options)
+        fingerprint_path = os.path.join(output_dir, FINGERPRINT_NAME)
+
+        if not force and os.path.isfile(fingerprint_path):
+            with open(fingerprint_path) as f:
+                if json.load(f).get('fingerprint') == dataset_fingerprint:
+                    status[dataset['name']] = 'skipped'
+                    continue
+
+        to_run.append((dataset, output_dir, dataset_fingerprint))
+
+    if not to_run:
+        return status
+
+    n_workers = min(n_jobs or os.cpu_count(), len(to_run))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(analyse_dataset, dataset, output_dir, options): (dataset, output_dir, key)
+                   for dataset, output_dir, key in to_run}
+
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            dataset, output_dir, dataset_fingerprint = futures[future]
+            try:
+                result = future.result()
+            except (Exception, SystemExit) as error:  # a dataset calling exit() must not stop the batch
+                status[dataset['name']] = f'{type(error).__name__}: {error}'
+            else:
+                with open(os.path.join(output_dir, FINGERPRINT_NAME), 'w') as f:
+                    json.dump({'fingerprint': dataset_fingerprint, 'options': options, **result}, f, indent=2)
+                status[dataset['name']] = 'done'
+            progress.report('Analysing datasets', n_done, len(to_run))
+
+    return status
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='fracability',
+                                     description='Clean, calculate the topology and fit the length distributions of '
+                                                 'many interpretation datasets')
+    parser.add_argument('inputs', nargs='*', help='Directories searched for datasets (Set_*.shp and '
+                                                  f'{BOUNDARY_NAME})')
+    parser.add_argument('--manifest', default=None, help='JSON file listing the datasets')
+    parser.add_argument('--output', '-o', default='fracability_output', help='Output directory. Default is '
+                                                                              'fracability_output')
+    parser.add_argument('--fits', nargs='*', default=['lognorm'],
+                        help='Names of the scipy distributions to fit on each set. Default is lognorm')
+    parser.add_argument('--buffer', type=float, default=0.05, help='Buffer of the network cleaning. Default is 0.05')
+    parser.add_argument('--tile-size', type=float, default=None,
+                        help='Tile size used to classify the nodes of each dataset')
+    parser.add_argument('--n-jobs', '-j', type=int, default=None,
+                        help='Number of datasets analysed in parallel. Default is the number of cpus')
+    parser.add_argument('--force', action='store_true', help='Analyse also the datasets that did not change')
+    parser.add_argument('--quiet', '-q', action='store_true', help='Do not report the progress')
+    args = parser.parse_args(argv)
+
+    datasets = []
+    for root in args.inputs:
+        datasets += find_datasets(root)
+    if args.manifest is not None:
+        datasets += read_manifest(args.manifest)
+
+    if not datasets:
+        parser.error('No datasets found')
+
+    if args.quiet:
+        progress.set_callback(None)
+
+    options = {'fits': args.fits, 'buffer': args.buffer, 'tile_size': args.tile_size}
+    status = run_batch(datasets, args.output, options, n_jobs=args.n_jobs, force=args.force)
+
+    failed = {name: message for name, message in status.items() if message not in ('done', 'skipped')}
+    if not args.quiet:
+        for name in sorted(status):
+            print(f'{name}: {status[name] if name not in failed else "failed"}')
+    for name, message in failed.items():
+        print(f'{name} failed:\n{message}', file=sys.stderr)
+
+    return 1 if failed else 0
@@ -0,0 +1,74 @@
+import numpy as np
+from geopandas import GeoDataFrame
+from pandas import DataFrame
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from shapely import get_coordinates
+
+from fracability.utils.general_use import weld_points
+
+
+def cluster_labels(gdf: GeoDataFrame, tolerance: float = 1e-5) -> np.ndarray:
+    """
+    Label the clusters of connected fractures of a GeoDataFrame. Two fractures are connected if they share a point,
+    i.e. if they have two vertices closer than the tolerance (the same points welded in the vtk objects).
+
+    The clusters are the connected components of the graph of the fracture-point incidence, calculated in a single
+    pass with scipy.sparse.csgraph.connected_components. The clusters are numbered by decreasing number of
+    fractures (cluster 0 is the biggest region), ties are sorted by the position of the first fracture.
+
+    :param gdf: GeoDataFrame of fractures
+    :param tolerance: Distance under which two vertices are considered the same point. Default is 1e-5
+    :return: Array with the cluster of each row of the GeoDataFrame (-1 for empty geometries)
+    """
+
+    n_lines = len(gdf)
+    coords, geom_index = get_coordinates(gdf.geometry.values, return_index=True)
+
+    if len(coords) == 0:
+        return np.full(n_lines, -1)
+
+    point_ids = weld_points(coords, tolerance)
+
+    # Bipartite graph of fractures (0:n_lines) and points (n_lines:n_lines+n_points)
+    n_nodes = n_lines + len(coords)
+    graph = coo_matrix((np.ones(len(coords), dtype=bool), (geom_index, n_lines + point_ids)), shape=(n_nodes, n_nodes))
+    _, labels = connected_components(graph, directed=False)
+    labels = labels[:n_lines]
+
+    # Renumber the clusters by decreasing size
+    cluster_ids, first_line, inverse, counts = np.unique(labels, return_index=True, return_inverse=True,
+                                                         return_counts=True)
+    order = np.lexsort((first_line, -counts))
+    rank = np.empty(len(cluster_ids), dtype=int)
+    rank[order] = np.arange(len(cluster_ids))
+    labels = rank[inverse.ravel()]
+
+    empty = np.bincount(geom_index, minlength=n_lines) == 0
+    labels[empty] = -1
+
+    return labels
+
+
+def cluster_report(gdf: GeoDataFrame, labels: np.ndarray) -> DataFrame:
+    """
+    Summarize the clusters of a GeoDataFrame of fractures.
+
+    :param gdf: GeoDataFrame of fractures
+    :param labels: Cluster of each row of the GeoDataFrame (as returned by cluster_labels)
+    :return: DataFrame indexed by cluster with the number of fractures (n_fractures), the total length (length) and
+             the spatial extent (xmin, ymin, xmax, ymax) of each cluster
+    """
+
+    bounds = gdf.geometry.bounds
+    clusters_df = DataFrame({'cluster': labels,
+                             'length': gdf.geometry.length.values,
+                             'xmin': bounds['minx'].values, 'ymin': bounds['miny'].values,
+                             'xmax': bounds['maxx'].values, 'ymax': bounds['maxy'].values})
+    clusters_df = clusters_df.loc[clusters_df['cluster'] >= 0]
+
+    report = clusters_df.groupby('cluster').agg(n_fractures=('length', 'size'), length=('length', 'sum'),
+                                                xmin=('xmin', 'min'), ymin=('ymin', 'min'),
+                                                xmax=('xmax', 'max'), ymax=('ymax', 'max'))
+
+    return report
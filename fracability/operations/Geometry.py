@@ -1,32 +1,257 @@
 from copy import deepcopy
 
+import numpy as np
+import shapely
+from geopandas import GeoDataFrame, GeoSeries
 from pyvista import PolyData
-from vtkmodules.vtkFiltersCore import vtkCleanPolyData
+from shapely import STRtree
+from vtkmodules.util.numpy_support import vtk_to_numpy
 
 from fracability.AbstractClasses import BaseEntity
+from fracability.utils import profiling, progress
+from fracability.utils.general_use import weld_cells, cells_to_polydata
 from fracability.utils.shp_operations import int_node
 
-def connect_dots(vtk_obj: PolyData) -> PolyData:
+def connect_dots(vtk_obj: PolyData, tolerance: float = 1e-5) -> PolyData:
 
-    """Method used to clean intersection in vtk objects (for example merge two overlapping nodes)"""
+    """Method used to clean intersection in vtk objects (for example merge two overlapping nodes). Points of the
+    vertices and lines closer than the tolerance (in map units) are welded in a single point."""
 
-    p = 100000  # Scaling factor needed for the vtk function to work properly
-    vtk_obj.points *= p
-    clean = vtkCleanPolyData()
-    clean.AddInputData(vtk_obj)
-    clean.ToleranceIsAbsoluteOn()
-    clean.ConvertLinesToPointsOff()
-    clean.ConvertPolysToLinesOff()
-    clean.ConvertStripsToPolysOff()
-    clean.Update()
+    points = vtk_obj.points
+    cell_arrays = [vtk_obj.GetVerts(), vtk_obj.GetLines()]
 
-    output_obj = PolyData(clean.GetOutput())
-    output_obj.points /= p  # Rescale back the points
+    # Vertices and lines are welded together, following the vtk cell order (vertices first)
+    offsets = [vtk_to_numpy(cells.GetOffsetsArray()) for cells in cell_arrays]
+    cell_sizes = np.concatenate([np.diff(offset) for offset in offsets])
+    point_ids = np.concatenate([vtk_to_numpy(cells.GetConnectivityArray()) for cells in cell_arrays])
+    cell_index = np.repeat(np.arange(len(cell_sizes)), cell_sizes)
+
+    vertex_index, new_offsets, connectivity, valid_cells = weld_cells(points[point_ids], cell_index,
+                                                                      len(cell_sizes), tolerance)
+
+    output_obj, cell_order = cells_to_polydata(points[point_ids[vertex_index]], new_offsets, connectivity,
+                                               cell_sizes, valid_cells)
+
+    for array in vtk_obj.point_data.keys():
+        output_obj.point_data[array] = vtk_obj.point_data[array][point_ids[vertex_index]]
+    for array in vtk_obj.cell_data.keys():
+        output_obj.cell_data[array] = vtk_obj.cell_data[array][cell_order]
 
     return output_obj
 
 
-#@Halo(text='Calculating intersections', spinner='line', placement='right')
+def validate_geometries(gdf: GeoDataFrame, tolerance: float = 0.000001) -> GeoDataFrame:
+
+    """Validation engine used to find the geometries of a fracture (or fracture network) dataframe that need to be
+    fixed. The following problems are reported:
+
+        + empty: missing or empty geometries
+        + multiline: MultiLineString geometries
+        + repeated_points: geometries with consecutive points closer than the tolerance
+        + overlap: fractures overlapping another geometry of the dataframe
+        + boundary_int: geometries crossing a boundary (i.e. intersecting the boundary without just touching it)
+
+    The validity checks are vectorized and all the overlaps and intersections are found with a single bulk query on
+    a STRtree of the geometries.
+
+    :param gdf: GeoDataFrame of fractures and boundaries. If the type column is missing all the geometries are
+                considered fractures
+    :param tolerance: Distance under which two consecutive points are considered repeated
+    :return: Report GeoDataFrame with one row for each problem. The og_line_id column identifies the geometry with the
+             problem and the other_id column the geometry causing it (-9999 for problems of the single geometry)
+    """
+
+    gdf = gdf.reset_index(drop=True)
+    geometries = np.array(gdf.geometry.values, dtype=object)
+    geometries[gdf.geometry.isna().values] = None
+
+    types = gdf['type'].astype(str).values if 'type' in gdf.columns else np.full(len(gdf), 'fracture')
+    og_ids = gdf['og_line_id'].values if 'og_line_id' in gdf.columns else np.arange(len(gdf))
+
+    empty = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+    multiline = shapely.get_type_id(geometries) == shapely.GeometryType.MULTILINESTRING
+    repeated = (shapely.get_num_coordinates(geometries) !=
+                shapely.get_num_coordinates(shapely.remove_repeated_points(geometries, tolerance)))
+
+    tree = STRtree(geometries)
+
+    # Overlaps of the fractures with any other geometry
+    fracture_index = np.where(types != 'boundary')[0]
+    overlap_index, overlap_other = tree.query(geometries[fracture_index], predicate='overlaps')
+    overlap_index = fracture_index[overlap_index]
+    order = np.lexsort((overlap_other, overlap_index))
+    overlap_index, overlap_other = overlap_index[order], overlap_other[order]
+
+    # Geometries that intersect the boundaries without touching them
+    boundary_index = np.where(types == 'boundary')[0]
+    boundary_other, crossing_index = tree.query(geometries[boundary_index], predicate='intersects')
+    boundary_other = boundary_index[boundary_other]
+    crossing = ((crossing_index != boundary_other) &
+                ~shapely.touches(geometries[crossing_index], geometries[boundary_other]))
+    crossing_index, boundary_other = crossing_index[crossing], boundary_other[crossing]
+    order = np.lexsort((crossing_index, boundary_other))  # grouped by boundary
+    crossing_index, boundary_other = crossing_index[order], boundary_other[order]
+
+    problems = {'empty': (np.where(empty)[0], None),
+                'multiline': (np.where(multiline)[0], None),
+                'repeated_points': (np.where(repeated & ~empty)[0], None),
+                'overlap': (overlap_index, overlap_other),
+                'boundary_int': (crossing_index, boundary_other)}
+
+    index_list = []
+    other_list = []
+    problem_list = []
+    for problem, (index, other) in problems.items():
+        index_list.append(index)
+        other_list.append(np.full(len(index), -1) if other is None else other)
+        problem_list.append(np.full(len(index), problem, dtype=object))
+
+    index = np.concatenate(index_list).astype(int)
+    other = np.concatenate(other_list).astype(int)
+
+    report_dict = {'og_line_id': og_ids[index], 'type': types[index]}
+    if 'f_set' in gdf.columns:
+        report_dict['f_set'] = gdf['f_set'].values[index]
+    report_dict['problem'] = np.concatenate(problem_list)
+    report_dict['other_id'] = np.where(other >= 0, og_ids[other], -9999)
+    report_dict['geometry'] = geometries[index]
+
+    return GeoDataFrame(report_dict, geometry='geometry', crs=gdf.crs)
+
+
+def window_lengths(geometries: np.ndarray, censored: np.ndarray, window) -> tuple:
+    """
+    Clip the fracture traces with a sampling window and get the lengths and censoring of the clipped traces. Traces
+    that leave the window are split in their parts inside the window, each part is a trace truncated by the window
+    edge and so is censored. Traces completely inside the window keep their censoring.
+
+    This function is defined at module level so that it can be sent to worker processes.
+
+    :param geometries: Array of the traces intersecting the window
+    :param censored: Array of the censored flags of the traces
+    :param window: Polygon of the sampling window
+    :return: Tuple of numpy arrays with the lengths (rounded to the 4th decimal point) and the censored flags of the
+             clipped traces
+    """
+    geometries = np.asarray(geometries, dtype=object)
+
+    clipped = shapely.intersection(geometries, window)
+    parts, trace_index = shapely.get_parts(clipped, return_index=True)
+
+    lengths = np.round(shapely.length(parts), 4)
+    truncated = ~shapely.within(geometries, window)
+    part_censored = (np.asarray(censored)[trace_index].astype(bool) | truncated[trace_index]).astype(int)
+
+    valid = (shapely.get_type_id(parts) == shapely.GeometryType.LINESTRING) & (lengths > 0)
+
+    return lengths[valid], part_censored[valid]
+
+
+def _candidate_pairs(gdf, buffer: float = 0.05, boundary_only: bool = False, lines: np.ndarray = None) -> tuple:
+    """
+    Find the (line1, line2) pairs to be noded, i.e. the pairs in which the buffer of line2 intersects line1. The pairs
+    are found with a single bulk query on a STRtree of the buffered geometries and are sorted in the order of the
+    original fracture by fracture loop (increasing position of the first line and then of the second line).
+
+    :param gdf: GeoDataFrame of fractures (and boundaries)
+    :param buffer: Applied buffer to the geometries to ensure intersection in a given radius.
+    :param boundary_only: Keep only the pairs between fractures and boundaries
+    :param lines: Positions of the lines to be noded. If given only the pairs involving at least one of these lines
+                  are kept
+    :return: Tuple of the positions of line1 and line2 in the GeoDataFrame
+    """
+
+    types = gdf['type'].values
+
+    tree = STRtree(gdf.buffer(buffer).values)
+    line1_idx, line2_idx = tree.query(np.asarray(gdf.geometry.values, dtype=object), predicate='intersects')
+
+    mask = (line1_idx != line2_idx) & (types[line1_idx] != 'boundary')
+    if boundary_only:
+        mask &= types[line2_idx] == 'boundary'
+    if lines is not None:
+        mask &= np.isin(line1_idx, lines) | np.isin(line2_idx, lines)
+
+    line1_idx, line2_idx = line1_idx[mask], line2_idx[mask]
+    order = np.lexsort((line2_idx, line1_idx))
+
+    return line1_idx[order], line2_idx[order]
+
+
+def _node_pairs(geometries: np.ndarray, line1_idx: np.ndarray, line2_idx: np.ndarray, gdf) -> np.ndarray:
+    """
+    Add the intersection nodes with int_node visiting the sorted (line1, line2) pairs on an in-memory array of
+    geometries. The progress of the noding is reported with utils.progress.
+
+    :param geometries: Array of the original geometries
+    :param line1_idx: Positions of line1 in the array, sorted as returned by _candidate_pairs
+    :param line2_idx: Positions of line2 in the array
+    :param gdf: GeoDataFrame with the same positions of the array, used by int_node to report problematic geometries
+    :return: Array of the noded geometries
+    """
+    original_geometries = geometries
+    geometries = original_geometries.copy()
+
+    # Pair boundaries for each line1, the pairs of line1_idx[i] are in the range starts[i]:ends[i]
+    unique_line1, starts = np.unique(line1_idx, return_index=True)
+    ends = np.append(starts[1:], len(line1_idx))
+
+    pos_gdf = gdf.reset_index(drop=True)  # int_node uses the index to report problematic geometries
+    tot_lines = len(gdf.index)
+    for idx_line1, start, end in zip(unique_line1, starts, ends):
+        progress.report('Calculating intersections on fracture', idx_line1+1, tot_lines)
+
+        # As in the iterrows loop, the reference line starts as the input geometry of line1
+        line1 = original_geometries[idx_line1]
+        for idx_line2 in line2_idx[start:end]:
+            new_geom = int_node(line1, geometries[idx_line2], [idx_line1, idx_line2], pos_gdf)
+
+            for key, value in new_geom.items():
+                geometries[key] = value  # substitute the original geometry with the new geometry
+
+            line1 = geometries[idx_line1]  # Use as the reference line (in the int_node function) the new geometry.
+
+    progress.report('Calculating intersections on fracture', tot_lines, tot_lines)
+
+    return geometries
+
+
+def _node_network(gdf, buffer: float = 0.05, boundary_only: bool = False, lines: np.ndarray = None) -> GeoDataFrame:
+    """
+    Noding engine used to tidy the intersections of a GeoDataFrame of lines.
+
+    The candidate pairs are found with a single bulk query on a STRtree of the buffered geometries. The pairs are then
+    visited in the same order of the original fracture by fracture loop (increasing position of the first line and then
+    of the second line), adding the intersection nodes with int_node on an in-memory array of geometries. The noded
+    geometries are written back in the GeoDataFrame only once at the end.
+
+    The noding is order dependent (the vertices added by a pair change the extension of the first and last segments
+    used by the following pairs), so it runs in a single process.
+
+    :param gdf: GeoDataFrame of fractures (and boundaries)
+    :param buffer: Applied buffer to the geometries to ensure intersection in a given radius.
+    :param boundary_only: Tidy only the intersections between fractures and boundaries
+    :param lines: Positions of the lines to be noded. If given only the intersections involving these lines are
+                  tidied (e.g. when a fracture set is added to an already clean network)
+    :return: Copy of the input GeoDataFrame with the noded geometries
+    """
+
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+    with profiling.stage('Geometry.candidate_pairs'):
+        line1_idx, line2_idx = _candidate_pairs(gdf, buffer=buffer, boundary_only=boundary_only, lines=lines)
+        profiling.add_items(len(line1_idx))
+
+    with profiling.stage('Geometry.int_node'):
+        profiling.add_items(len(line1_idx))
+        geometries = _node_pairs(geometries, line1_idx, line2_idx, gdf)
+
+    noded_gdf = gdf.copy()
+    noded_gdf['geometry'] = GeoSeries(geometries, index=gdf.index, crs=gdf.crs)
+
+    return noded_gdf
+
+
+@profiling.profiled('Geometry.tidy_intersections')
 def tidy_intersections(obj, buffer=0.05, inplace: bool = True):
     """Method used to tidy shapefile intersections between fractures in a fracture or fracture network object."""
 
@@ -39,30 +264,8 @@ def tidy_intersections(obj, buffer=0.05, inplace: bool = True):
         print('Cannot tidy intersection for nodes or only boundaries')
         return
 
-    df_buffer = gdf.buffer(buffer)
-    print('\n\n')
-    for idx_line1, line in gdf.iterrows():
-        print(f'Calculating intersections on fracture: {idx_line1+1}/{len(gdf.index)}', end='\r')
-
-        if line['type'] == 'boundary':
-            continue
-
-        line1 = line['geometry']
-
-        idx_list = df_buffer.index[df_buffer.intersects(line1) == True]  # Subset the intersecting lines
-        idx_list = idx_list[idx_list != idx_line1]  # Exclude the reference line index to avoid self intersection
-
-        intersections = gdf.loc[idx_list]
-        for line2, idx_line2 in zip(intersections['geometry'], idx_list):  # for each intersecting line:
-            new_geom = int_node(line1, line2, [idx_line1, idx_line2], gdf)  # Calculate and add the intersection node.
-
-            for key, value in new_geom.items():
-                gdf.loc[key, 'geometry'] = value  # substitute the original geometry with the new geometry
-
-            line1 = gdf.loc[
-                idx_line1, 'geometry']  # Use as the reference line (in the int_node function) the new geometry.
-
-    print('\n\n')
+    profiling.add_items(len(gdf))
+    gdf = _node_network(gdf, buffer=buffer)
 
     if inplace:
         obj.entity_df = gdf
@@ -71,6 +274,8 @@ def tidy_intersections(obj, buffer=0.05, inplace: bool = True):
         copy_obj.entity_df = gdf
         return copy_obj
 
+
+@profiling.profiled('Geometry.tidy_intersections_boundary_only')
 def tidy_intersections_boundary_only(obj, buffer=0.05, inplace: bool = True):
     """Method used to tidy shapefile intersections with the boundary of a fracture or fracture network object."""
     if obj.name == 'FractureNetwork':
@@ -81,32 +286,10 @@ def tidy_intersections_boundary_only(obj, buffer=0.05, inplace: bool = True):
     else:
         print('Cannot tidy intersection for nodes or only boundaries')
         return
-    df_buffer = gdf.buffer(buffer)
-    print('\n\n')
-    for idx_line1, line in gdf.iterrows():
-        print(f'Calculating intersections on fracture: {idx_line1+1}/{len(gdf.index)}', end='\r')
-
-        if line['type'] == 'boundary':
-            continue
-
-        line1 = line['geometry']
-
-        idx_list = df_buffer.index[df_buffer.intersects(line1) == True]  # Subset the intersecting lines
-        idx_list = idx_list[idx_list != idx_line1]  # Exclude the reference line index to avoid self intersection
-
-        intersections = gdf.loc[idx_list]
-        for line2, idx_line2 in zip(intersections['geometry'], idx_list):  # for each intersecting line:
-            if intersections['type'][idx_line2] == 'boundary':
-                new_geom = int_node(line1, line2, [idx_line1, idx_line2], gdf)  # Calculate and add the intersection node.
 
-                for key, value in new_geom.items():
-                    gdf.loc[key, 'geometry'] = value  # substitute the original geometry with the new geometry
+    profiling.add_items(len(gdf))
+    gdf = _node_network(gdf, buffer=buffer, boundary_only=True)
 
-                line1 = gdf.loc[
-                    idx_line1, 'geometry']  # Use as the reference line (in the int_node function) the new geometry.
-            else:
-                continue
-    print('\n\n')
     if inplace:
         obj.entity_df = gdf
     else:
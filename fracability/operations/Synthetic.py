@@ -0,0 +1,180 @@
+import numpy as np
+import shapely
+from geopandas import GeoDataFrame
+from shapely import polygonize, unary_union
+
+from fracability.Entities import Boundary, Fractures, FractureNetwork
+from fracability.utils.general_use import centers_to_segments
+
+
+def boundary_polygon(boundary: Boundary):
+    """
+    Rebuild the sampled area of a Boundary entity by polygonizing its lines.
+
+    :param boundary: Boundary entity
+    :return: Shapely (Multi)Polygon of the area enclosed by the boundary
+    """
+
+    lines = boundary.entity_df.geometry.values
+    polygon = unary_union(shapely.get_parts(polygonize(lines)))
+
+    if polygon.is_empty:
+        raise ValueError('The boundary lines do not enclose any area')
+
+    return polygon
+
+
+def random_points(polygon, n_points: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draw points uniformly distributed inside a polygon. The points are sampled in batches in the bounding box of the
+    polygon and kept if inside (rejection sampling with shapely.contains_xy).
+
+    :param polygon: Shapely (Multi)Polygon
+    :param n_points: Number of points
+    :param rng: Numpy random generator
+    :return: Array of xy coordinates of shape (n_points, 2)
+    """
+
+    xmin, ymin, xmax, ymax = polygon.bounds
+    fill = polygon.area/((xmax-xmin)*(ymax-ymin))
+    shapely.prepare(polygon)
+
+    xy = np.empty((0, 2))
+    while len(xy) < n_points:
+        n_draw = int((n_points - len(xy))/fill*1.1) + 16
+        candidates = rng.uniform((xmin, ymin), (xmax, ymax), size=(n_draw, 2))
+        inside = shapely.contains_xy(polygon, candidates[:, 0], candidates[:, 1])
+        xy = np.vstack((xy, candidates[inside]))
+
+    return xy[:n_points]
+
+
+def random_centers(polygon, n_points: int, rng: np.random.Generator,
+                   n_clusters: int = None, cluster_radius: float = None) -> np.ndarray:
+    """
+    Draw the centers of the fractures inside a polygon following a Poisson process or, if n_clusters is given, a
+    Thomas (clustered) process: the parent points are uniformly distributed in the polygon and each center is
+    displaced from a random parent with a normal distribution of standard deviation cluster_radius.
+
+    :param polygon: Shapely (Multi)Polygon
+    :param n_points: Number of centers
+    :param rng: Numpy random generator
+    :param n_clusters: Number of parent points of the clustered process. If None (default) the centers are not
+     clustered
+    :param cluster_radius: Standard deviation of the distance of the centers from the parent points
+    :return: Array of xy coordinates of shape (n_points, 2)
+    """
+
+    if n_clusters is None:
+        return random_points(polygon, n_points, rng)
+
+    if cluster_radius is None:
+        raise ValueError('A cluster_radius is needed for clustered centers')
+
+    parents = random_points(polygon, n_clusters, rng)
+    shapely.prepare(polygon)
+
+    xy = np.empty((0, 2))
+    while len(xy) < n_points:
+        n_draw = int((n_points - len(xy))*1.1) + 16
+        candidates = parents[rng.integers(0, n_clusters, n_draw)] + rng.normal(0, cluster_radius, (n_draw, 2))
+        inside = shapely.contains_xy(polygon, candidates[:, 0], candidates[:, 1])
+        xy = np.vstack((xy, candidates[inside]))
+
+    return xy[:n_points]
+
+
+def synthetic_fractures(polygon, sets: list, rng: np.random.Generator, clip: bool = True) -> GeoDataFrame:
+    """
+    Generate the traces of a synthetic fracture network inside a polygon. Each set is described by a dict with keys:
+
+        + n: Number of fractures, or p20: number of fractures per unit area (the number is drawn from a Poisson
+          distribution)
+        + length: frozen scipy distribution of the lengths (e.g. scipy.stats.lognorm(s=0.5, scale=2))
+        + azimuth: mean direction of the set in degrees (clockwise from north). Default is 0
+        + kappa: concentration of the von Mises distribution of the directions. Default is 0 (uniform)
+        + n_clusters and cluster_radius: parameters of the clustered centers (see random_centers). Default is None
+
+    The end points of all the fractures are calculated with centers_to_segments and the traces are created with a
+    single shapely.linestrings call.
+
+    :param polygon: Shapely (Multi)Polygon of the sampled area
+    :param sets: List of dicts describing each set. The sets are numbered from 1 following the order of the list
+    :param rng: Numpy random generator
+    :param clip: If true, the traces are cut by the polygon (the parts outside the area are removed). Default is True
+    :return: GeoDataFrame of the traces with the f_set column
+    """
+
+    centers = []
+    lengths = []
+    directions = []
+    set_ns = []
+
+    for set_n, set_dict in enumerate(sets, start=1):
+        if 'n' in set_dict:
+            n_fractures = int(set_dict['n'])
+        else:
+            n_fractures = rng.poisson(set_dict['p20']*polygon.area)
+
+        xy = random_centers(polygon, n_fractures, rng,
+                            set_dict.get('n_clusters'), set_dict.get('cluster_radius'))
+        azimuth = np.deg2rad(set_dict.get('azimuth', 0))
+        kappa = set_dict.get('kappa', 0)
+
+        centers.append(xy)
+        lengths.append(set_dict['length'].rvs(size=n_fractures, random_state=rng))
+        directions.append(np.rad2deg(rng.vonmises(azimuth, kappa, n_fractures)) % 360)
+        set_ns.append(np.full(n_fractures, set_n))
+
+    centers = np.vstack(centers)
+    center_coords = np.column_stack((centers, np.zeros(len(centers))))
+    xyz1, xyz2 = centers_to_segments(center_coords, np.concatenate(lengths), np.concatenate(directions))
+
+    traces = shapely.linestrings(np.stack((xyz1[:, :2], xyz2[:, :2]), axis=1))
+    set_ns = np.concatenate(set_ns)
+
+    if clip:
+        shapely.prepare(polygon)
+        crossing = ~shapely.contains(polygon, traces)
+        clipped = shapely.intersection(traces[crossing], polygon)
+
+        parts, part_index = shapely.get_parts(clipped, return_index=True)
+        is_line = (shapely.get_type_id(parts) == 1) & (shapely.length(parts) > 0)
+
+        traces = np.concatenate((traces[~crossing], parts[is_line]))
+        set_ns = np.concatenate((set_ns[~crossing], set_ns[crossing][part_index[is_line]]))
+
+    return GeoDataFrame({'f_set': set_ns}, geometry=traces)
+
+
+def synthetic_network(boundary: Boundary, sets: list, seed: int = None, clip: bool = True) -> FractureNetwork:
+    """
+    Generate a synthetic fracture network inside a Boundary (see synthetic_fractures for the description of the sets).
+    The same seed always produces the same network.
+
+    :param boundary: Boundary entity enclosing the sampled area
+    :param sets: List of dicts describing each set
+    :param seed: Seed of the numpy random generator. Default is None
+    :param clip: If true, the traces are cut by the boundary. Default is True
+    :return: FractureNetwork with the generated fracture sets and the boundary
+
+    Examples
+    ----------
+    >>> import scipy.stats as ss
+    >>> sets = [{'n': 1000, 'length': ss.lognorm(s=0.5, scale=2), 'azimuth': 30, 'kappa': 10},
+    ...         {'p20': 0.2, 'length': ss.expon(scale=1), 'azimuth': 120, 'kappa': 5, 'n_clusters': 20,
+    ...          'cluster_radius': 2}]
+    >>> fracture_net = synthetic_network(boundary, sets, seed=42)
+    """
+
+    rng = np.random.default_rng(seed)
+    polygon = boundary_polygon(boundary)
+
+    fractures_df = synthetic_fractures(polygon, sets, rng, clip=clip)
+    fractures_df.crs = boundary.crs
+
+    fracture_net = FractureNetwork()
+    fracture_net.add_fractures(Fractures(gdf=fractures_df))
+    fracture_net.add_boundaries(boundary)
+
+    return fracture_net
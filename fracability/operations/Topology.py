@@ -1,14 +1,201 @@
-from shapely.geometry import Point
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-from itertools import chain
-from pyvista import PolyData
+import shapely
+from geopandas import GeoDataFrame
+from pandas import DataFrame, MultiIndex
+from scipy.spatial import cKDTree
+from shapely import STRtree, box, linestrings
+
+import fracability.Adapters as Rep
+from fracability.utils import profiling
+from fracability.utils.general_use import lines_connectivity, tile_ids
+
+
+def boundary_points(points: np.ndarray, boundary_geometries: np.ndarray, tolerance: float = 1e-5) -> tuple:
+    """
+    Find the points closer than the tolerance to the boundary lines with a single bulk dwithin query on a STRtree of
+    the boundary geometries.
+
+    :param points: Array of point coordinates with shape (n, 2) or (n, 3) (z is ignored)
+    :param boundary_geometries: Array of the boundary geometries (can be None or empty)
+    :param tolerance: Distance under which a point is considered on the boundary
+    :return: Tuple of numpy arrays with the sorted indexes of the points on the boundary and, for each of them, the
+             position of the first boundary geometry that contains it
+    """
+    if boundary_geometries is None or len(boundary_geometries) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty
+
+    point_geometries = shapely.points(np.asarray(points)[:, :2])
+    point_index, boundary_index = STRtree(np.asarray(boundary_geometries, dtype=object)).query(
+        point_geometries, predicate='dwithin', distance=tolerance)
+
+    order = np.lexsort((boundary_index, point_index))
+    point_index, first = np.unique(point_index[order], return_index=True)
+
+    return point_index, boundary_index[order][first]
+
+
+@profiling.profiled('Topology.censoring')
+def censoring(fractures_df, boundary_geometries: np.ndarray, tolerance: float = 1e-5) -> tuple:
+    """
+    Censor the fractures against the boundary without calculating the topology. The end points of all the fractures
+    are tested in a single bulk query (see boundary_points): a fracture with an end point on the boundary is censored
+    and each of these end points is a U node.
+
+    :param fractures_df: GeoDataFrame of the fractures
+    :param boundary_geometries: Array of the boundary geometries
+    :param tolerance: Distance under which an end point is considered on the boundary
+    :return: Tuple of numpy arrays with the censored flag of each fracture (0 or 1), the U node points with shape
+             (n, 3) and the position in fractures_df of the fracture of each U node
+    """
+    geometries = np.asarray(fractures_df.geometry.values, dtype=object)
+    n_lines = len(geometries)
+
+    end_points = np.zeros((2 * n_lines, 3))
+    end_points[:n_lines, :2] = shapely.get_coordinates(shapely.get_point(geometries, 0))
+    end_points[n_lines:, :2] = shapely.get_coordinates(shapely.get_point(geometries, -1))
 
+    on_boundary, _ = boundary_points(end_points, boundary_geometries, tolerance)
+    node_lines = on_boundary % n_lines
 
+    censored = np.zeros(n_lines, dtype=int)
+    censored[node_lines] = 1
+
+    profiling.add_items(len(censored))
+    return censored, end_points[on_boundary], node_lines
+
+
+def _line_rows(fractures_vtk, fractures_df) -> np.ndarray:
+    """
+    Position in the fractures dataframe of each line of the fractures vtk object. The vtk object usually has one line
+    for each fracture, but the geometries collapsed by the welding are removed and single points become vertices
+    (placed before the lines, see shp2vtk). In this case the lines are matched to the fractures using the f_set and
+    og_line_id cell data.
+
+    :param fractures_vtk: PolyData of the fractures
+    :param fractures_df: Dataframe used to build the PolyData
+    :return: Array with the row position of each line
+    """
+    n_lines = fractures_vtk.n_lines
+
+    if fractures_vtk.n_verts == 0 and n_lines == len(fractures_df):
+        return np.arange(n_lines)
+
+    cells = np.arange(n_lines) + fractures_vtk.n_verts  # Lines come after the vertices
+    line_keys = MultiIndex.from_arrays([fractures_vtk['f_set'][cells], fractures_vtk['og_line_id'][cells]])
+    fracture_keys = MultiIndex.from_arrays([fractures_df['f_set'].values, fractures_df['og_line_id'].values])
+
+    return fracture_keys.get_indexer(line_keys)
+
+
+@profiling.profiled('Topology.classify_nodes')
+def _classify_nodes(fractures_vtk, boundary_geometries, tolerance: float = 1e-5) -> tuple:
+    """
+    Classify the nodes of the fractures vtk object using its connectivity arrays (see nodes_conn).
+
+    :param fractures_vtk: PolyData of the fractures
+    :param boundary_geometries: Array of the boundary geometries or None if there are no boundaries
+    :param tolerance: Distance under which a fracture point is considered on a boundary line
+    :return: Tuple of numpy arrays with the node indexes (i.e. the point ids in the fractures vtk object), the
+             corresponding node classes, the node origins (see nodes_conn) and the line censored by each node (-1 for
+             the nodes that are not on the boundary). The lines are numbered in the order of the vtk lines, see
+             _line_rows to get the corresponding fractures
+    """
+
+    fracture_points = fractures_vtk.points
+    f_set = fractures_vtk['f_set'][fractures_vtk.n_verts:]  # Cell data of the lines, that come after the vertices
+    n_points = fractures_vtk.n_points
+
+    offsets, connectivity = lines_connectivity(fractures_vtk)
+    cell_sizes = np.diff(offsets)
+    n_cells = len(cell_sizes)
+    cell_ids = np.repeat(np.arange(n_cells), cell_sizes)  # cell id of each entry of the connectivity
+    non_empty = cell_sizes > 0
+
+    # to get all the nodes we count the start and end of a line (I nodes) together with the entire point_id list.
+    # The ids that repeat more than once are the I nodes and all the nodes that repeat because of intersection with
+    # the fractures
+    first_ids = connectivity[offsets[:-1][non_empty]]
+    last_ids = connectivity[offsets[1:][non_empty]-1]
+    counts = (np.bincount(connectivity, minlength=n_points) + np.bincount(first_ids, minlength=n_points) +
+              np.bincount(last_ids, minlength=n_points))
+
+    # After we explode the lines to get all the segments (each segment is counted once as in extract_all_edges)
+    segment_start = np.ones(len(connectivity), dtype=bool)
+    segment_start[offsets[1:][non_empty]-1] = False  # the last point of each line does not start a segment
+    segment_start = np.where(segment_start)[0]
+    segments = np.sort(np.column_stack((connectivity[segment_start], connectivity[segment_start+1])), axis=1)
+    segments, first_segment = np.unique(segments, axis=0, return_index=True)
+    segment_sets = f_set[cell_ids[segment_start][first_segment]]
+
+    # The degree of the node (i.e. I, Y or X) is the number of segments sharing the point
+    degree = np.bincount(segments.ravel(), minlength=n_points)
+
+    # Cells that contain each point, sorted by point and then by cell id
+    point_cells = np.unique(np.column_stack((connectivity, cell_ids)), axis=0)
+    cells_per_point = np.bincount(point_cells[:, 0], minlength=n_points)
+    first_cell = np.full(n_points, -1)
+    first_cell[point_cells[::-1, 0]] = point_cells[::-1, 1]  # the last assignment (i.e. the smallest cell id) wins
+
+    invalid_ids = np.where((counts > 1) & (cells_per_point >= 3))[0]
+    for i in invalid_ids:
+        cells = point_cells[point_cells[:, 0] == i, 1]
+        print(f'\n\nInvalid point for lines: {fractures_vtk["og_line_id"][cells + fractures_vtk.n_verts]} '
+              f'\n\nsets: {f_set[cells]}, \n\nThe node will be classified accordingly'
+              f' to the number of intersection however, the intersection must be checked!')
+
+    node_ids = np.where((counts > 1) & (degree != 2))[0]
+
+    # To define boundary intersection we search for the fracture points that are on a boundary line, i.e. that are
+    # closer than the tolerance of the network (the same used to weld the points of the vtk objects)
+    boundary_index, _ = boundary_points(fracture_points, boundary_geometries, tolerance)
+
+    # To get the node origin we count the segments of each set at the given node and sort the sets by increasing
+    # frequency (ties are sorted by set number)
+    set_points, set_values = segments.ravel(), np.repeat(segment_sets, 2)
+    node_mask = np.isin(set_points, node_ids)
+    (set_points, set_values), set_counts = np.unique(np.vstack((set_points[node_mask], set_values[node_mask])),
+                                                     axis=1, return_counts=True)
+    order = np.lexsort((set_values, set_counts, set_points))
+    set_points, set_values = set_points[order], set_values[order]
+
+    # Pad the origins of each node in an integer matrix (at least two columns, missing sets are -9999)
+    group_start = np.searchsorted(set_points, node_ids)
+    group_size = np.searchsorted(set_points, node_ids, side='right') - group_start
+    rank = np.arange(len(set_points)) - np.repeat(group_start, group_size)
+    origin_matrix = np.full((len(node_ids), max(group_size.max(initial=0), 2)), -9999, dtype=np.int64)
+    origin_matrix[np.repeat(np.arange(len(node_ids)), group_size), rank] = set_values
+
+    node_types = degree[node_ids]
+
+    # Boundary nodes (U) override the classification and are associated to the set of the first line containing them
+    boundary_sets = np.full((len(boundary_index), origin_matrix.shape[1]), -9999, dtype=np.int64)
+    boundary_sets[:, 0] = f_set[first_cell[boundary_index]]
+
+    node_ids, node_position = np.unique(np.concatenate((node_ids, boundary_index)), return_inverse=True)
+    node_classes = np.empty(len(node_ids), dtype=node_types.dtype)
+    node_origins = np.empty((len(node_ids), origin_matrix.shape[1]), dtype=np.int64)
+    node_censored = np.full(len(node_ids), -1)
+    node_classes[node_position[:len(node_types)]] = node_types
+    node_origins[node_position[:len(node_types)]] = origin_matrix
+    node_classes[node_position[len(node_types):]] = 5
+    node_origins[node_position[len(node_types):]] = boundary_sets
+    node_censored[node_position[len(node_types):]] = first_cell[boundary_index]
+
+    profiling.add_items(len(node_ids))
+    return node_ids, node_classes, node_origins, node_censored
+
+
+@profiling.profiled('Topology.nodes_conn')
 def nodes_conn(obj):
 
     """
-    Define the topology of a network using networkx.degree. With this method also censored fractures are defined and
-    node origin are calculated. By node origin we define which entities are related to the given node e.g.:
+    Define the topology of a network using the connectivity arrays of the fractures vtk object. With this method also
+    censored fractures are defined and node origin are calculated. By node origin we define which entities are related
+    to the given node e.g.:
         + I node with node origin [x] -> related to a fracture of set x
         + Y node with node origin [x, y] -> related to a fracture of set x abutting on a fracture of set y
         + Y node with node origin [x, x] -> related to the intersection of fractures of the same set x
@@ -17,146 +204,337 @@ def nodes_conn(obj):
         + X node with node origin [x, y] -> related to the intersection of fractures of set x and y
         + X node with node origin [w, x, y, z] -> quadruple intersection, makes no sense -> problem in the geometry
 
-    :param obj: Fractures or FractureNetwork object
-    :return: list of shapely geometry points, a list of corresponding node classes and a list of node origin
+    The node origins are returned as an integer matrix with one row for each node and the sets sorted as described
+    above (at least two columns, missing sets are -9999). For U nodes the boundary is not stored, the row contains
+    only the set of the fracture (see origin_strings for the string representation).
+
+    :param obj: FractureNetwork object
+    :return: Tuple of numpy arrays with the node points, the corresponding node classes, the node indexes (i.e. the
+             point ids in the fractures vtk object) and the node origins
     """
 
-    fractures_vtk = obj.fractures.vtk_object
-    boundary_vtk = obj.boundaries.vtk_object
+    fractures = obj.fractures
+    fractures_vtk = fractures.vtk_object
+    boundary_geometries = None if obj.boundaries is None else obj.boundaries.entity_df.geometry.values
     entity_df_obj = obj.fracture_network_to_components_df()
-    point_dict = dict()
-    origin_dict = dict()
-    ids = []
 
-    # to get all the nodes we append the start and end of a line (I nodes) and then the entire point_id list
-    for i, cell in enumerate(fractures_vtk.cell):
-        cell_ids = cell.point_ids
-        ids.append([cell_ids[0]])
-        ids.append([cell_ids[-1]])
-        ids.append(cell_ids)
+    node_ids, node_classes, node_origins, node_censored = _classify_nodes(fractures_vtk, boundary_geometries,
+                                                                          obj.tolerance)
 
-    # we then create a flattened list of the indexes
-    ids = list(chain.from_iterable(ids))
+    censored_lines = np.unique(_line_rows(fractures_vtk, fractures.entity_df)[node_censored[node_censored >= 0]])
+    fracture_labels = entity_df_obj.index[entity_df_obj['type'] == 'fracture']
+    entity_df_obj.loc[fracture_labels[censored_lines], 'censored'] = 1
+    obj.entity_df = entity_df_obj
 
-    # and get the unique values that repeat more than once.
-    # i.e. I nodes and all the nodes that repeat because of intersection with the fractures
-    u, c = np.unique(ids, return_counts=True)
+    profiling.add_items(len(node_ids))
+    return fractures_vtk.points[node_ids], node_classes, node_ids, node_origins
 
-    ids = u[c > 1]
 
-    # To define boundary intersection we search for overlapping points (with a decimal precision of e-5).
-    # This method has a bit of a problem because vtk and shapely do not have the same precision and thus when comparing
-    # points after the e-5 values are different
-    fracture_points = fractures_vtk.points
-    boundary_points = boundary_vtk.points
+def _classify_lines(fractures_df, boundary_df, tolerance: float = 1e-5) -> tuple:
+    """
+    Classify the nodes of a group of lines of the network (e.g. the lines around a region or a tile), building the
+    fractures vtk object of the lines and mapping the censored lines to the rows of fractures_df.
+
+    :param fractures_df: GeoDataFrame of the fractures, in the same order of the network
+    :param boundary_df: GeoDataFrame of the boundaries (can be None)
+    :param tolerance: Tolerance of the network
+    :return: Tuple of numpy arrays with the node points, the node classes, the node origins and the fracture (position
+             in fractures_df) censored by each node (-1 for the nodes that are not on the boundary)
+    """
+    fractures_vtk = Rep.frac_vtk_rep(fractures_df, tolerance=tolerance)
+    boundary_geometries = None if boundary_df is None else boundary_df.geometry.values
+
+    node_ids, node_classes, node_origins, node_censored = _classify_nodes(fractures_vtk, boundary_geometries,
+                                                                          tolerance)
+    node_points = fractures_vtk.points[node_ids]
+    on_boundary = node_censored >= 0
+    node_censored[on_boundary] = _line_rows(fractures_vtk, fractures_df)[node_censored[on_boundary]]
+
+    return node_points, node_classes, node_origins, node_censored
+
+
+@profiling.profiled('Topology.region_nodes')
+def region_nodes(fractures_df, boundary_df, region_points: np.ndarray, tolerance: float = 1e-5) -> tuple:
+    """
+    Classify the nodes of a part of the network. The input dataframes contain the lines touching the region, only
+    the nodes closer than the tolerance to the region points are returned. Since the class of a node depends only on
+    the lines sharing its point, the nodes are the same of a nodes_conn calculation on the whole network.
+
+    :param fractures_df: GeoDataFrame of the fractures touching the region, in the same order of the network
+    :param boundary_df: GeoDataFrame of the boundaries touching the region (can be None)
+    :param region_points: Array of the coordinates of the region points with shape (n, 2)
+    :param tolerance: Tolerance of the network
+    :return: Tuple of numpy arrays with the node points, the node classes, the node origins and the fracture (position
+             in fractures_df) censored by each node (-1 for the nodes that are not on the boundary)
+    """
+
+    node_points, node_classes, node_origins, node_censored = _classify_lines(fractures_df, boundary_df, tolerance)
 
-    boundary_common = np.isin(np.round(fracture_points, 5), np.round(boundary_points, 5)).all(axis=1)
-    boundary_index = np.where(boundary_common == 1)[0]
+    region_distance, _ = cKDTree(region_points).query(node_points[:, :2], distance_upper_bound=tolerance)
+    in_region = np.isfinite(region_distance)
 
-    # After we explode the fractures_vtk to get all the segments of each line
-    fractures_segm = fractures_vtk.extract_all_edges(use_all_points=True)
+    profiling.add_items(np.count_nonzero(in_region))
+    return node_points[in_region], node_classes[in_region], node_origins[in_region], node_censored[in_region]
 
-    # We then loop for each node id that we found at the start
-    for i in ids:
-        # this indicates the degree of the node (i.e. I, Y or X)
-        neigh = fracture_points[fractures_segm.point_neighbors(i)]
 
-        # these will be the cells id that contain the given node idx
-        cells = fractures_vtk.point_cell_ids(i)
+def origin_strings(node_origins: np.ndarray, node_classes: np.ndarray) -> np.ndarray:
+    """
+    Convert the integer node origins (as returned by nodes_conn) to the strings stored in the n_origin column, e.g.
+    '[1 2]' for a node of sets 1 and 2 and "['1', 'b']" for a U node of set 1.
+
+    :param node_origins: Integer matrix of the node origins
+    :param node_classes: Array of the node classes
+    :return: Array of strings
+    """
+    node_origins = np.asarray(node_origins).reshape(len(node_classes), -1)
+
+    unique_origins, origin_inverse = np.unique(node_origins, axis=0, return_inverse=True)
+    strings = np.array([f'{row[row != -9999]}' for row in unique_origins], dtype=object)[origin_inverse.ravel()]
+
+    is_boundary = node_classes == 5
+    strings[is_boundary] = [f'{[f"{s}", "b"]}' for s in node_origins[is_boundary, 0]]
+
+    return strings
+
+
+def set_interactions(nodes_df, sets: list) -> tuple:
+    """
+    Count the nodes between each pair of fracture sets and calculate the connectivity of each set from the integer
+    node origins (n_origin1, n_origin2 columns) of the nodes dataframe.
+
+    Y nodes are counted in the Y matrix as [abutting set, abutted set], X nodes are counted in both the [x, y] and
+    [y, x] cells of the X matrix and nodes of a single set are counted on the diagonal. For the set statistics a node
+    is counted once for each set in its origin, Y2 nodes (6) are considered Y nodes. The connections per line (CL),
+    connections per branch (CB) follow Sanderson and Nixon (2015) and precise_n follows Manzocchi (2002), i.e.
+    4(1 - PI)/(1 - PX) with PI and PX the proportions of I and X nodes. Since 1 - PI and 1 - PX are proportional to
+    NY + NX and NI + NY, precise_n reduces to 4(NY + NX)/(NI + NY) and is always equal to CL: the column is kept
+    because both names are used in the literature, it is not an independent measure.
+
+    :param nodes_df: Dataframe of the nodes
+    :param sets: List of the fracture sets
+    :return: Tuple of DataFrames with the Y matrix, the X matrix (both indexed by set in rows and columns) and the set
+             statistics (I, Y, X, U node counts, CL, CB and precise_n of each set)
+    """
+    sets = np.sort(np.asarray(sets))
+    n_sets = len(sets)
+
+    n_types = nodes_df['n_type'].values
+    n_types = np.where(n_types == 6, 3, n_types)
+    origins = np.column_stack((nodes_df['n_origin1'].values, nodes_df['n_origin2'].values))
+
+    valid = np.isin(origins, sets) | (origins == -9999)
+    valid = valid.all(axis=1) & (origins[:, 0] != -9999)
+    n_types, origins = n_types[valid], origins[valid]
+
+    set_index = np.searchsorted(sets, origins)
+    single_set = origins[:, 1] == -9999
+    set_index[single_set, 1] = set_index[single_set, 0]
+
+    y_matrix = np.zeros((n_sets, n_sets), dtype=int)
+    x_matrix = np.zeros((n_sets, n_sets), dtype=int)
+    is_y, is_x = n_types == 3, n_types == 4
+    np.add.at(y_matrix, (set_index[is_y, 0], set_index[is_y, 1]), 1)
+    np.add.at(x_matrix, (set_index[is_x, 0], set_index[is_x, 1]), 1)
+    x_matrix += x_matrix.T - np.diag(np.diag(x_matrix))
 
-        # To get the node origin we find the unique values of the fracture set at the given node idx and sort
-        # using argsort to get the order that we want (i.e. increasing frequency)
-        sets = fractures_segm['f_set'][fractures_segm.point_cell_ids(i)]
-        u_sets, f_sets = np.unique(sets, return_counts=True)
-        sorting_index = np.argsort(f_sets)
+    # Count each node once for each (different) set of its origin
+    node_sets = np.concatenate((set_index[:, 0], set_index[~single_set, 1]))
+    node_types = np.concatenate((n_types, n_types[~single_set]))
+    counts = {name: np.bincount(node_sets[node_types == n_type], minlength=n_sets)
+              for name, n_type in [('I', 1), ('Y', 3), ('X', 4), ('U', 5)]}
 
-        if len(cells) >= 3:
-            print(f'\n\nInvalid point for lines: {fractures_vtk["og_line_id"][cells]} '
-                  f'\n\nsets: {fractures_vtk["f_set"][cells]}, \n\nThe node will be classified accordingly'
-                  f' to the number of intersection however, the intersection must be checked!')
+    n_i, n_y, n_x = counts['I'], counts['Y'], counts['X']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_lines = (n_i + n_y) / 2
+        n_branches = (n_i + 3 * n_y + 4 * n_x) / 2
+        connections_line = 2 * (n_y + n_x) / n_lines
+        connections_branch = (3 * n_y + 4 * n_x) / n_branches
+        total = n_i + n_y + n_x
+        precise_n = 4 * (1 - n_i / total) / (1 - n_x / total)
 
-        if len(neigh) != 2:
-            point = Point(fracture_points[i])
-            point_dict[point] = [len(neigh), i]
-            origin_dict[point] = f'{u_sets[sorting_index]}'
+    y_df = DataFrame(y_matrix, index=sets, columns=sets)
+    x_df = DataFrame(x_matrix, index=sets, columns=sets)
+    sets_df = DataFrame({**counts, 'CL': connections_line, 'CB': connections_branch, 'precise_n': precise_n},
+                        index=sets)
 
-    for i in boundary_index:
-        point = Point(fracture_points[i])
-        f_cells = fractures_vtk.point_cell_ids(i)
-        origin_set = f'{fractures_vtk["f_set"][f_cells][0]}'
+    return y_df, x_df, sets_df
 
-        point_dict[point] = [5, i]
-        origin_dict[point] = f'{[origin_set, "b"]}'
 
-    censored_lines = [fractures_vtk.point_cell_ids(idx)[0] for idx in boundary_index]
-    entity_df_obj.loc[censored_lines, 'censored'] = 1
+def _tile_nodes(fractures_df, boundary_df, tolerance: float, bounds: np.ndarray, tile_size: float,
+                tile: int) -> tuple:
+    """
+    Classify the nodes of a tile. The input dataframes contain the lines of the tile and of its halo, only the nodes
+    inside the tile are returned.
+
+    This function is defined at module level so that it can be sent to worker processes.
+
+    :param fractures_df: GeoDataFrame of the fractures of the tile, in the same order of the network
+    :param boundary_df: GeoDataFrame of the boundaries of the tile, in the same order of the network (can be None)
+    :param tolerance: Tolerance of the network
+    :param bounds: Bounds of the tile grid
+    :param tile_size: Size of the tiles in map units
+    :param tile: Id of the tile
+    :return: Tuple of numpy arrays with the node points, the node classes, the node origins and the fracture (position
+             in fractures_df) censored by each node (-1 for the nodes that are not on the boundary)
+    """
+
+    node_points, node_classes, node_origins, node_censored = _classify_lines(fractures_df, boundary_df, tolerance)
+
+    in_tile = tile_ids(node_points[:, 0], node_points[:, 1], bounds, tile_size) == tile
+
+    return node_points[in_tile], node_classes[in_tile], node_origins[in_tile], node_censored[in_tile]
+
+
+@profiling.profiled('Topology.tiled_nodes_conn')
+def tiled_nodes_conn(obj, tile_size: float, halo: float = None, n_jobs: int = None):
+
+    """
+    Tiled version of nodes_conn. The extent of the network is divided in a grid of square tiles and the nodes of each
+    tile are classified in a separate worker process using only the lines that intersect the tile expanded by the halo.
+    Each node is kept only by the tile that contains it, so the nodes in the halo of the neighbouring tiles are not
+    duplicated, and the censored fractures of all the tiles are joined. The result is the same of nodes_conn as long
+    as the halo is larger than the tolerance of the network.
+
+    :param obj: FractureNetwork object
+    :param tile_size: Size of the tiles in map units
+    :param halo: Size of the halo around each tile in map units. If None ten times the tolerance of the network is used
+    :param n_jobs: Number of worker processes. If None all the available cpus are used, if 1 the tiles are processed
+     serially in the current process. Default is None
+    :return: Tuple of numpy arrays with the node points, the corresponding node classes, the node indexes (i.e. the
+             point ids in the fractures vtk object) and the node origins
+    """
+
+    if halo is None:
+        halo = 10 * obj.tolerance
+
+    fractures_df = obj.fractures.entity_df
+    boundary_df = None if obj.boundaries is None else obj.boundaries.entity_df
+    entity_df_obj = obj.fracture_network_to_components_df()
+
+    bounds = entity_df_obj.loc[entity_df_obj['type'] != 'node'].total_bounds
+    n_columns = max(int(np.ceil((bounds[2] - bounds[0]) / tile_size)), 1)
+    n_rows = max(int(np.ceil((bounds[3] - bounds[1]) / tile_size)), 1)
+
+    columns, rows = np.meshgrid(np.arange(n_columns), np.arange(n_rows))
+    columns, rows = columns.ravel(), rows.ravel()
+    tile_boxes = box(bounds[0] + columns * tile_size - halo, bounds[1] + rows * tile_size - halo,
+                     bounds[0] + (columns + 1) * tile_size + halo, bounds[1] + (rows + 1) * tile_size + halo)
+
+    fracture_tiles, fracture_lines = STRtree(fractures_df.geometry.values).query(tile_boxes, predicate='intersects')
+    if boundary_df is not None:
+        boundary_tiles, boundary_lines = STRtree(boundary_df.geometry.values).query(tile_boxes,
+                                                                                    predicate='intersects')
+
+    tasks = []
+    for tile in np.unique(fracture_tiles):
+        tile_fractures = np.sort(fracture_lines[fracture_tiles == tile])
+        if boundary_df is None:
+            tile_boundary_df = None
+        else:
+            tile_boundary_df = boundary_df.iloc[np.sort(boundary_lines[boundary_tiles == tile])]
+        tasks.append((tile_fractures, (fractures_df.iloc[tile_fractures], tile_boundary_df, obj.tolerance, bounds,
+                                       tile_size, columns[tile] + rows[tile] * n_columns)))
+
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = [_tile_nodes(*args) for _, args in tasks]
+    else:
+        n_workers = min(n_jobs or os.cpu_count(), len(tasks))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_tile_nodes, *zip(*[args for _, args in tasks])))
+
+    node_points = np.concatenate([result[0] for result in results]).reshape(-1, 3)
+    node_classes = np.concatenate([result[1] for result in results])
+
+    # The origin matrices of the tiles can have a different number of columns
+    n_columns = max([result[2].shape[1] for result in results], default=2)
+    node_origins = np.concatenate([np.pad(result[2], ((0, 0), (0, n_columns - result[2].shape[1])),
+                                          constant_values=-9999) for result in results]).reshape(-1, n_columns)
+    censored_lines = np.concatenate([tile_fractures[node_censored[node_censored >= 0]]
+                                     for (tile_fractures, _), (_, _, _, node_censored) in zip(tasks, results)])
+
+    # The welded points of the tiles are the same of the whole network, the node indexes are found by position and
+    # the nodes are sorted by index as in nodes_conn
+    fractures_vtk = obj.fractures.vtk_object
+    _, node_ids = cKDTree(fractures_vtk.points).query(node_points)
+    node_ids, unique_nodes = np.unique(node_ids, return_index=True)
+
+    censored_lines = np.unique(censored_lines).astype(int)
+    fracture_labels = entity_df_obj.index[entity_df_obj['type'] == 'fracture']
+    entity_df_obj.loc[fracture_labels[censored_lines], 'censored'] = 1
     obj.entity_df = entity_df_obj
-    #fracture_nodes = PolyData(fractures_vtk.points)
-    #fracture_nodes['topology'] = fractures_vtk['topology']
-
-    # network_obj = obj.network_object()
-    #
-    # vtk_obj = obj.vtk_object(include_nodes=False)
-    #
-    # entity_df_obj = obj.fracture_network_to_components_df()
-    #
-    # fractures_vtk_obj = obj.fractures.vtk_object
-    #
-    # frac_idx = np.where(vtk_obj.point_data['type'] == 'fracture')[0]
-    #
-    # node_dict = {}
-    # tot_idx = len(frac_idx)
-    # print('\n\n')
-    # for node in frac_idx:  # For each node of the fractures:
-    #     print(f'Analyzing nodes:{node+1}/{tot_idx}', end='\r')
-    #
-    #     n_edges = network_obj.degree[node]  # Calculate number of connected nodes
-    #
-    #     point = Point(vtk_obj.points[node])
-    #
-    #     cells = fractures_vtk_obj.extract_points(node)
-    #     if cells.number_of_cells == 0:
-    #         node_origin = -9999
-    #     else:
-    #         node_origin = ''.join([str(int(c)) for c in set(cells['f_set'])])
-    #
-    #     if n_edges == 2:  # Exclude internal and V nodes
-    #         n_edges = -9999
-    #
-    #     elif n_edges == 3:  # Discriminate Y (3 or 6) and U (5) nodes
-    #
-    #         cells = vtk_obj.extract_points(node)
-    #
-    #         if 'boundary' in cells['type']:
-    #
-    #             n_edges = 5
-    #             index = vtk_obj.point_data['RegionId'][node]
-    #             entity_df_obj.loc[index, 'censored'] = 1
-    #
-    #         else:
-    #             if len(node_origin) > 1:  # Discriminate between Y nodes between different sets (3) or same set (6)
-    #                 n_edges = 6
-    #             else:
-    #                 n_edges = 3
-    #
-    #     elif n_edges == 4:
-    #         cells = vtk_obj.extract_points(node)
-    #         if 'boundary' in cells['type']:
-    #             n_edges = 5
-    #             index = vtk_obj.point_data['RegionId'][node]
-    #             entity_df_obj.loc[index, 'censored'] = 1
-    #         else:
-    #             n_edges = 4
-    #
-    #     elif n_edges > 4:
-    #
-    #         n_edges = -9999
-    #
-    #     node_dict[point] = (n_edges, node_origin)
-    #
-    # obj.entity_df = entity_df_obj
-    # print('\n\nDone!')
-    return point_dict, origin_dict
+
+    profiling.add_items(len(node_ids))
+    return fractures_vtk.points[node_ids], node_classes[unique_nodes], node_ids, node_origins[unique_nodes]
+
+
+@profiling.profiled('Topology.branches')
+def branches(obj) -> GeoDataFrame:
+
+    """
+    Split the fractures of a network in branches, i.e. the parts of the fractures between two nodes. The fracture
+    polylines are cut at the vertices that are nodes (n_index of the nodes) using the connectivity arrays of the
+    fractures vtk object, and the branch geometries are built in a single call of shapely.linestrings.
+
+    Each branch is tagged by the classes of its end nodes following Sanderson and Nixon (2015): I for isolated nodes,
+    C for connected nodes (Y and X nodes) and U for nodes on the boundary, giving the I-I, I-C, C-C, I-U, C-U and U-U
+    branch types. Branches with a U end are censored.
+
+    :param obj: FractureNetwork object with calculated topology
+    :return: GeoDataFrame of the branches with the og_line_id and f_set of the parent fracture, the branch type
+             (b_type) and the censored flag
+    """
+
+    fractures_vtk = obj.fractures.vtk_object
+    nodes_df = obj.nodes.entity_df
+
+    node_class = np.full(fractures_vtk.n_points, -9999)
+    node_class[nodes_df['n_index'].values.astype(int)] = nodes_df['n_type'].values
+
+    offsets, connectivity = lines_connectivity(fractures_vtk)
+    cell_sizes = np.diff(offsets)
+    cell_ids = np.repeat(np.arange(len(cell_sizes)), cell_sizes)
+    non_empty = cell_sizes > 0
+
+    first = np.zeros(len(connectivity), dtype=bool)
+    last = np.zeros(len(connectivity), dtype=bool)
+    first[offsets[:-1][non_empty]] = True
+    last[offsets[1:][non_empty]-1] = True
+
+    # The interior node vertices end a branch and start the next one, so they are repeated
+    cut = (node_class[connectivity] != -9999) & ~first & ~last
+    entries = np.repeat(np.arange(len(connectivity)), 1 + cut)
+
+    branch_start = first[entries]
+    branch_start[1:] |= entries[1:] == entries[:-1]
+    branch_index = np.cumsum(branch_start) - 1
+
+    point_ids = connectivity[entries]
+    geometries = linestrings(fractures_vtk.points[point_ids, :2], indices=branch_index)
+
+    start_position = np.where(branch_start)[0]
+    end_position = np.append(start_position[1:] - 1, len(entries) - 1)
+    branch_cells = cell_ids[entries[start_position]] + fractures_vtk.n_verts  # Lines come after the vertices
+
+    # End classes: 0 -> I, 1 -> C, 2 -> U
+    end_classes = np.ones((len(start_position), 2), dtype=int)
+    for column, position in enumerate([start_position, end_position]):
+        n_type = node_class[point_ids[position]]
+        end_classes[n_type == 1, column] = 0
+        end_classes[n_type == 5, column] = 2
+    end_classes.sort(axis=1)
+
+    class_names = np.array(['I', 'C', 'U'], dtype=object)
+    b_type = class_names[end_classes[:, 0]] + '-' + class_names[end_classes[:, 1]]
+
+    branches_df = GeoDataFrame({'type': 'branch',
+                                'og_line_id': fractures_vtk['og_line_id'][branch_cells],
+                                'f_set': fractures_vtk['f_set'][branch_cells],
+                                'b_type': b_type,
+                                'censored': (end_classes[:, 1] == 2).astype(int),
+                                'geometry': geometries}, crs=obj.crs)
+
+    profiling.add_items(len(branches_df))
+    return branches_df
 
 
 # def find_backbone(obj: FractureNetwork) -> PolyData:
@@ -0,0 +1,40 @@
+from geopandas import GeoDataFrame
+from shapely.geometry import LineString, Polygon
+
+from fracability import Entities
+from fracability.utils import progress
+
+EXPECTED_CENSORED = [0, 0, 1, 1]
+
+
+def collapsed_line_network() -> Entities.FractureNetwork:
+    # The first fracture is shorter than the tolerance and is removed from the vtk object by the welding
+    set_1 = GeoDataFrame({'geometry': [LineString([(2, 2), (2, 2 + 1e-7)]), LineString([(1, 5), (9, 5)]),
+                                       LineString([(3, 1), (3, 12)])]})
+    set_2 = GeoDataFrame({'geometry': [LineString([(5, 1), (5, 12)])]})
+    boundary = GeoDataFrame({'geometry': [Polygon([(0, 0), (10, 0), (10, 10), (0, 10)]).boundary]})
+
+    fracture_net = Entities.FractureNetwork()
+    fracture_net.add_fractures(Entities.Fractures(gdf=set_1, set_n=1))
+    fracture_net.add_fractures(Entities.Fractures(gdf=set_2, set_n=2))
+    fracture_net.add_boundaries(Entities.Boundary(gdf=boundary, group_n=1))
+
+    return fracture_net
+
+
+def test_censoring_with_collapsed_lines():
+    with progress.callback(None):
+        fracture_net = collapsed_line_network()
+        fracture_net.calculate_topology()
+        assert fracture_net.fractures.entity_df['censored'].tolist() == EXPECTED_CENSORED
+
+        origins = fracture_net.nodes.entity_df.loc[fracture_net.nodes.entity_df['n_type'] == 5, 'n_origin1']
+        assert sorted(origins) == [1, 2]
+
+        fracture_net = collapsed_line_network()
+        fracture_net.calculate_topology(tile_size=4, n_jobs=1)
+        assert fracture_net.fractures.entity_df['censored'].tolist() == EXPECTED_CENSORED
+
+        fracture_net.activate_fractures([2], update_topology=True)
+        fracture_net.activate_fractures(None, update_topology=True)
+        assert fracture_net.fractures.entity_df['censored'].tolist() == EXPECTED_CENSORED
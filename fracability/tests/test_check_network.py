@@ -0,0 +1,19 @@
+from geopandas import GeoDataFrame
+from shapely.geometry import LineString
+
+from fracability import Entities
+
+
+def test_overlaps_of_sets_sharing_line_ids(capsys):
+    # og_line_id restarts in each set, both overlapping fractures have og_line_id 1
+    set_1 = GeoDataFrame({'geometry': [LineString([(0, 0), (10, 0)])]})
+    set_2 = GeoDataFrame({'geometry': [LineString([(5, 0), (15, 0)])]})
+
+    fracture_net = Entities.FractureNetwork()
+    fracture_net.add_fractures(Entities.Fractures(gdf=set_1, set_n=1))
+    fracture_net.add_fractures(Entities.Fractures(gdf=set_2, set_n=2))
+
+    report = fracture_net.check_network()
+
+    assert sorted(zip(report['f_set'], report['og_line_id'])) == [(1, 1), (2, 1)]
+    assert capsys.readouterr().out.strip().endswith('{1: [1], 2: [1]}')
@@ -0,0 +1,27 @@
+from fracability.utils.fit_cache import FitCache
+
+METRICS = {name: 1.0 for name in FitCache.metric_names}
+
+
+def test_temporary_files_are_not_entries(tmp_path):
+    leftover = tmp_path / 'interrupted.npz.tmp'
+    leftover.write_bytes(b'0' * 10000)
+
+    fit_cache = FitCache(str(tmp_path), max_size=5000)
+    for n in range(20):
+        fit_cache.put(f'key{n}', (1.0, 2.0), METRICS)
+
+    assert leftover.exists()
+    assert fit_cache.size <= fit_cache.max_size
+    assert fit_cache.get('key19') == ((1.0, 2.0), METRICS)
+    assert fit_cache.get('key0') is None
+
+
+def test_tracked_size_matches_the_entries(tmp_path):
+    fit_cache = FitCache(str(tmp_path))
+    fit_cache.put('key', (1.0, 2.0), METRICS)
+    fit_cache.put('key', (3.0, 4.0), METRICS)
+    fit_cache.put('other_key', (1.0,), METRICS)
+
+    assert fit_cache._size == fit_cache.size
+    assert fit_cache.get('key')[0] == (3.0, 4.0)
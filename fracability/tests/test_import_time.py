@@ -0,0 +1,28 @@
+import json
+import subprocess
+import sys
+
+IMPORT = 'import fracability.Entities, fracability.Statistics'
+LAZY_MODULES = ['fracability.Plotters', 'seaborn', 'ternary', 'pyperclip']
+BUDGET = 3.0  # seconds, see development/benchmarks/import_time.py
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+{IMPORT}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def probe_import() -> dict:
+    output = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_plotting_dependencies_are_not_imported():
+    assert probe_import()['loaded'] == []
+
+
+def test_import_time_budget():
+    assert min(probe_import()['time'] for _ in range(3)) < BUDGET
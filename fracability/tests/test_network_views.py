@@ -0,0 +1,19 @@
+from geopandas import GeoDataFrame
+from shapely.geometry import LineString
+
+from fracability import Entities
+
+
+def test_view_changes_do_not_alter_the_network():
+    fractures_df = GeoDataFrame({'geometry': [LineString([(0, 0), (10, 0)]), LineString([(5, -5), (5, 5)])]})
+    fracture_net = Entities.FractureNetwork()
+    fracture_net.add_fractures(Entities.Fractures(gdf=fractures_df, set_n=1))
+
+    view = fracture_net.fractures
+    view.entity_df['geometry'] = view.entity_df.geometry.translate(1000)
+
+    assert fracture_net.fractures is not view
+    assert fracture_net.fractures.entity_df.total_bounds.tolist() == [0, -5, 10, 5]
+
+    fracture_net._invalidate_views()
+    assert fracture_net.fractures.entity_df.total_bounds.tolist() == [0, -5, 10, 5]
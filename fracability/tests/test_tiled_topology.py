@@ -0,0 +1,25 @@
+import numpy as np
+from geopandas import GeoDataFrame
+from shapely.geometry import LineString
+
+from fracability import Entities
+
+
+def test_tiled_topology_without_boundary():
+    horizontal = [LineString([(0, y), (10, y)]) for y in range(1, 10, 2)]
+    vertical = [LineString([(x, 0.5), (x, 9.5)]) for x in range(1, 10, 2)]
+
+    fracture_net = Entities.FractureNetwork()
+    fracture_net.add_fractures(Entities.Fractures(gdf=GeoDataFrame({'geometry': horizontal}), set_n=1))
+    fracture_net.add_fractures(Entities.Fractures(gdf=GeoDataFrame({'geometry': vertical}), set_n=2))
+    fracture_net.clean_network()
+
+    fracture_net.calculate_topology(clean_network=False, tile_size=3, n_jobs=1)
+    tiled_df = fracture_net.nodes.entity_df
+
+    fracture_net.calculate_topology(clean_network=False)
+    nodes_df = fracture_net.nodes.entity_df
+
+    np.testing.assert_array_equal(tiled_df['n_type'].values, nodes_df['n_type'].values)
+    assert tiled_df.geometry.geom_equals_exact(nodes_df.geometry, tolerance=1e-9).all()
+    assert (nodes_df['n_type'] == 4).sum() == 25
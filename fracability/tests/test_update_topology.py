@@ -0,0 +1,39 @@
+import numpy as np
+
+from fracability import Entities
+from fracability.examples import data
+from fracability.utils import progress
+
+
+def pontrelli_network() -> Entities.FractureNetwork:
+    data_dict = data.Pontrelli().data_dict
+
+    fracture_net = Entities.FractureNetwork()
+    for set_n, name in enumerate(['Set_a.shp', 'Set_b.shp', 'Set_c.shp'], start=1):
+        fracture_net.add_fractures(Entities.Fractures(shp=data_dict[name], set_n=set_n))
+    fracture_net.add_boundaries(Entities.Boundary(shp=data_dict['Interpretation_boundary.shp'], group_n=1))
+
+    return fracture_net
+
+
+def test_reactivated_sets_match_full_topology():
+    with progress.callback(None):
+        fracture_net = pontrelli_network()
+        fracture_net.calculate_topology()
+
+        fracture_net.activate_fractures([1, 3], update_topology=True)
+        fracture_net.activate_fractures(None, update_topology=True)
+
+        reference_net = pontrelli_network()
+        reference_net.calculate_topology()
+
+    nodes_df = fracture_net.nodes.entity_df
+    reference_df = reference_net.nodes.entity_df
+
+    assert len(nodes_df) == len(reference_df)
+    np.testing.assert_array_equal(nodes_df['n_type'].values, reference_df['n_type'].values)
+    np.testing.assert_array_equal(nodes_df['n_origin'].values, reference_df['n_origin'].values)
+    assert nodes_df.geometry.geom_equals_exact(reference_df.geometry, tolerance=1e-9).all()
+
+    np.testing.assert_array_equal(fracture_net.fractures.entity_df['censored'].values,
+                                  reference_net.fractures.entity_df['censored'].values)
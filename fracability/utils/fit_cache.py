@@ -0,0 +1,169 @@
+"""
+Persistent on-disk cache of fitted distributions.
+
+Each entry is a npz file named after a fingerprint of the fitted data (lengths, deltas and survival flags), the
+distribution name and the scipy version. The entry stores the fitted parameters and the goodness of fit metrics so
+that a NetworkFitter can rebuild the fit records without calling the scipy optimizer. The total size of the cache is
+bounded, the least recently used entries are removed first.
+
+The entries are written on temporary .npz.tmp files and then renamed, so the partial files of a writer (or the ones
+left by a crash) are never read, counted or evicted as entries.
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import scipy
+
+
+class FitCache:
+    """
+    Size bounded cache of fitted distributions stored in a local directory.
+
+    :param path: Directory of the cache. If None the cache is saved in ~/.cache/fracability/fits
+    :param max_size: Maximum size of the cache in bytes. Default is 100 MB
+
+    Notes
+    -------
+    The cache is opt-in. To use it pass a FitCache object (or a directory path) to NetworkFitter with the fit_cache
+    parameter.
+    """
+
+    metric_names: list = ['max_log_likelihood', 'AIC', 'AICc', 'KS_distance', 'KG_distance', 'AD_distance']
+
+    def __init__(self, path: str = None, max_size: int = 100 * 2**20):
+
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.cache', 'fracability', 'fits')
+
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # Size of the entries, scanned at the first put and then updated by put and evict
+
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(network_data, distribution_name: str) -> str:
+        """
+        Calculate the cache key of a fit
+        :param network_data: NetworkData object used for the fit
+        :param distribution_name: Name of the fitted distribution
+        :return: Hexadecimal string of the key
+        """
+        fingerprint = hashlib.sha256()
+        fingerprint.update(np.ascontiguousarray(network_data.lengths, dtype=np.float64).tobytes())
+        fingerprint.update(np.ascontiguousarray(network_data.delta, dtype=np.float64).tobytes())
+        fingerprint.update(f'{network_data.use_survival}{network_data.complete_only}'.encode())
+        fingerprint.update(f'{distribution_name};{scipy.__version__}'.encode())
+
+        return fingerprint.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.npz')
+
+    def _entries(self) -> list:
+        """
+        Internal method that returns a list of (last use time, size, path) of the entries of the cache
+        """
+        entries = []
+        for entry_path in glob.glob(os.path.join(self.path, '*.npz')):
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        return entries
+
+    def get(self, key: str):
+        """
+        Get a cached fit
+        :param key: Key of the fit
+        :return: Tuple of (parameters, dictionary of metrics) or None if the fit is not cached
+        """
+        entry_path = self._entry_path(key)
+
+        try:
+            with np.load(entry_path) as entry:
+                params = tuple(float(value) for value in entry['params'])
+                metrics = dict(zip(self.metric_names, entry['metrics'].tolist()))
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+
+        os.utime(entry_path)  # Mark the entry as recently used
+        self.hits += 1
+
+        return params, metrics
+
+    def put(self, key: str, params: tuple, metrics: dict):
+        """
+        Save a fit in the cache and evict the least recently used entries if the cache is too big. The size of the
+        cache is tracked by the object, the directory is scanned only when the tracked size is over max_size (the
+        entries written by other processes are accounted for at that point).
+        :param key: Key of the fit
+        :param params: Fitted parameters
+        :param metrics: Dictionary of the metrics of the fit (the keys are the metric_names)
+        """
+        metric_values = np.array([metrics[name] for name in self.metric_names], dtype=np.float64)
+        entry_path = self._entry_path(key)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+
+        # Write on a temporary file and then move it so that concurrent readers never see partial entries
+        handle, temp_path = tempfile.mkstemp(suffix='.npz.tmp', dir=self.path)
+        with os.fdopen(handle, 'wb') as file:
+            np.savez(file, params=np.array(params, dtype=np.float64), metrics=metric_values)
+            entry_size = file.tell()
+
+        try:
+            self._size -= os.path.getsize(entry_path)  # The entry is replaced
+        except OSError:
+            pass
+        os.replace(temp_path, entry_path)
+        self._size += entry_size
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the size of the cache is lower than max_size
+        """
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total_size -= size
+
+        self._size = total_size
+
+    def clear(self):
+        """
+        Remove all the entries of the cache
+        """
+        for entry_path in glob.glob(os.path.join(self.path, '*.npz')):
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """
+        Total size of the cache in bytes
+        """
+        return sum(size for _, size, _ in self._entries())
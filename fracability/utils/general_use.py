@@ -1,13 +1,20 @@
-import scooby
-import pyperclip
 import numpy as np
 import pyvista as pv
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from geopandas import GeoDataFrame
-from vtkmodules.vtkFiltersCore import vtkCleanPolyData
+from shapely import get_coordinates
+from vtkmodules.util.numpy_support import vtk_to_numpy
+
+from fracability.utils import profiling
 
 
 def report():
     """ Method used to create a report using scooby and copy it in the clipboard"""
+    import scooby
+    import pyperclip
+
     core = ['fracability', 'pyvista', 'vtk', 'numpy', 'geopandas', 'shapely']
     text = scooby.Report(core=core, ncol=3, text_width=80, sort=True, additional=None, optional=None)
     print(text)
@@ -15,6 +22,32 @@ def report():
     print('Report copied to clipboard')
 
 
+def centers_to_segments(center_coords, lengths, frac_dir) -> tuple:
+    """ Function used to calculate the end points of fractures of given lengths from center coordinates.
+
+    :param center_coords: xyz coordinate centers array of the fractures
+    :param lengths: length array for each fracture.
+    :param frac_dir: direction array (azimuth in degrees) of each fracture.
+
+    :return: Tuple of the xyz arrays of the first and second end points of each fracture.
+    """
+
+    half_lengths = lengths/2
+    xyz1 = np.array(center_coords, dtype=float)
+    xyz2 = xyz1.copy()
+
+    dx = half_lengths * np.sin(np.deg2rad(frac_dir))
+    dy = half_lengths * np.cos(np.deg2rad(frac_dir))
+
+    xyz1[:, 0] += dx
+    xyz2[:, 0] -= dx
+
+    xyz1[:, 1] += dy
+    xyz2[:, 1] -= dy
+
+    return xyz1, xyz2
+
+
 def centers_to_lines(center_coords, lengths, frac_dir, assign_id=True) -> pv.PolyData:
     """ Function used to create fractures of given lengths from center coordinates.
 
@@ -26,22 +59,15 @@ def centers_to_lines(center_coords, lengths, frac_dir, assign_id=True) -> pv.Pol
     :return: Pyvista polydata with the same number of fracture as centers.
     """
 
-    half_lengths = lengths/2
-    xyz1 = center_coords.copy()
-    xyz2 = center_coords.copy()
-
-    xyz1[:, 0] = center_coords[:, 0] + half_lengths * np.sin(np.deg2rad(frac_dir))
-    xyz2[:, 0] = center_coords[:, 0] + half_lengths * np.sin(np.deg2rad((frac_dir + 180) % 360))
-
-    xyz1[:, 1] = center_coords[:, 1] + half_lengths * np.cos(np.deg2rad(frac_dir))
-    xyz2[:, 1] = center_coords[:, 1] + half_lengths * np.cos(np.deg2rad((frac_dir + 180) % 360))
+    xyz1, xyz2 = centers_to_segments(center_coords, lengths, frac_dir)
 
-    xyz_complete = np.array([[i, j] for i, j in zip(xyz1, xyz2)]).reshape(-1, 3)
-    conn = np.insert(np.arange(0, len(xyz_complete)), np.arange(0, len(xyz_complete), 2), 2)
+    n_lines = len(xyz1)
+    xyz_complete = np.stack((xyz1, xyz2), axis=1).reshape(-1, 3)
+    conn = np.column_stack((np.full(n_lines, 2), np.arange(2*n_lines).reshape(-1, 2))).ravel()
     lines = pv.PolyData(xyz_complete, lines=conn)
 
     if assign_id:
-        regions_ids = np.arange(0, len(center_coords))
+        regions_ids = np.arange(0, n_lines)
         lines['RegionId'] = regions_ids
 
     return lines
@@ -51,45 +77,35 @@ def KM(z_values, Z, delta_list):
 
     """
     Calculate the Kaplan-Meier curve given an input z, data Z and list of deltas.
+
+    The product-limit estimator is calculated once on the sorted data as a cumulative product of the ^p terms
+    (formula 2.6) and then evaluated with a binary search of the input values. Ties in the data are handled as
+    consecutive observations. The input can be a single array or a stack of arrays (e.g. many evaluation grids with
+    shape (n_grids, n_values)): the output has the same shape of z_values.
+
     :param z_values: Input
     :param Z: Data (sorted)
     :param delta_list: list of deltas (sorted as Z)
     :return:
     """
 
-    def p_cap(n, j_index, d_list):
-        """
-        Calculate the ^p estimator (formula 2.6)
-        :param n: total number
-        :param j_index: index list
-        :param d_list: delta list
-        :return:
-        """
-        product = 1  # initiate product as 1 (so that the first step p1 will be product=p1
+    # Sort Z in case it is not sorted at input (also delta_list needs to be sorted in the same order of Z)
+    sorted_args = np.argsort(Z)
+    Z_sort = np.asarray(Z)[sorted_args]
+    delta_list_sort = np.asarray(delta_list)[sorted_args]
 
-        for j in j_index:  # for each index in the index list
-            d = d_list[j]
-            real_j = j+1
-            p = ((n - real_j) / (n - real_j + 1)) ** d
-            product *= p
+    n = len(Z_sort)
+    real_j = np.arange(1, n+1)
+    p = ((n - real_j) / (n - real_j + 1)) ** delta_list_sort
+    product = np.cumprod(p)  # product[j] is the ^p estimator product up to the j-th sorted value
 
-        return 1 - product
+    z_values = np.asarray(z_values)
+    j_index = np.searchsorted(Z_sort, z_values, side='right')  # Number of data values lower or equal than z
 
-    # Sort Z in case it is not sorted at input (also delta_list needs to be sorted in the same order of Z)
-    sorted_args = np.argsort(Z)
-    Z_sort = Z[sorted_args]
-    delta_list_sort = delta_list[sorted_args]
-
-    G = np.ones_like(z_values)
-    n = len(Z)
-    for i, z in enumerate(z_values):
-        if z < Z_sort[0]:
-            G[i] = 0
-        elif z <= Z_sort[-1]:
-            j_index = np.where(Z_sort <= z)[0]  # Get the index in which the data Z is lower than z
-            G[i] = p_cap(n, j_index, delta_list_sort)  # Calculate the p_cap
-        elif z > Z_sort[-1]:
-            G[i] = 1
+    G = np.ones(z_values.shape)
+    inside = (z_values >= Z_sort[0]) & (z_values <= Z_sort[-1])
+    G[z_values < Z_sort[0]] = 0
+    G[inside] = 1 - product[j_index[inside] - 1]
 
     return G
 
@@ -160,75 +176,174 @@ def setFigLinesBW(fig):
         setAxLinesBW(ax)
 
 
-def shp2vtk(df: GeoDataFrame, nodes=False) -> pv.PolyData:
+def lines_connectivity(vtk_obj: pv.PolyData) -> tuple:
+    """
+    Get the offsets and connectivity arrays of the lines of a PolyData. The point ids of the cell i are
+    connectivity[offsets[i]:offsets[i+1]]
+
+    :param vtk_obj: input PolyData
+    :return: Tuple of numpy arrays (offsets, connectivity)
+    """
+    lines = vtk_obj.GetLines()
+    offsets = vtk_to_numpy(lines.GetOffsetsArray())
+    connectivity = vtk_to_numpy(lines.GetConnectivityArray())
+
+    return offsets, connectivity
+
+
+def tile_ids(x: np.ndarray, y: np.ndarray, bounds: np.ndarray, tile_size: float) -> np.ndarray:
+    """
+    Get the tile of a set of points in a regular grid of square tiles. The grid starts from the lower left corner of
+    the bounds and the tiles are numbered by row (tile = column + row * number of columns).
+
+    :param x: Array of the x coordinates of the points
+    :param y: Array of the y coordinates of the points
+    :param bounds: Bounds of the grid (minx, miny, maxx, maxy). Points outside the bounds are assigned to the nearest
+                   tile
+    :param tile_size: Size of the tiles in map units
+    :return: Array with the tile id of each point
+    """
+    n_columns = max(int(np.ceil((bounds[2] - bounds[0]) / tile_size)), 1)
+    n_rows = max(int(np.ceil((bounds[3] - bounds[1]) / tile_size)), 1)
+
+    columns = np.floor((np.asarray(x) - bounds[0]) / tile_size).astype(int)
+    rows = np.floor((np.asarray(y) - bounds[1]) / tile_size).astype(int)
+
+    return np.clip(columns, 0, n_columns - 1) + np.clip(rows, 0, n_rows - 1) * n_columns
+
+
+def weld_points(points: np.ndarray, tolerance: float = 1e-5) -> np.ndarray:
+    """
+    Find the clusters of points closer than the given tolerance. The clusters are the connected components of the
+    graph of the point pairs closer than the tolerance (found with a KD-tree), so chained points are welded together
+    even if the first and last points are farther than the tolerance.
+
+    :param points: Array of point coordinates with shape (n, 2) or (n, 3)
+    :param tolerance: Welding distance in map units. Default is 1e-5
+    :return: Array of length n with the index of the representative point of each point (i.e. the first point of the
+             cluster)
+    """
+    n_points = len(points)
+
+    pairs = cKDTree(points).query_pairs(tolerance, output_type='ndarray')
+
+    if len(pairs) == 0:
+        return np.arange(n_points)
+
+    graph = coo_matrix((np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])), shape=(n_points, n_points))
+    _, labels = connected_components(graph, directed=False)
+    _, representative = np.unique(labels, return_index=True)
+
+    return representative[labels]
+
+
+def weld_cells(coords: np.ndarray, cell_index: np.ndarray, n_cells: int, tolerance: float = 1e-5) -> tuple:
+    """
+    Weld the vertices of a group of cells (lines or vertices) and build the corresponding connectivity arrays.
+    Points closer than the tolerance are collapsed in the first one, repeated consecutive vertices of the same cell are
+    removed and the used points are numbered in order of first appearance.
+
+    :param coords: Array of the vertex coordinates of all the cells, ordered by cell
+    :param cell_index: Array with the cell index of each vertex
+    :param n_cells: Number of cells
+    :param tolerance: Welding distance in map units. Default is 1e-5
+    :return: Tuple of numpy arrays (vertex index of each output point, offsets, connectivity, mask of the non-empty
+             cells)
+    """
+    point_ids = weld_points(coords, tolerance)
+
+    # Remove repeated consecutive vertices of the same cell
+    repeated = np.zeros(len(point_ids), dtype=bool)
+    repeated[1:] = (point_ids[1:] == point_ids[:-1]) & (cell_index[1:] == cell_index[:-1])
+    point_ids = point_ids[~repeated]
+    cell_index = cell_index[~repeated]
+
+    n_cell_points = np.bincount(cell_index, minlength=n_cells)
+    valid_cells = n_cell_points > 0
+
+    # The representative of each cluster is its first vertex so sorting the used representatives gives the order of
+    # first appearance
+    vertex_index, connectivity = np.unique(point_ids, return_inverse=True)
+    connectivity = connectivity.ravel()
+
+    offsets = np.zeros(np.count_nonzero(valid_cells)+1, dtype=connectivity.dtype)
+    np.cumsum(n_cell_points[valid_cells], out=offsets[1:])
+
+    return vertex_index, offsets, connectivity, valid_cells
+
+
+def cells_to_polydata(points: np.ndarray, offsets: np.ndarray, connectivity: np.ndarray, cell_sizes: np.ndarray,
+                      valid_cells: np.ndarray) -> tuple:
+    """
+    Build a PolyData from welded cells (see weld_cells) as vtkCleanPolyData would: cells that had a single vertex
+    become vertices, the other cells become lines and lines collapsed to a single point are removed. Following the vtk
+    cell order the vertices come before the lines.
+
+    :param points: Array of point coordinates with shape (n, 3)
+    :param offsets: Offsets of the welded cells
+    :param connectivity: Connectivity of the welded cells
+    :param cell_sizes: Number of vertices of each cell before the welding
+    :param valid_cells: Mask of the cells that are present in offsets (i.e. the non-empty cells)
+    :return: Tuple of (PolyData, array of the input cell index of each output cell)
+    """
+    cell_index = np.where(valid_cells)[0]
+    welded_sizes = np.diff(offsets)
+
+    vertex_cells = cell_sizes[cell_index] == 1
+    line_cells = welded_sizes > 1
+    entry_cells = np.repeat(np.arange(len(cell_index)), welded_sizes)
+
+    vert_sizes = welded_sizes[vertex_cells]
+    line_sizes = welded_sizes[line_cells]
+    vert_offsets = np.zeros(len(vert_sizes)+1, dtype=offsets.dtype)
+    line_offsets = np.zeros(len(line_sizes)+1, dtype=offsets.dtype)
+    np.cumsum(vert_sizes, out=vert_offsets[1:])
+    np.cumsum(line_sizes, out=line_offsets[1:])
+
+    vtk_obj = pv.PolyData(points,
+                          verts=pv.CellArray.from_arrays(vert_offsets, connectivity[vertex_cells[entry_cells]]),
+                          lines=pv.CellArray.from_arrays(line_offsets, connectivity[line_cells[entry_cells]]))
+
+    cell_order = np.concatenate((cell_index[vertex_cells], cell_index[line_cells]))
+
+    return vtk_obj, cell_order
+
+
+@profiling.profiled('general_use.shp2vtk')
+def shp2vtk(df: GeoDataFrame, nodes=False, tolerance: float = 1e-5) -> pv.PolyData:
     """
     Quickly convert a GeoDataFrame to a PolyData
     :param df: input GeoDataFrame
     :param nodes: If the geodataframe are points then set True
+    :param tolerance: Points closer than this distance (in map units) are collapsed in a single point. Default is 1e-5
     :return: PolyData.
 
     Notes
     ------
-    All the columns of the geodataframe, except for the geomtry column, will be written as cell data
-    """
+    All the columns of the geodataframe, except for the geomtry column, will be written as cell data.
 
-    get_coord_df = df.geometry.get_coordinates(ignore_index=False, index_parts=True)
-    get_coord_df.reset_index(inplace=True)
-    get_coord_df.columns = ['parts', 'indexes', 'x', 'y']
-    get_coord_df['indexes'] = range(0, len(get_coord_df))
-    get_coord_df['parts'] += 1
-
-    get_coord_df['z'] = np.zeros(len(get_coord_df['x']))
-    get_coord_df['points'] = get_coord_df.loc[:, ['x', 'y', 'z']].values.tolist()
-    get_coord_df['points'] = get_coord_df['points'].map(tuple)
-    duplicate_mask_first = get_coord_df.duplicated(subset=['x', 'y', 'z'], keep='last')
-    first_repeats = get_coord_df[duplicate_mask_first]
-    # other_repeats = get_coord_df[duplicate_mask_other]
-
-    values = first_repeats['indexes'].values
-    keys = first_repeats['points'].values
+    Close vertices are welded (see weld_cells), points are converted to vertices and empty or collapsed geometries
+    are discarded together with their cell data (see cells_to_polydata).
+    """
 
-    unique_values_dict = dict(zip(keys, values))
+    profiling.add_items(len(df))
+    coords, geom_index = get_coordinates(df.geometry.values, return_index=True)
+    cell_sizes = np.bincount(geom_index, minlength=len(df))
 
-    # to change the indexes as the ones that are in the dict we get the values from the dict with apply(get) and fill the na with the index column.
-    get_coord_df['indexes'] = get_coord_df['points'].apply(func=lambda x: unique_values_dict.get(x)).fillna(
-        get_coord_df['indexes']).astype(int)
+    vertex_index, offsets, connectivity, valid_cells = weld_cells(coords, geom_index, len(df), tolerance)
 
-    mem = 0
-    conn = list()
-    for part, index in zip(get_coord_df['parts'], get_coord_df.index):
-        if part != mem:
-            nparts = len(get_coord_df[get_coord_df['parts'] == part])
-            conn.append(nparts)
-        conn.append(get_coord_df.loc[index, 'indexes'])
-        mem = part
+    points = np.zeros((len(vertex_index), 3))
+    points[:, :2] = coords[vertex_index]
 
-    points = np.array(get_coord_df.loc[:, ['x', 'y', 'z']].values.tolist())
     if nodes:
-        vtk_obj = pv.PolyData(points)
-    else:
-        vtk_obj = pv.PolyData(points, lines=conn)
+        cell_sizes = np.ones_like(cell_sizes)
+
+    vtk_obj, cell_order = cells_to_polydata(points, offsets, connectivity, cell_sizes, valid_cells)
 
     arrays = list(df.columns)
     arrays.remove('geometry')
     for array in arrays:
-        vtk_obj.cell_data[array] = df[array].values
-
-
-    # Use CleanPolyData to collapse double points in one
-
-    p = 100000  # Scaling factor needed for the vtk function to work properly
-    vtk_obj.points *= p
-    clean = vtkCleanPolyData()
-    clean.AddInputData(vtk_obj)
-    clean.ToleranceIsAbsoluteOn()
-    clean.ConvertLinesToPointsOff()
-    clean.ConvertPolysToLinesOff()
-    clean.ConvertStripsToPolysOff()
-    clean.Update()
-
-    output_obj = pv.PolyData(clean.GetOutput())
-    output_obj.points /= p  # Rescale back the points
+        vtk_obj.cell_data[array] = df[array].values[cell_order]
 
-    return output_obj
+    return vtk_obj
 
@@ -0,0 +1,212 @@
+"""
+Opt-in instrumentation of the stages of an analysis (noding, topology, vtk conversion, fitting...).
+
+The main functions of the library are wrapped in named stages. When profiling is disabled (default) a stage only
+calls the wrapped function. When it is enabled each stage records the wall time, the number of calls, the number of
+processed items (fractures, pairs, nodes...) and the peak resident memory of the process (not available on Windows):
+
+>>> from fracability.utils import profiling
+>>> with profiling.profile() as profiler:
+...     fracture_net.calculate_topology()
+>>> profiler.report()  # pandas DataFrame with one row per stage
+>>> profiler.to_json('profile.json')
+>>> profiler.to_chrome_trace('trace.json')  # open in chrome://tracing or https://ui.perfetto.dev
+
+The stages executed in worker processes (tiles, fit_many) are not recorded, only the stage that dispatches them.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from pandas import DataFrame
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_profiler = None
+
+
+def peak_rss() -> float:
+    """
+    Peak resident set size of the process in MB.
+
+    :return: The peak memory or None if not available on the platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024**2 if sys.platform == 'darwin' else peak/1024
+
+
+class Profiler:
+    """
+    Registry of the stages recorded while the profiler is active.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.events = []
+        self._open_stages = []
+        self._origin = time.perf_counter()
+
+    def _enter(self, name: str):
+        self._open_stages.append([name, time.perf_counter(), 0])
+
+    def _exit(self):
+        name, start, items = self._open_stages.pop()
+        end = time.perf_counter()
+        peak = peak_rss()
+
+        record = self.stages.setdefault(name, {'calls': 0, 'time': 0.0, 'items': 0, 'peak_rss': None})
+        record['calls'] += 1
+        record['time'] += end - start
+        record['items'] += items
+        if peak is not None:
+            record['peak_rss'] = peak if record['peak_rss'] is None else max(record['peak_rss'], peak)
+
+        self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                            'ts': (start - self._origin)*1e6, 'dur': (end - start)*1e6,
+                            'args': {'items': items, 'peak_rss': peak}})
+
+    def add_items(self, n_items: int):
+        """
+        Add processed items to the innermost open stage.
+
+        :param n_items: Number of items
+        """
+        if self._open_stages:
+            self._open_stages[-1][2] += int(n_items)
+
+    def report(self) -> DataFrame:
+        """
+        Summary of the recorded stages.
+
+        :return: DataFrame indexed by stage with the number of calls, the total and mean wall time in seconds, the
+                 number of processed items and the peak resident memory in MB, sorted by decreasing total time
+        """
+        report = DataFrame.from_dict(self.stages, orient='index', columns=['calls', 'time', 'items', 'peak_rss'])
+        report.index.name = 'stage'
+        report.insert(2, 'mean_time', report['time']/report['calls'])
+        return report.sort_values(by='time', ascending=False)
+
+    def to_json(self, path: str = None) -> str:
+        """
+        Export the recorded stages as JSON.
+
+        :param path: If given, the JSON is also written to this file
+        :return: JSON string of stage: {calls, time, items, peak_rss}
+        """
+        text = json.dumps(self.stages, indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_chrome_trace(self, path: str):
+        """
+        Write the recorded calls in the Chrome trace event format.
+
+        :param path: Path of the trace file
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+def enable() -> Profiler:
+    """
+    Start recording the stages with a new global profiler.
+
+    :return: The active Profiler
+    """
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable() -> Profiler:
+    """
+    Stop recording the stages.
+
+    :return: The profiler that was active (None if profiling was not enabled)
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def get_profiler() -> Profiler:
+    """
+    :return: The active Profiler (None if profiling is not enabled)
+    """
+    return _profiler
+
+
+@contextmanager
+def profile():
+    """
+    Context manager that records the stages executed in its block with a new profiler. The previous state of the
+    profiling is restored at the exit.
+    """
+    global _profiler
+    previous = _profiler
+    profiler = enable()
+    try:
+        yield profiler
+    finally:
+        _profiler = previous
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Context manager that records its block as a stage of the active profiler (if any).
+
+    :param name: Name of the stage
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    profiler._enter(name)
+    try:
+        yield
+    finally:
+        profiler._exit()
+
+
+def profiled(name: str):
+    """
+    Decorator that records each call of the function as a stage of the active profiler (if any).
+
+    :param name: Name of the stage
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return function(*args, **kwargs)
+            profiler._enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler._exit()
+        return wrapper
+    return decorator
+
+
+def add_items(n_items: int):
+    """
+    Add processed items to the innermost stage of the active profiler (nothing is done if profiling is disabled).
+
+    :param n_items: Number of items
+    """
+    if _profiler is not None:
+        _profiler.add_items(n_items)
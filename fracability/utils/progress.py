@@ -0,0 +1,120 @@
+"""
+Progress reporting of the long loops of the library (e.g. the noding of the intersections).
+
+The loops call report(task, done, total) and the call is forwarded to the active callback, any callable accepting the
+same arguments. The default callback is a ThrottledReporter writing a single updating line on the standard output at
+most a few times per second. Progress can be silenced for batch pipelines or sent to the logging module:
+
+>>> from fracability.utils import progress
+>>> progress.set_callback(None)  # silence all the progress output
+>>> progress.set_callback(progress.LoggingReporter())  # log the progress with the fracability logger
+>>> with progress.callback(my_function):  # temporarily use a custom callback
+...     fracture_net.calculate_topology()
+
+The reporters are plain picklable objects, so the same callback can be set in worker processes (with fork the active
+callback is inherited). The parallel functions of the library report the completed tasks from the main process.
+"""
+
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+
+class ThrottledReporter:
+    """
+    Write the progress on a single line of a stream, updating it at most max_rate times per second. The last update of
+    a task (done == total) is always written and ends the line.
+
+    :param max_rate: Maximum number of updates per second. Default is 4
+    :param stream: Stream to write to. If None (default) the current sys.stdout is used
+    """
+
+    def __init__(self, max_rate: float = 4, stream=None):
+        self.interval = 1/max_rate
+        self.stream = stream
+        self._last = 0.0
+
+    def __call__(self, task: str, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self._last < self.interval:
+            return
+        self._last = now
+
+        stream = sys.stdout if self.stream is None else self.stream
+        end = '\n' if done >= total else ''
+        stream.write(f'\r{task}: {done}/{total}{end}')
+        stream.flush()
+
+
+class LoggingReporter:
+    """
+    Log the progress with the logging module, at most max_rate times per second. The last update of a task
+    (done == total) is always logged.
+
+    :param logger_name: Name of the logger. Default is fracability
+    :param level: Logging level of the messages. Default is logging.INFO
+    :param max_rate: Maximum number of messages per second. Default is 1
+    """
+
+    def __init__(self, logger_name: str = 'fracability', level: int = logging.INFO, max_rate: float = 1):
+        self.logger_name = logger_name
+        self.level = level
+        self.interval = 1/max_rate
+        self._last = 0.0
+
+    def __call__(self, task: str, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self._last < self.interval:
+            return
+        self._last = now
+
+        logging.getLogger(self.logger_name).log(self.level, '%s: %d/%d', task, done, total)
+
+
+_callback = ThrottledReporter()
+
+
+def set_callback(function):
+    """
+    Set the callback receiving the progress of the library.
+
+    :param function: Callable accepting (task, done, total) or None to silence the progress
+    :return: The previous callback
+    """
+    global _callback
+    previous, _callback = _callback, function
+    return previous
+
+
+def get_callback():
+    """
+    :return: The active progress callback (None if the progress is silenced)
+    """
+    return _callback
+
+
+@contextmanager
+def callback(function):
+    """
+    Context manager that sets the progress callback in its block and then restores the previous one.
+
+    :param function: Callable accepting (task, done, total) or None to silence the progress
+    """
+    previous = set_callback(function)
+    try:
+        yield function
+    finally:
+        set_callback(previous)
+
+
+def report(task: str, done: int, total: int):
+    """
+    Report the progress of a task to the active callback (nothing is done if the progress is silenced).
+
+    :param task: Description of the task
+    :param done: Number of completed items
+    :param total: Total number of items
+    """
+    if _callback is not None:
+        _callback(task, done, total)
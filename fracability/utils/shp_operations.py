@@ -22,6 +22,8 @@ def int_node(line1, line2, idx_list, gdf):
     1. Only one segment extend the whole thing using the start and end vertex
     2. Two segments extend the two segments using the end of the first and the start of the second.
     3. Three or more segments extend the first and last segment using the end of the first and the start of the last.
+
+    A ValueError is raised if a duplicate point is found or if the two lines overlap in more than one point.
     """
     new_geom_dict = {}
     fac = 1.05
@@ -95,7 +97,6 @@ def int_node(line1, line2, idx_list, gdf):
 
                     break
     except IndexError:
-        print(f'Possible duplicate point found, fix geometry on gis:')
         obj1_idx = gdf.loc[idx_list[0], 'og_line_id']
         set1_idx = gdf.loc[idx_list[0], 'f_set']
         obj2_idx = gdf.loc[idx_list[1], 'og_line_id']
@@ -103,13 +104,13 @@ def int_node(line1, line2, idx_list, gdf):
 
         if set2_idx == -9999:
             group2_idx = gdf.loc[idx_list[1], 'b_group']
-            print(f'lines {obj1_idx} (set {set1_idx}), {obj2_idx} (boundary group {group2_idx})')
+            lines = f'lines {obj1_idx} (set {set1_idx}), {obj2_idx} (boundary group {group2_idx})'
         elif set1_idx == -9999:
             group1_idx = gdf.loc[idx_list[0], 'b_group']
-            print(f'lines {obj1_idx} (boundary group {group1_idx}), {obj2_idx} (set {set2_idx})')
+            lines = f'lines {obj1_idx} (boundary group {group1_idx}), {obj2_idx} (set {set2_idx})'
         else:
-            print(f'lines {obj1_idx} (set {set1_idx}), {obj2_idx} (set {set2_idx})')
-        exit()
+            lines = f'lines {obj1_idx} (set {set1_idx}), {obj2_idx} (set {set2_idx})'
+        raise ValueError(f'Possible duplicate point found, fix geometry on gis: {lines}')
     except ValueError:
         obj1_idx = gdf.loc[idx_list[0], 'og_line_id']
         set1_idx = gdf.loc[idx_list[0], 'f_set']
@@ -133,8 +134,8 @@ def int_node(line1, line2, idx_list, gdf):
             print('Single point overlap. Geometry is correct, continuing. Shp files could contain invalid geometries.')
             pass
         else:
-            print('Multiple point overlap. Check and fix geometries on GIS, stopping.')
-            exit()
+            raise ValueError(f'Multiple point overlap of lines {obj1_idx} and {obj2_idx}. Check and fix geometries '
+                             f'on GIS')
 
         # print(gdf.loc[idx_list[0]-5:idx_list[1]+5])
     return new_geom_dict